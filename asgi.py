@@ -0,0 +1,341 @@
+"""
+ASGI entry point for the Twilio webhooks, running turns on one event loop
+instead of a thread per caller:
+
+    uvicorn asgi:app --port 5001
+
+It serves POST /handle_input, /partial_input and /sms with the async client
+layer (conversation_logic, tts and clients *_async). The pages and every other
+route stay on the Flask app in index.py; point the proxy (or the Twilio
+webhook URLs) at this server for the paths above. Both read and write the same
+state backend and user histories.
+"""
+from dotenv import load_dotenv
+
+# Before the project imports, which read their settings when imported
+load_dotenv()
+
+import asyncio
+import logging
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from twilio.twiml.messaging_response import MessagingResponse
+from twilio.twiml.voice_response import VoiceResponse
+
+from clients import close_loop_clients, get_async_twilio_client
+from conversation_logic import (
+    interpret_response_async,
+    rephrase_question_async,
+    update_user_history_async,
+)
+from idempotency import run_once_async, webhook_key
+from index import (
+    finish_voice_turn,
+    language_mappings,
+    speech_gather,
+    tree_key,
+    twilio_phone_number,
+)
+from openai_limiter import PRIORITY_VOICE, openai_priority
+from sms_buffer import buffer_message_async
+from speculation import speculate, take_speculation
+from state_backend import get_state_backend
+from tree import decisionTree
+from tts import text_to_speech_async
+from user_history import close_current_call, load_user_history, save_user_history
+
+logger = logging.getLogger(__name__)
+
+TWIML = {"Content-Type": "text/xml"}
+
+
+async def voice_turn_async(call_sid, to_number, user_input, language, user_history):
+    """Async counterpart of index.voice_turn()."""
+    state = get_state_backend()
+    predictionState = await asyncio.to_thread(
+        state.get_value, tree_key(call_sid), "root"
+    )
+    current_node = decisionTree[predictionState]
+    current_question = current_node["question"]
+    action = "continue"
+
+    speculation = await asyncio.to_thread(
+        take_speculation, call_sid, user_input, predictionState
+    )
+    if speculation:
+        interpreted_response, speculated_history = speculation
+        user_history.clear()
+        user_history.update(speculated_history)
+    else:
+        interpreted_response = await interpret_response_async(
+            user_input, current_node, predictionState
+        )
+        await update_user_history_async(current_question, user_input, user_history)
+
+    if interpreted_response == "invalid":
+        ai_response = await rephrase_question_async(
+            current_question, user_input, True, user_history
+        )
+    else:
+        if interpreted_response in current_node:
+            predictionState = current_node[interpreted_response]
+            await asyncio.to_thread(state.set_value, tree_key(call_sid), predictionState)
+        else:
+            ai_response = f"{language_mappings[language]['couldnt_understand']} {current_question}"
+
+        if predictionState not in decisionTree:
+            ai_response = language_mappings[language]["consult_professional"].format(
+                predictionState
+            )
+            action = "diagnosis"
+        else:
+            next_question = decisionTree[predictionState]["question"]
+            ai_response = await rephrase_question_async(
+                next_question, user_input, False, user_history
+            )
+
+    return await asyncio.to_thread(
+        finish_voice_turn,
+        call_sid,
+        to_number,
+        language,
+        user_history,
+        ai_response,
+        action,
+        predictionState,
+    )
+
+
+async def input_turn(form, language, turn):
+    """
+    Async counterpart of index.handle_input_turn(). Calls that end are hung
+    up with a spoken goodbye rather than redirected to the record page.
+    """
+    state = get_state_backend()
+    user_input = form.get("SpeechResult")
+    call_sid = form.get("CallSid")
+    to_number = form.get("To")
+    twiml = VoiceResponse()
+
+    if not user_input:
+        logger.warning("No speech input received")
+    else:
+        user_history = await asyncio.to_thread(load_user_history, to_number)
+        await asyncio.to_thread(
+            state.append_message, call_sid, {"speaker": "user", "text": user_input}
+        )
+
+        try:
+            ai_response, action = await voice_turn_async(
+                call_sid, to_number, user_input, language, user_history
+            )
+            logger.info(f"AI response: {ai_response}")
+
+            if action == "stop":
+                twiml.say(ai_response)
+                twiml.hangup()
+                return 200, TWIML, str(twiml)
+
+            s3_url = await text_to_speech_async(ai_response, language)
+            if language != "en":
+                twiml.pause(length=7)
+            if s3_url:
+                twiml.play(s3_url)
+            else:
+                twiml.say(ai_response)
+
+            if action == "diagnosis":
+                twiml.hangup()
+                return 200, TWIML, str(twiml)
+        except Exception as e:
+            logger.error(f"Error processing input: {str(e)}")
+            twiml.say(language_mappings[language]["error_processing"])
+            twiml.hangup()
+            close_current_call(user_history)
+            await asyncio.to_thread(save_user_history, to_number, user_history)
+            return 200, TWIML, str(twiml)
+
+        await asyncio.to_thread(
+            state.append_message, call_sid, {"speaker": "ai", "text": ai_response}
+        )
+
+    twiml.append(speech_gather(language, turn + 1))
+    if call_sid:
+        try:
+            await get_async_twilio_client().calls(call_sid).update_async(
+                twiml=str(twiml)
+            )
+        except Exception as e:
+            logger.error(f"Error updating call {call_sid}: {str(e)}")
+    return 200, TWIML, str(twiml)
+
+
+async def handle_input(form, query, headers):
+    language = query.get("language", ["en"])[0]
+    turn = query.get("turn", ["0"])[0]
+    turn = int(turn) if turn.isdigit() else 0
+    key = webhook_key(
+        SimpleNamespace(
+            form=form,
+            args={"turn": str(turn)},
+            headers={
+                "I-Twilio-Idempotency-Token": headers.get("i-twilio-idempotency-token")
+            },
+        )
+    )
+    with openai_priority(PRIORITY_VOICE):
+        return await run_once_async(key, lambda: input_turn(form, language, turn))
+
+
+async def partial_input(form, query, headers):
+    call_sid = form.get("CallSid")
+    stable_text = form.get("StableSpeechResult", "")
+    if call_sid and stable_text:
+        node_name = await asyncio.to_thread(
+            get_state_backend().get_value, tree_key(call_sid), "root"
+        )
+        if node_name in decisionTree:
+            speculate(
+                call_sid, form.get("To"), stable_text, node_name, decisionTree[node_name]
+            )
+    return 204, {}, ""
+
+
+async def sms_turn(from_number, incoming_msg, language):
+    """Async counterpart of index.run_sms_turn(); returns the commit coroutine function."""
+    state = get_state_backend()
+    next_state = None
+    finished = False
+
+    try:
+        user_history = await asyncio.to_thread(load_user_history, from_number)
+        predictionState = await asyncio.to_thread(
+            state.get_value, tree_key(from_number), "root"
+        )
+        next_state = predictionState
+        current_node = decisionTree[predictionState]
+        current_question = current_node["question"]
+        interpreted_response = await interpret_response_async(
+            incoming_msg, current_node, predictionState
+        )
+        await update_user_history_async(current_question, incoming_msg, user_history)
+
+        if interpreted_response == "invalid":
+            ai_response = await rephrase_question_async(
+                current_question, incoming_msg, True, user_history
+            )
+        else:
+            if interpreted_response in current_node:
+                next_state = current_node[interpreted_response]
+            else:
+                ai_response = f"{language_mappings[language]['couldnt_understand']} {current_question}"
+
+            if next_state not in decisionTree:
+                ai_response = language_mappings[language][
+                    "consult_professional"
+                ].format(next_state)
+                finished = True
+            else:
+                next_question = decisionTree[next_state]["question"]
+                ai_response = await rephrase_question_async(
+                    next_question, incoming_msg, False, user_history
+                )
+    except Exception as e:
+        logger.error(f"Error processing SMS: {str(e)}")
+        ai_response = language_mappings[language]["error_occurred"]
+        user_history = None
+
+    async def commit():
+        try:
+            if user_history is not None:
+                await asyncio.to_thread(state.set_value, tree_key(from_number), next_state)
+                if finished:
+                    close_current_call(
+                        user_history, {"channel": "sms", "leaf": next_state}
+                    )
+                await asyncio.to_thread(save_user_history, from_number, user_history)
+
+            await get_async_twilio_client().messages.create_async(
+                body=ai_response, from_=twilio_phone_number(), to=from_number
+            )
+        except Exception as e:
+            logger.error(f"Error sending SMS reply: {str(e)}")
+
+    return commit
+
+
+async def handle_sms(form, query, headers):
+    # The Flask session (and its language choice) is not available here
+    from_number = form.get("From", "")
+    buffer_message_async(
+        from_number,
+        form.get("Body", "").lower(),
+        lambda merged_msg: sms_turn(from_number, merged_msg, "en"),
+    )
+    return 200, TWIML, str(MessagingResponse())
+
+
+routes = {
+    ("POST", "/handle_input"): handle_input,
+    ("POST", "/partial_input"): partial_input,
+    ("POST", "/sms"): handle_sms,
+}
+
+
+async def read_form(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return {
+        name: values[0]
+        for name, values in parse_qs(body.decode("utf-8"), keep_blank_values=True).items()
+    }
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_loop_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    route = routes.get((scope["method"], scope["path"]))
+    if route is None:
+        status, headers, body = 404, {"Content-Type": "text/plain"}, "Not found"
+    else:
+        form = await read_form(receive)
+        query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+        request_headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        try:
+            status, headers, body = await route(form, query, request_headers)
+        except Exception as e:
+            logger.error(f"Error in {scope['path']}: {str(e)}", exc_info=True)
+            status, headers, body = 500, {"Content-Type": "text/plain"}, "Internal error"
+
+    body = body.encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers.items()
+            ]
+            + [(b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,158 @@
+"""
+Fingerprinted, precompressed static assets.
+
+    python assets.py build
+
+copies each file in ASSET_FILES to static/dist/ under a name carrying a hash
+of its content (styles.css -> styles.3f2a1b4c.css), writes .gz (and .br when
+the optional brotli package is installed) next to it when that saves space,
+and records the names in static/dist/manifest.json. Run it as part of every
+deploy; static/dist is not checked in. Files from earlier builds are kept, so
+pages rendered before a deploy still load their assets.
+
+Templates link assets with asset_url("styles.css"). Once built, that is
+/assets/<fingerprinted name>, served by index.py with the best encoding the
+browser accepts and a one-year immutable cache lifetime, since any change to
+a file changes its URL. Before a build (e.g. in development) asset_url falls
+back to the plain /static URL.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+
+from flask import url_for
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+BUILD_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_FILE = "manifest.json"
+
+# Paths relative to static/; user data under static/ is never fingerprinted
+ASSET_FILES = ("script.js", "styles.css", "images/jhu_med.webp")
+
+# Cache lifetime for fingerprinted assets
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# A compressed copy is only kept if it is at most this fraction of the original
+# (already-compressed formats like webp gain nothing)
+MIN_COMPRESSION_RATIO = 0.9
+
+# Preferred first when the browser accepts several
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {"mtime": None, "assets": {}}
+
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        # mtime=0 keeps builds of the same file byte-identical
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def write_atomic(path, data):
+    """
+    Writes through a temp file in the same directory and renames it into
+    place, so workers serving the build never read a partly written file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def build(static_dir=STATIC_DIR, build_dir=BUILD_DIR):
+    """Builds every asset into build_dir; returns the manifest."""
+    os.makedirs(build_dir, exist_ok=True)
+
+    manifest = {}
+    for filename in ASSET_FILES:
+        with open(os.path.join(static_dir, filename), "rb") as f:
+            data = f.read()
+        stem, extension = os.path.splitext(os.path.basename(filename))
+        name = f"{stem}.{hashlib.sha256(data).hexdigest()[:8]}{extension}"
+        write_atomic(os.path.join(build_dir, name), data)
+
+        entry = {"name": name, "size": len(data), "encodings": {}}
+        for encoding, suffix in ENCODINGS:
+            compressed = compress(data, encoding)
+            if compressed is None or len(compressed) > len(data) * MIN_COMPRESSION_RATIO:
+                continue
+            write_atomic(os.path.join(build_dir, name + suffix), compressed)
+            entry["encodings"][encoding] = len(compressed)
+        manifest[filename] = entry
+
+    # Written last, so the manifest only ever names files that are complete
+    write_atomic(
+        os.path.join(build_dir, MANIFEST_FILE), json.dumps(manifest, indent=2).encode("utf-8")
+    )
+    return manifest
+
+
+def load_manifest():
+    """Returns the built manifest, re-read whenever a build replaces it."""
+    path = os.path.join(BUILD_DIR, MANIFEST_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime != _manifest["mtime"]:
+        assets = {}
+        if mtime is not None:
+            with open(path) as f:
+                assets = json.load(f)
+        _manifest.update(mtime=mtime, assets=assets)
+    return _manifest
+
+
+def asset_url(filename):
+    """Template helper: the fingerprinted URL of a static asset, once built."""
+    entry = load_manifest()["assets"].get(filename)
+    if entry is None:
+        return url_for("static", filename=filename)
+    return url_for("main.serve_asset", name=entry["name"])
+
+
+def find_asset(name, accepted_encodings):
+    """
+    Returns (path, content type, content encoding or None) for a built asset,
+    from this build or an earlier one, in the best encoding among
+    accepted_encodings; None if there is no such asset.
+    """
+    if (
+        name != os.path.basename(name)
+        or name.startswith(".")
+        or name == MANIFEST_FILE
+        or name.endswith(tuple(suffix for _, suffix in ENCODINGS))
+    ):
+        return None
+    path = os.path.join(BUILD_DIR, name)
+    if not os.path.isfile(path):
+        return None
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted_encodings and os.path.isfile(path + suffix):
+            return path + suffix, content_type, encoding
+    return path, content_type, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["build"])
+    parser.parse_args()
+
+    for filename, entry in build().items():
+        sizes = ", ".join(f"{encoding} {size}" for encoding, size in entry["encodings"].items())
+        print(f"{filename} -> dist/{entry['name']} ({entry['size']} bytes{'; ' + sizes if sizes else ''})")
@@ -0,0 +1,130 @@
+import io
+import os
+import struct
+
+# Output formats requested from ElevenLabs. Phone calls are played at 8 kHz
+# mono mu-law, so anything richer is downloaded by Twilio only to be thrown
+# away in its transcode; higher quality is kept for web playback.
+AUDIO_FORMATS = {
+    # 8 kHz mu-law wrapped in a WAV header: what the phone line plays, no transcode
+    "telephony_wav": {
+        "output_format": "ulaw_8000",
+        "content_type": "audio/wav",
+        "extension": "wav",
+        "wrap_ulaw": True,
+    },
+    # Low-bitrate mono MP3, for when a compressed clip is preferred
+    "telephony_mp3": {
+        "output_format": "mp3_22050_32",
+        "content_type": "audio/mpeg",
+        "extension": "mp3",
+        "wrap_ulaw": False,
+    },
+    # Raw 8 kHz mu-law, for frames pushed straight down a Twilio Media Stream
+    "telephony_ulaw": {
+        "output_format": "ulaw_8000",
+        "content_type": "audio/basic",
+        "extension": "ulaw",
+        "wrap_ulaw": False,
+    },
+    "web": {
+        "output_format": "mp3_44100_128",
+        "content_type": "audio/mpeg",
+        "extension": "mp3",
+        "wrap_ulaw": False,
+    },
+}
+
+# Format used for prompts played on voice calls
+TELEPHONY_AUDIO_FORMAT = os.getenv("TELEPHONY_AUDIO_FORMAT", "telephony_wav")
+
+ULAW_SAMPLE_RATE = 8000
+
+
+def ulaw_to_wav(ulaw_data, sample_rate=ULAW_SAMPLE_RATE):
+    """
+    Wraps raw mono mu-law samples in a WAV (WAVE_FORMAT_MULAW) container.
+    """
+    fmt_chunk = struct.pack(
+        "<4sIHHIIHHH",
+        b"fmt ",
+        18,
+        7,  # WAVE_FORMAT_MULAW
+        1,  # mono
+        sample_rate,
+        sample_rate,  # byte rate: one byte per sample
+        1,  # block align
+        8,  # bits per sample
+        0,  # no extra format bytes
+    )
+    fact_chunk = struct.pack("<4sII", b"fact", 4, len(ulaw_data))
+    data_chunk = struct.pack("<4sI", b"data", len(ulaw_data)) + ulaw_data
+    if len(ulaw_data) % 2:
+        data_chunk += b"\x00"  # chunks are word aligned
+    body = b"WAVE" + fmt_chunk + fact_chunk + data_chunk
+    return struct.pack("<4sI", b"RIFF", len(body)) + body
+
+
+def ulaw_decode_sample(byte):
+    byte = ~byte & 0xFF
+    sign = byte & 0x80
+    exponent = (byte >> 4) & 0x07
+    mantissa = byte & 0x0F
+    sample = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return -sample if sign else sample
+
+
+def ulaw_encode_sample(sample):
+    sign = 0x80 if sample < 0 else 0
+    sample = min(abs(sample), 32635) + 0x84
+    exponent = 7
+    while exponent > 0 and not sample & (0x4000 >> (7 - exponent)):
+        exponent -= 1
+    mantissa = (sample >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+
+ULAW_DECODE_TABLE = [ulaw_decode_sample(byte) for byte in range(256)]
+
+
+def ulaw_to_pcm16(ulaw_data):
+    """Decodes mu-law bytes to little-endian 16-bit PCM."""
+    return struct.pack(f"<{len(ulaw_data)}h", *(ULAW_DECODE_TABLE[b] for b in ulaw_data))
+
+
+def pcm16_to_ulaw(pcm_data):
+    """Encodes little-endian 16-bit PCM to mu-law bytes."""
+    samples = struct.unpack(f"<{len(pcm_data) // 2}h", pcm_data)
+    return bytes(ulaw_encode_sample(sample) for sample in samples)
+
+
+def pcm16_to_wav(pcm_data, sample_rate=ULAW_SAMPLE_RATE):
+    import wave
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm_data)
+    return buffer.getvalue()
+
+
+def audio_stats(audio_data, audio_format):
+    """
+    Returns size, duration and effective bitrate of a synthesized clip,
+    using mutagen to read the duration from the encoded file.
+    """
+    import mutagen
+
+    stats = {"format": audio_format, "bytes": len(audio_data), "duration": None}
+    try:
+        audio = mutagen.File(io.BytesIO(audio_data))
+        if audio is not None and audio.info.length:
+            stats["duration"] = audio.info.length
+    except Exception:
+        pass
+
+    if stats["duration"]:
+        stats["kbps"] = len(audio_data) * 8 / stats["duration"] / 1000
+    return stats
@@ -0,0 +1,124 @@
+"""
+Local content-addressed store for synthesized prompts, the alternative to S3
+for single-site deployments (AUDIO_STORE=local). Clips are written under
+AUDIO_STORE_DIR as <sha256 prefix>.<extension> and served by the /audio/<name>
+route in index.py, so a turn gets its URL without the put_object and presign
+round trips, and identical prompts (the welcome, repeated questions) are
+stored once.
+
+Names never change content, so clips are served as immutable for a year.
+Disk use is capped at AUDIO_STORE_MAX_BYTES by evicting the least recently
+used clips; a clip's mtime is its last use and is bumped on every store and
+fetch.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+from audio_formats import AUDIO_FORMATS
+
+AUDIO_STORE_DIR = os.getenv("AUDIO_STORE_DIR", "data/audio")
+AUDIO_STORE_MAX_BYTES = int(os.getenv("AUDIO_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Eviction trims the store to this fraction of the cap, so it runs rarely
+AUDIO_STORE_LOW_WATER = 0.9
+
+# Other workers write to the same directory; re-measure it at least this often
+AUDIO_STORE_SCAN_SECONDS = 60
+
+# Cache lifetime for served clips
+AUDIO_MAX_AGE = 365 * 24 * 3600
+
+CONTENT_TYPES = {info["extension"]: info["content_type"] for info in AUDIO_FORMATS.values()}
+NAME_PATTERN = re.compile(r"^([0-9a-f]{32})\.(" + "|".join(CONTENT_TYPES) + r")$")
+
+_usage = {"bytes": None, "scanned_at": 0}
+_usage_lock = threading.Lock()
+
+
+def local_store_enabled():
+    return os.getenv("AUDIO_STORE", "s3") == "local"
+
+
+def audio_base_url():
+    return os.getenv("AUDIO_BASE_URL") or os.getenv("NGROK_URL") or ""
+
+
+def store_audio(binary_audio_data, extension):
+    """Writes a clip to the store if it is not there yet; returns its name."""
+    name = f"{hashlib.sha256(binary_audio_data).hexdigest()[:32]}.{extension}"
+    path = os.path.join(AUDIO_STORE_DIR, name)
+    try:
+        os.utime(path)
+        return name
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(AUDIO_STORE_DIR, exist_ok=True)
+    # Written aside and renamed so a concurrent fetch never sees half a clip
+    fd, temp_path = tempfile.mkstemp(dir=AUDIO_STORE_DIR, prefix=".partial-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(binary_audio_data)
+    os.replace(temp_path, path)
+    record_usage(len(binary_audio_data))
+    return name
+
+
+def audio_url(name):
+    return f"{audio_base_url().rstrip('/')}/audio/{name}"
+
+
+def audio_path(name):
+    """Returns (path, etag, content type) for a stored clip, or None."""
+    match = NAME_PATTERN.match(name)
+    if not match:
+        return None
+    path = os.path.join(AUDIO_STORE_DIR, name)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path, match.group(1), CONTENT_TYPES[match.group(2)]
+
+
+def record_usage(added_bytes):
+    with _usage_lock:
+        now = time.monotonic()
+        if _usage["bytes"] is None or now - _usage["scanned_at"] > AUDIO_STORE_SCAN_SECONDS:
+            _usage["bytes"] = sum(size for _, size, _ in scan_store())
+            _usage["scanned_at"] = now
+        else:
+            _usage["bytes"] += added_bytes
+        if _usage["bytes"] > AUDIO_STORE_MAX_BYTES:
+            _usage["bytes"] = evict(int(AUDIO_STORE_MAX_BYTES * AUDIO_STORE_LOW_WATER))
+            _usage["scanned_at"] = now
+
+
+def scan_store():
+    """Yields (mtime, size, path) for every clip in the store."""
+    with os.scandir(AUDIO_STORE_DIR) as entries:
+        for entry in entries:
+            if NAME_PATTERN.match(entry.name):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+
+def evict(target_bytes):
+    """Deletes the least recently used clips until at most target_bytes remain."""
+    clips = sorted(scan_store())
+    total = sum(size for _, size, _ in clips)
+    for _, size, path in clips:
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return total
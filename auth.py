@@ -0,0 +1,20 @@
+"""
+Access to the operator-only routes (campaigns, profiling, metrics): callers
+send "Authorization: Bearer <ADMIN_TOKEN>". Without ADMIN_TOKEN set, every
+such request is refused.
+"""
+import hmac
+import os
+
+
+def admin_token():
+    # Read on use, like the Twilio settings in index.py
+    return os.getenv("ADMIN_TOKEN")
+
+
+def is_admin(headers):
+    """Whether the request carries "Authorization: Bearer <ADMIN_TOKEN>"."""
+    token = admin_token()
+    if not token:
+        return False
+    return hmac.compare_digest(headers.get("Authorization", ""), f"Bearer {token}")
@@ -0,0 +1,169 @@
+"""
+Non-interactive counterpart of conversation_logic.terminal(): runs scripted
+patient conversations through the decision tree and its LLM prompts on a
+worker pool, and streams one JSON outcome per conversation as it finishes.
+
+Input is JSONL with one conversation per line:
+
+    {"id": "case-1", "answers": ["I have a fever", "yes", "yes", "yes"],
+     "expected": "influenza", "history": {"age": "34", "gender": "female"}}
+
+    python batch_triage.py cases.jsonl [-o outcomes.jsonl] [--workers 16] [--no-rephrase]
+
+Each conversation has its own tree position and in-memory history; nothing
+is read from or written to static/user_data. Requests share the OpenAI rate
+limiter at background priority (see openai_limiter.py).
+"""
+from dotenv import load_dotenv
+
+# Before the project imports, which read their settings when imported
+load_dotenv()
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import intent_classifier
+from conversation_logic import track_usage, triage_turn
+from tree import decisionTree
+
+
+def blank_history(case):
+    user_history = {
+        "entries": [],
+        "fname": "",
+        "lname": "",
+        "age": "N/A",
+        "gender": "N/A",
+        "height": "N/A",
+        "weight": "N/A",
+        "current_call": [],
+        "phone_number": case.get("id", ""),
+    }
+    user_history.update(case.get("history", {}))
+    return user_history
+
+
+def run_case(case, rephrase=True):
+    usage = track_usage()
+    user_history = blank_history(case)
+    state = "root"
+    path = [state]
+    turns = 0
+    error = None
+    started = time.perf_counter()
+
+    try:
+        for answer in case["answers"]:
+            turns += 1
+            state, _, _ = triage_turn(state, answer, user_history, rephrase)
+            if state != path[-1]:
+                path.append(state)
+            if state not in decisionTree:
+                break
+    except Exception as e:
+        error = str(e)
+
+    leaf = state if state not in decisionTree else None
+    outcome = {
+        "id": case.get("id"),
+        "status": "error" if error else "diagnosed" if leaf else "incomplete",
+        "leaf": leaf,
+        "path": path,
+        "turns": turns,
+        "latency_seconds": round(time.perf_counter() - started, 3),
+        "llm_calls": usage["calls"],
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "total_tokens": usage["total_tokens"],
+    }
+    if "expected" in case:
+        outcome["expected"] = case["expected"]
+        outcome["match"] = leaf == case["expected"]
+    if error:
+        outcome["error"] = error
+    return outcome
+
+
+def read_cases(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def run_batch(cases, output, workers, rephrase=True):
+    """
+    Runs `cases` with at most a few per worker in flight and writes each
+    outcome to `output` as soon as it is done. Returns summary totals.
+    """
+    totals = {
+        "conversations": 0,
+        "diagnosed": 0,
+        "expected": 0,
+        "matched": 0,
+        "llm_calls": 0,
+        "total_tokens": 0,
+    }
+    started = time.perf_counter()
+
+    def write(outcome):
+        output.write(json.dumps(outcome) + "\n")
+        output.flush()
+        totals["conversations"] += 1
+        totals["diagnosed"] += outcome["status"] == "diagnosed"
+        totals["llm_calls"] += outcome["llm_calls"]
+        totals["total_tokens"] += outcome["total_tokens"]
+        if "expected" in outcome:
+            totals["expected"] += 1
+            totals["matched"] += outcome["match"]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for case in cases:
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(pool.submit(run_case, case, rephrase))
+        for future in wait(pending).done:
+            write(future.result())
+
+    totals["seconds"] = time.perf_counter() - started
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cases", help="JSONL file of scripted conversations, or - for stdin")
+    parser.add_argument("-o", "--output", help="outcome JSONL file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument(
+        "--no-rephrase",
+        action="store_true",
+        help="skip rephrasing prompts, which do not change the path taken",
+    )
+    parser.add_argument(
+        "--log-intents",
+        action="store_true",
+        help="add the LLM's interpretations to the intent classifier's training log",
+    )
+    args = parser.parse_args()
+
+    intent_classifier.INTENT_LOGGING = args.log_intents
+
+    cases_file = sys.stdin if args.cases == "-" else open(args.cases)
+    output = open(args.output, "w") if args.output else sys.stdout
+    with cases_file, output:
+        totals = run_batch(read_cases(cases_file), output, args.workers, not args.no_rephrase)
+
+    summary = (
+        f"{totals['conversations']} conversations in {totals['seconds']:.1f}s "
+        f"({totals['conversations'] / max(totals['seconds'], 1e-9):.1f}/s), "
+        f"{totals['diagnosed']} diagnosed, {totals['llm_calls']} LLM calls, "
+        f"{totals['total_tokens']} tokens"
+    )
+    if totals["expected"]:
+        summary += f", {totals['matched']}/{totals['expected']} matched the expected leaf"
+    print(summary, file=sys.stderr)
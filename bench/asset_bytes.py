@@ -0,0 +1,117 @@
+"""
+Bytes and requests per page view for the static assets each page links,
+with the plain /static handler (no build) and with `python assets.py build`.
+
+Each page template is rendered, its stylesheet, script and image URLs are
+fetched through the Flask test client with "Accept-Encoding: gzip, deflate,
+br", and a small browser cache model replays a first and a repeat view:
+responses with a fresh max-age are reused without a request; others are
+revalidated with If-None-Match / If-Modified-Since. Bytes are response
+bodies plus status line and headers; the HTML document itself is the same in
+both runs and not counted.
+
+    python bench/asset_bytes.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Template -> context for the pages a patient or operator opens
+PAGES = {
+    "index.html": {},
+    "login.html": {},
+    "call-progress.html": {"call_sid": "CA0", "to_number": "+15550000000"},
+    "text-conversation.html": {"message_sid": "SM0", "to_number": "+15550000000"},
+    "medical-record.html": {
+        "record": {},
+        "entries": [],
+        "processing": [],
+        "next_cursor": None,
+        "phone_number": "15550000000",
+    },
+}
+
+ASSET_URL = re.compile(r'(?:href|src|srcset)="(/(?:static|assets)/[^"]+)"')
+
+# Browsers that take a <picture>'s webp source never load its <img> fallback
+PICTURE_FALLBACK = re.compile(r"(<picture>.*?)<img[^>]*>(.*?</picture>)", re.S)
+
+
+def response_bytes(response):
+    head = f"HTTP/1.1 {response.status}\r\n" + "".join(
+        f"{name}: {value}\r\n" for name, value in response.headers.items()
+    )
+    return len(head) + 2 + len(response.get_data())
+
+
+class BrowserCache:
+    def __init__(self, client):
+        self.client = client
+        self.entries = {}
+
+    def fetch(self, url):
+        """Returns (requests made, bytes received) for loading url."""
+        cached = self.entries.get(url)
+        if cached and cached["max_age"] > 0:
+            return 0, 0
+        headers = {"Accept-Encoding": "gzip, deflate, br"}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+        response = self.client.get(url, headers=headers)
+        if response.status_code not in (200, 304):
+            raise SystemExit(f"{url}: HTTP {response.status_code}")
+        if response.status_code == 200:
+            self.entries[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "max_age": response.cache_control.max_age or 0,
+            }
+        return 1, response_bytes(response)
+
+
+def measure(app):
+    from flask import render_template
+
+    rows = {}
+    for template, context in PAGES.items():
+        with app.test_request_context("/"):
+            html = render_template(template, **context)
+        urls = ASSET_URL.findall(PICTURE_FALLBACK.sub(r"\1\2", html))
+        cache = BrowserCache(app.test_client())
+        views = []
+        for _ in range(2):
+            fetched = [cache.fetch(url) for url in urls]
+            views.append((sum(r for r, _ in fetched), sum(b for _, b in fetched)))
+        rows[template] = views
+    return rows
+
+
+if __name__ == "__main__":
+    import assets
+    from index import create_app
+
+    app = create_app()
+    assets.BUILD_DIR = tempfile.mkdtemp(prefix="assets-")
+    before = measure(app)
+    manifest = assets.build(build_dir=assets.BUILD_DIR)
+    after = measure(app)
+
+    for filename, entry in manifest.items():
+        sizes = ", ".join(f"{encoding} {size}" for encoding, size in entry["encodings"].items())
+        print(f"{filename}: {entry['size']} bytes{'; ' + sizes if sizes else ''}")
+    print()
+    print(f"{'page':<24} {'first view':>27} {'repeat view':>25}")
+    print(f"{'':<24} {'before':>13} {'after':>13} {'before':>12} {'after':>12}")
+    for template in PAGES:
+        (b1, b2), (a1, a2) = before[template], after[template]
+        print(
+            f"{template:<24} "
+            f"{b1[1]:>7}B/{b1[0]}req {a1[1]:>7}B/{a1[0]}req "
+            f"{b2[1]:>6}B/{b2[0]}req {a2[1]:>6}B/{a2[0]}req"
+        )
@@ -0,0 +1,268 @@
+"""
+Threads vs one event loop for many concurrent callers. Each caller runs one
+scripted triage conversation from recordings/triage_cases.jsonl, and every
+turn makes the decision tree's LLM calls and synthesizes its reply, the
+outbound I/O of a Gather turn except the S3 upload.
+
+- threads: the sync functions on a pool with one thread per caller, the way
+  the threaded Flask server holds one per in-flight webhook
+- async: the *_async functions as tasks on one event loop
+- asgi: each turn posted to asgi.app's /handle_input in process, with
+  TWILIO_STANDIN=1 and no AWS credentials, so replies fall back to <Say>
+
+Every mode runs in its own process against the OpenAI/ElevenLabs stub
+(also its own process), so threads and peak RSS are the mode's alone.
+
+    python bench/async_turns.py [--callers 200] [--latency 0.5] [--modes threads async asgi]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+CASES = os.path.join(BENCH, "recordings", "triage_cases.jsonl")
+
+
+def read_rss_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+class Sampler:
+    """Samples the thread count while a mode runs; peak RSS comes from VmHWM."""
+
+    def __init__(self):
+        self.peak_threads = threading.active_count()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while self.running:
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            time.sleep(0.02)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        # The sampler itself is not part of the mode
+        self.peak_threads -= 1
+
+
+def caller_cases(count):
+    with open(CASES) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    return list(itertools.islice(itertools.cycle(cases), count))
+
+
+def run_threads(cases):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from batch_triage import blank_history
+    from conversation_logic import triage_turn
+    from tree import decisionTree
+    from tts import synthesize_speech
+
+    def converse(case):
+        user_history = blank_history(case)
+        state = "root"
+        turns = 0
+        for answer in case["answers"]:
+            state, response, _ = triage_turn(state, answer, user_history)
+            synthesize_speech(response)
+            turns += 1
+            if state not in decisionTree:
+                break
+        return turns
+
+    with ThreadPoolExecutor(max_workers=len(cases)) as pool:
+        return sum(pool.map(converse, cases))
+
+
+async def run_async(cases):
+    from batch_triage import blank_history
+    from clients import close_loop_clients
+    from conversation_logic import triage_turn_async
+    from tree import decisionTree
+    from tts import synthesize_speech_async
+
+    async def converse(case):
+        user_history = blank_history(case)
+        state = "root"
+        turns = 0
+        for answer in case["answers"]:
+            state, response, _ = await triage_turn_async(state, answer, user_history)
+            await synthesize_speech_async(response)
+            turns += 1
+            if state not in decisionTree:
+                break
+        return turns
+
+    try:
+        return sum(await asyncio.gather(*(converse(case) for case in cases)))
+    finally:
+        await close_loop_clients()
+
+
+async def run_asgi(cases):
+    from urllib.parse import urlencode
+
+    import user_history
+    from asgi import app
+    from clients import close_loop_clients
+
+    user_history.FOLDER_PATH = tempfile.mkdtemp(prefix="async-turns-")
+    statuses = {}
+
+    async def post(path, form):
+        body = urlencode(form).encode()
+        received = []
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": path,
+            "query_string": b"language=en",
+            "headers": [(b"content-type", b"application/x-www-form-urlencoded")],
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            received.append(message)
+
+        await app(scope, receive, send)
+        status = received[0]["status"]
+        statuses[status] = statuses.get(status, 0) + 1
+        return received[1]["body"].decode()
+
+    async def converse(i, case):
+        call_sid = f"CA{i:032d}"
+        to_number = f"+1555{i:07d}"
+        turns = 0
+        for answer in case["answers"]:
+            twiml = await post(
+                "/handle_input",
+                {"CallSid": call_sid, "To": to_number, "SpeechResult": answer, "Confidence": "0.9"},
+            )
+            turns += 1
+            if "<Gather" not in twiml:
+                break
+        return turns
+
+    try:
+        turns = sum(await asyncio.gather(*(converse(i, c) for i, c in enumerate(cases))))
+    finally:
+        await close_loop_clients()
+    print(f"asgi response statuses: {statuses}", file=sys.stderr)
+    return turns
+
+
+def run_mode(mode, callers):
+    sys.path.insert(0, ROOT)
+    import conversation_logic  # noqa: F401  (imports are not part of the measurement)
+    import tts  # noqa: F401
+
+    if mode == "asgi":
+        import asgi  # noqa: F401
+
+    cases = caller_cases(callers)
+    baseline_kb = read_rss_kb("VmRSS")
+    started = time.perf_counter()
+    with Sampler() as sampler:
+        if mode == "threads":
+            turns = run_threads(cases)
+        else:
+            turns = asyncio.run(run_async(cases) if mode == "async" else run_asgi(cases))
+    seconds = time.perf_counter() - started
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "callers": callers,
+                "turns": turns,
+                "seconds": seconds,
+                "peak_threads": sampler.peak_threads,
+                "rss_growth_mb": (read_rss_kb("VmHWM") - baseline_kb) / 1024,
+            }
+        )
+    )
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--modes", nargs="+", default=["threads", "async", "asgi"])
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.run, args.callers)
+        sys.exit()
+
+    port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH, "openai_stub.py"), "--port", str(port), "--latency", str(args.latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=base_url,
+        ELEVENLABS_BASE_URL=base_url,
+        OPENAI_RPM="1000000",
+        OPENAI_TPM="1000000000",
+        INTENT_LOGGING="0",
+        INTENT_MODEL_PATH=os.path.join(tempfile.gettempdir(), "no-intent-model.json"),
+        HTTP_POOL_SIZE=str(args.callers),
+        TWILIO_STANDIN="1",
+        AWS_ACCESS_KEY_ID="",
+        AWS_SECRET_ACCESS_KEY="",
+        AWS_EC2_METADATA_DISABLED="true",
+    )
+    try:
+        time.sleep(0.5)
+        print(f"{args.callers} concurrent callers, {args.latency}s per LLM/TTS call")
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", mode, "--callers", str(args.callers)],
+                env=env,
+                capture_output=True,
+                text=True,
+                cwd=ROOT,
+            )
+            lines = [line for line in output.stdout.splitlines() if line.startswith("{")]
+            if not lines:
+                print(f"{mode}: failed\n{output.stderr[-2000:]}")
+                continue
+            result = json.loads(lines[-1])
+            print(
+                f"{mode:<8} {result['turns']} turns in {result['seconds']:5.1f}s "
+                f"({result['turns'] / result['seconds']:6.1f} turns/s) | "
+                f"peak threads {result['peak_threads']:4d} | "
+                f"peak RSS growth {result['rss_growth_mb']:6.1f} MB"
+            )
+    finally:
+        stub.terminate()
@@ -0,0 +1,80 @@
+"""
+Compares synthesized prompt formats end to end: bytes per prompt and
+duration (read with mutagen), synthesis time, S3 upload time, and the time
+to fetch the presigned URL the way Twilio does before it can start playback.
+
+Needs ELEVEN_API_KEY and AWS credentials (loaded from .env).
+
+    python bench/audio_formats.py ["prompt text"]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv  # noqa: E402
+
+from audio_formats import AUDIO_FORMATS, audio_stats  # noqa: E402
+from clients import get_http_session, get_s3_client  # noqa: E402
+from tree import decisionTree  # noqa: E402
+from tts import S3_BUCKET_NAME, synthesize_speech  # noqa: E402
+
+
+def measure(text, audio_format):
+    format_info = AUDIO_FORMATS[audio_format]
+
+    started = time.perf_counter()
+    audio_data = synthesize_speech(text, "en", audio_format)
+    synthesis_seconds = time.perf_counter() - started
+    if audio_data is None:
+        return None
+    stats = audio_stats(audio_data, audio_format)
+
+    s3_client = get_s3_client()
+    object_name = f"bench/prompt.{format_info['extension']}"
+    started = time.perf_counter()
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=object_name,
+        Body=audio_data,
+        ContentType=format_info["content_type"],
+    )
+    upload_seconds = time.perf_counter() - started
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": S3_BUCKET_NAME, "Key": object_name},
+        ExpiresIn=600,
+    )
+
+    started = time.perf_counter()
+    response = get_http_session().get(url, stream=True)
+    first_byte = None
+    for _ in response.iter_content(chunk_size=4096):
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+    fetch_seconds = time.perf_counter() - started
+
+    return dict(
+        stats,
+        synthesis_seconds=synthesis_seconds,
+        upload_seconds=upload_seconds,
+        fetch_first_byte_seconds=first_byte,
+        fetch_seconds=fetch_seconds,
+    )
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    text = sys.argv[1] if len(sys.argv) > 1 else decisionTree["root"]["question"]
+    print(f"{'format':<14} {'bytes':>8} {'secs':>6} {'kbps':>6} {'synth':>7} {'upload':>7} {'fetch':>7}")
+    for audio_format in AUDIO_FORMATS:
+        result = measure(text, audio_format)
+        if result is None:
+            print(f"{audio_format:<14} synthesis failed")
+            continue
+        print(
+            f"{audio_format:<14} {result['bytes']:>8} {result['duration'] or 0:>6.2f} "
+            f"{result.get('kbps', 0):>6.1f} {result['synthesis_seconds']:>7.3f} "
+            f"{result['upload_seconds']:>7.3f} {result['fetch_seconds']:>7.3f}"
+        )
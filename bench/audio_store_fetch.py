@@ -0,0 +1,163 @@
+"""
+Time-to-URL and fetch latency for synthesized prompts published to S3 versus
+the local audio store (AUDIO_STORE=local).
+
+Each turn calls tts.text_to_speech against the ElevenLabs stub (with no
+synthesis delay, so only publishing differs), then fetches the returned URL
+the way Twilio would: a full GET on a new connection. The S3 path talks to a
+small S3-compatible stub that adds --s3-rtt seconds to every upload, the
+round trip from the app to the bucket's region; the local path is served by
+the Flask app's /audio route on a threaded server. Fetches are made on
+localhost with no added delay, so they compare server overhead only, not
+Twilio's network distance to S3 versus to the app.
+
+    python bench/audio_store_fetch.py [--turns 50] [--s3-rtt 0.06] [--repeat 0.3]
+
+--repeat is the share of turns whose text was already spoken (the welcome,
+a re-asked question); the local store keeps one copy of those.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import StubHandler, start_stub  # noqa: E402
+
+
+class S3StubHandler(BaseHTTPRequestHandler):
+    """PUT and GET of path-style /<bucket>/<key>; uploads are delayed by rtt."""
+
+    # HTTP/1.1 so boto3's Expect: 100-continue is answered right away
+    protocol_version = "HTTP/1.1"
+    rtt = 0.06
+    objects = {}
+    puts = 0
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.rtt)
+        S3StubHandler.objects[self.path.split("?", 1)[0]] = body
+        S3StubHandler.puts += 1
+        self.send_response(200)
+        self.send_header("ETag", '"stub"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        body = S3StubHandler.objects.get(self.path.split("?", 1)[0])
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def report(line):
+    print(line, file=sys.stderr)
+
+
+def summarize(label, to_url, fetch, stored):
+    to_url = sorted(to_url)
+    fetch = sorted(fetch)
+    report(
+        f"{label:<6} time to URL p50 {statistics.median(to_url) * 1000:6.1f} ms "
+        f"p95 {to_url[int(len(to_url) * 0.95)] * 1000:6.1f} ms | "
+        f"fetch p50 {statistics.median(fetch) * 1000:5.1f} ms "
+        f"p95 {fetch[int(len(fetch) * 0.95)] * 1000:5.1f} ms | {stored}"
+    )
+
+
+def run(label, texts):
+    import requests
+
+    from tts import text_to_speech
+
+    os.environ["AUDIO_STORE"] = label
+    to_url = []
+    fetch = []
+    for text in texts:
+        started = time.perf_counter()
+        url = text_to_speech(text)
+        to_url.append(time.perf_counter() - started)
+        if url is None:
+            raise SystemExit(f"{label}: text_to_speech returned no URL")
+
+        started = time.perf_counter()
+        response = requests.get(url)
+        fetch.append(time.perf_counter() - started)
+        if response.status_code != 200 or not response.content:
+            raise SystemExit(f"{label}: fetching {url} returned {response.status_code}")
+    return to_url, fetch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--s3-rtt", type=float, default=0.06)
+    parser.add_argument("--repeat", type=float, default=0.3)
+    args = parser.parse_args()
+
+    _, stub_url = start_stub(latency=0)
+    StubHandler.tts_latency = 0
+    S3StubHandler.rtt = args.s3_rtt
+    s3_url = serve(ThreadingHTTPServer(("127.0.0.1", 0), S3StubHandler))
+    store_dir = tempfile.mkdtemp(prefix="audio-store-")
+    os.environ.update(
+        ELEVENLABS_BASE_URL=stub_url,
+        S3_ENDPOINT_URL=s3_url,
+        AWS_ACCESS_KEY_ID="stub",
+        AWS_SECRET_ACCESS_KEY="stub",
+        AUDIO_STORE_DIR=store_dir,
+        TWILIO_STANDIN="1",
+    )
+
+    from werkzeug.serving import make_server
+
+    from index import create_app
+
+    app_server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    os.environ["AUDIO_BASE_URL"] = serve(app_server)
+
+    random.seed(7)
+    spoken = []
+    texts = []
+    for turn in range(args.turns):
+        if spoken and random.random() < args.repeat:
+            texts.append(random.choice(spoken))
+        else:
+            # The stub's audio depends only on text length, so distinct texts differ in length
+            texts.append(f"Do you have a fever above 38 degrees?{'.' * len(spoken)}")
+            spoken.append(texts[-1])
+
+    # tts.py narrates every request on stdout; the report goes to stderr
+    sys.stdout = open(os.devnull, "w")
+    report(
+        f"{args.turns} turns ({len(spoken)} distinct texts), "
+        f"{args.s3_rtt * 1000:.0f} ms app-to-S3 round trip"
+    )
+    run("s3", texts[:3])  # connection pools and boto3 setup
+    S3StubHandler.puts = 0
+    to_url, fetch = run("s3", texts)
+    summarize("s3", to_url, fetch, f"{S3StubHandler.puts} uploads")
+    to_url, fetch = run("local", texts)
+    summarize("local", to_url, fetch, f"{len(os.listdir(store_dir))} files stored")
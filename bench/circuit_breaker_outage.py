@@ -0,0 +1,111 @@
+"""
+ElevenLabs outage against the stub: how long each turn waits before falling
+back to <Say>, with and without the circuit breaker, and how soon the
+breaker closes again once the service recovers.
+
+Turns arrive every --interval seconds. The stub answers text-to-speech
+normally, then hangs (or errors) for --outage seconds, then recovers. A turn
+that gets no audio back counts as a fallback.
+
+    python bench/circuit_breaker_outage.py [--mode hang] [--outage 20] [--interval 0.5]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import StubHandler, start_stub  # noqa: E402
+
+
+def report(line):
+    print(line, file=sys.stderr)
+
+
+def run(label, breaker_enabled, args):
+    import circuit_breaker
+    from tts import elevenlabs_breaker, synthesize_speech
+
+    # A breaker that never opens behaves like plain timeouts
+    circuit_breaker.BREAKER_MIN_CALLS = 5 if breaker_enabled else 10**9
+    elevenlabs_breaker.__init__(
+        "elevenlabs", elevenlabs_breaker.slow_seconds, elevenlabs_breaker.probe
+    )
+
+    waits = {"before": [], "outage": [], "after": []}
+    fallbacks = {"before": 0, "outage": 0, "after": 0}
+    first_audio_after_recovery = None
+    started = time.monotonic()
+    wall_started = time.time()
+    outage_start = args.warmup
+    outage_end = args.warmup + args.outage
+    lock = threading.Lock()
+    threads = []
+
+    def turn(phase, offset):
+        nonlocal first_audio_after_recovery
+        turn_started = time.monotonic()
+        audio = synthesize_speech("Do you have a fever above 38 degrees?")
+        with lock:
+            waits[phase].append(time.monotonic() - turn_started)
+            fallbacks[phase] += audio is None
+            if phase == "after" and audio and first_audio_after_recovery is None:
+                first_audio_after_recovery = offset - outage_end
+
+    total = args.warmup + args.outage + args.recovery
+    StubHandler.tts_outage = None
+    while time.monotonic() - started < total:
+        offset = time.monotonic() - started
+        if outage_start <= offset < outage_end:
+            StubHandler.tts_outage = args.mode
+            phase = "outage"
+        else:
+            StubHandler.tts_outage = None
+            phase = "before" if offset < outage_start else "after"
+        thread = threading.Thread(target=turn, args=(phase, offset))
+        thread.start()
+        threads.append(thread)
+        time.sleep(args.interval)
+    StubHandler.tts_outage = None
+    for thread in threads:
+        thread.join()
+
+    outage_waits = sorted(waits["outage"])
+    report(
+        f"{label:<16} outage turns: {len(outage_waits)}, fallbacks {fallbacks['outage']}, "
+        f"wait p50 {outage_waits[len(outage_waits) // 2]:5.2f}s max {outage_waits[-1]:5.2f}s, "
+        f"total caller wait {sum(outage_waits):6.1f}s | "
+        f"audio again {first_audio_after_recovery if first_audio_after_recovery is not None else float('nan'):4.1f}s "
+        f"after recovery"
+    )
+    if breaker_enabled:
+        for transition in elevenlabs_breaker.metrics()["transitions"]:
+            report(
+                f"    +{transition['at'] - wall_started:5.1f}s "
+                f"{transition['from']} -> {transition['to']}: {transition['reason']}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["hang", "error"], default="hang")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--outage", type=float, default=20)
+    parser.add_argument("--recovery", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    _, base_url = start_stub(latency=0.3)
+    StubHandler.tts_hang_seconds = 30
+    os.environ.setdefault("ELEVENLABS_BASE_URL", base_url)
+    os.environ.setdefault("ELEVENLABS_TIMEOUT", "5")
+    os.environ.setdefault("BREAKER_OPEN_SECONDS", "3")
+
+    # tts.py narrates every request on stdout; the report goes to stderr
+    sys.stdout = open(os.devnull, "w")
+    for label, enabled in (("timeouts only", False), ("circuit breaker", True)):
+        run(label, enabled, args)
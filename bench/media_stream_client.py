@@ -0,0 +1,229 @@
+"""
+Plays Twilio's side of a Media Streams call against the app's websocket
+server, with the OpenAI stub (bench/openai_stub.py) standing in for
+transcription, the LLM and ElevenLabs, and the local Twilio stand-in for
+placing the call. Answers are spoken as tone bursts between paced silence
+frames, prompts are "played" in real time and their marks echoed back, and
+one answer is spoken over a prompt to exercise barge-in.
+
+Reports how long the caller waits: from the stream start to the greeting's
+first frame, and from the end of each answer to the reply's first frame.
+
+    python bench/media_stream_client.py [--latency 0.8] [--answers fever yes yes yes] [--barge-in 2]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import StubHandler, start_stub, tone_ulaw  # noqa: E402
+
+FRAME_SECONDS = 0.02
+SILENCE_FRAME = b"\xff" * 160
+SPEECH_FRAME = tone_ulaw(FRAME_SECONDS)
+
+
+class SimulatedCaller:
+    def __init__(self, ws, stream_sid, call_sid):
+        self.ws = ws
+        self.stream_sid = stream_sid
+        self.call_sid = call_sid
+        self.speech_frames_left = 0
+        self.speech_done = asyncio.Event()
+        self.played_until = 0
+        self.mark_echoes = []
+        self.first_media_after = None
+        self.first_media_at = None
+        self.prompt_finished = asyncio.Event()
+        self.cleared_at = None
+
+    async def send(self, message):
+        await self.ws.send_str(json.dumps(message))
+
+    async def microphone(self):
+        # Twilio sends a frame every 20 ms for the whole call, speech or not
+        next_frame = time.monotonic()
+        while not self.ws.closed:
+            if self.speech_frames_left:
+                payload = SPEECH_FRAME
+                self.speech_frames_left -= 1
+                if not self.speech_frames_left:
+                    self.speech_done.set()
+            else:
+                payload = SILENCE_FRAME
+            await self.send(
+                {
+                    "event": "media",
+                    "streamSid": self.stream_sid,
+                    "media": {"track": "inbound", "payload": base64.b64encode(payload).decode()},
+                }
+            )
+            next_frame += FRAME_SECONDS
+            await asyncio.sleep(max(0, next_frame - time.monotonic()))
+
+    async def speaker(self):
+        async for msg in self.ws:
+            message = json.loads(msg.data)
+            now = time.monotonic()
+            if message["event"] == "media":
+                if self.first_media_at is None and now >= (self.first_media_after or 0):
+                    self.first_media_at = now
+                    self.prompt_finished.clear()
+                audio = base64.b64decode(message["media"]["payload"])
+                self.played_until = max(self.played_until, now) + len(audio) / 8000
+            elif message["event"] == "mark":
+                # Echo the mark once the audio queued before it has played
+                echo = asyncio.get_running_loop().call_at(
+                    max(self.played_until, now),
+                    lambda name=message["mark"]["name"]: asyncio.ensure_future(self.echo_mark(name)),
+                )
+                self.mark_echoes.append(echo)
+            elif message["event"] == "clear":
+                self.cleared_at = now
+                self.played_until = now
+                for echo in self.mark_echoes:
+                    echo.cancel()
+                self.mark_echoes = []
+                self.prompt_finished.set()
+
+    async def echo_mark(self, name):
+        if not self.ws.closed:
+            await self.send({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}})
+        self.prompt_finished.set()
+
+    def expect_reply(self, after):
+        self.first_media_after = after
+        self.first_media_at = None
+
+    async def wait_for_reply(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while self.first_media_at is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+        return self.first_media_at
+
+    async def say(self, seconds):
+        self.speech_done.clear()
+        self.speech_frames_left = int(seconds / FRAME_SECONDS)
+        await self.speech_done.wait()
+        return time.monotonic()
+
+
+async def run_call(url, call_sid, to_number, answers, barge_in_turn, answer_seconds):
+    import aiohttp
+
+    results = {"turns": []}
+    async with aiohttp.ClientSession() as http:
+        async with http.ws_connect(url) as ws:
+            stream_sid = "MZ" + call_sid[2:]
+            caller = SimulatedCaller(ws, stream_sid, call_sid)
+            await caller.send({"event": "connected", "protocol": "Call", "version": "1.0.0"})
+            started = time.monotonic()
+            caller.expect_reply(started)
+            await caller.send(
+                {
+                    "event": "start",
+                    "streamSid": stream_sid,
+                    "start": {
+                        "streamSid": stream_sid,
+                        "callSid": call_sid,
+                        "tracks": ["inbound"],
+                        "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                        "customParameters": {"to_number": to_number, "language": "en"},
+                    },
+                }
+            )
+            tasks = [asyncio.create_task(caller.microphone()), asyncio.create_task(caller.speaker())]
+
+            results["greeting"] = await caller.wait_for_reply() - started
+            for turn, answer in enumerate(answers, 1):
+                if turn == barge_in_turn:
+                    # Talk over the prompt half a second into it
+                    await asyncio.sleep(0.5)
+                    barge_started = time.monotonic()
+                else:
+                    await caller.prompt_finished.wait()
+                    barge_started = None
+
+                speech_ended = await caller.say(answer_seconds)
+                caller.expect_reply(speech_ended)
+                if barge_started is not None:
+                    results["barge_in"] = (caller.cleared_at or time.monotonic()) - barge_started
+                reply_at = await caller.wait_for_reply()
+                results["turns"].append(
+                    (answer, reply_at - speech_ended if reply_at else None)
+                )
+
+            # The server closes the stream once the final prompt has played
+            await asyncio.wait_for(tasks[1], 30)
+            results["closed_by_server"] = True
+            tasks[0].cancel()
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.8, help="stub LLM/STT latency")
+    parser.add_argument("--answers", nargs="+", default=["fever", "yes", "yes", "yes"])
+    parser.add_argument("--barge-in", type=int, default=2, help="answer spoken over its prompt")
+    parser.add_argument("--answer-seconds", type=float, default=0.8)
+    args = parser.parse_args()
+
+    _, base_url = start_stub(latency=args.latency)
+    StubHandler.transcripts = list(args.answers)
+    port = free_port()
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": base_url,
+            "ELEVENLABS_BASE_URL": base_url,
+            "TWILIO_STANDIN": "1",
+            "VOICE_MODE": "stream",
+            "MEDIA_STREAM_PORT": str(port),
+            "MEDIA_STREAM_URL": f"ws://127.0.0.1:{port}",
+        }
+    )
+    os.chdir(tempfile.mkdtemp())  # user histories are written under ./static/user_data
+
+    import index
+    from clients import get_twilio_client
+
+    from media_stream import start_media_stream_server
+
+    app = index.create_app()
+    start_media_stream_server(port, index.stream_greeting, index.run_stream_turn)
+    to_number = "+15550100123"
+    app.test_client().post("/login", data={"to_number": to_number[2:], "contact_method": "call"})
+    call_sid = get_twilio_client().created_calls[-1]["sid"]
+
+    results = asyncio.run(
+        run_call(
+            f"ws://127.0.0.1:{port}/media-stream",
+            call_sid,
+            to_number,
+            args.answers,
+            args.barge_in,
+            args.answer_seconds,
+        )
+    )
+    print(f"greeting first audio: {results['greeting'] * 1000:.0f} ms after stream start")
+    for answer, latency in results["turns"]:
+        shown = f"{latency * 1000:.0f} ms" if latency is not None else "no reply"
+        print(f"answer {answer!r:<8} reply first audio: {shown} after end of speech")
+    if "barge_in" in results:
+        print(f"barge-in: prompt cleared {results['barge_in'] * 1000:.0f} ms after the caller started talking")
+    print(f"stream closed by server after diagnosis: {results.get('closed_by_server', False)}")
+    print(f"LLM calls: {StubHandler.calls}")
@@ -0,0 +1,98 @@
+"""
+Burst load against the OpenAI stub with an account limit (--max-rps): a
+backlog of background prompts (webform processing, analytics) lands at once
+while voice turns of four sequential calls keep arriving. Compares:
+
+- no limiter: requests go straight out and a 429 fails the call, as before
+- limiter, FIFO: requests share the rate limit in arrival order
+- limiter, priority: voice requests are served before the backlog
+
+    python bench/openai_limiter_burst.py [--max-rps 5] [--background 60] [--voice-turns 10]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import StubHandler, start_stub  # noqa: E402
+
+CALLS_PER_TURN = 4
+
+
+def run_scenario(background, voice_turns, voice_priority):
+    from conversation_logic import generate_openai_response
+    from openai_limiter import PRIORITY_BACKGROUND, call_with_priority
+
+    failures = {"voice": 0, "background": 0}
+    lock = threading.Lock()
+
+    def prompt(kind, priority, text):
+        result = call_with_priority(priority, generate_openai_response, text)
+        if result is None:
+            with lock:
+                failures[kind] += 1
+
+    def voice_turn(i):
+        started = time.perf_counter()
+        for call in range(CALLS_PER_TURN):
+            prompt("voice", voice_priority, f"Original Question: \"turn {i} call {call}\"")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=background) as pool:
+        backlog = [
+            pool.submit(prompt, "background", PRIORITY_BACKGROUND, f"Summarize record {i}")
+            for i in range(background)
+        ]
+        turn_latencies = []
+        for i in range(voice_turns):
+            time.sleep(max(0, 0.2 + i - (time.perf_counter() - started)))
+            turn_latencies.append(voice_turn(i))
+        for future in backlog:
+            future.result()
+    return turn_latencies, time.perf_counter() - started, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-rps", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--background", type=int, default=60)
+    parser.add_argument("--voice-turns", type=int, default=10)
+    args = parser.parse_args()
+
+    _, base_url = start_stub(latency=args.latency)
+    StubHandler.max_rps = args.max_rps
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    import openai_limiter
+    from openai_limiter import PRIORITY_BACKGROUND, PRIORITY_VOICE, get_limiter
+
+    scenarios = [
+        ("no limiter", 10**6, 1, PRIORITY_VOICE),
+        ("limiter, FIFO", args.max_rps * 60, 8, PRIORITY_BACKGROUND),
+        ("limiter, priority", args.max_rps * 60, 8, PRIORITY_VOICE),
+    ]
+    for label, rpm, attempts, voice_priority in scenarios:
+        # Reset the shared limiter for each scenario
+        get_limiter().__init__(rpm, 10**9)
+        openai_limiter.MAX_ATTEMPTS = attempts
+        time.sleep(1.1)  # let the stub's rate window drain
+        rate_limited_before = StubHandler.rate_limited
+
+        turns, makespan, failures = run_scenario(
+            args.background, args.voice_turns, voice_priority
+        )
+        turns.sort()
+        print(
+            f"{label:<18} voice turn p50 {turns[len(turns) // 2] * 1000:5.0f} ms"
+            f" max {turns[-1] * 1000:5.0f} ms | backlog done in {makespan:4.1f}s"
+            f" | failed calls: voice {failures['voice']}, background {failures['background']}"
+            f" | 429s {StubHandler.rate_limited - rate_limited_before}"
+        )
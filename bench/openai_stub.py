@@ -0,0 +1,205 @@
+"""
+Local stand-in for the OpenAI chat completions API, for replays and load
+tests without network access or cost. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Answers are canned from the prompt: interpretation prompts pick the first
+option named in the user's response, extraction prompts return an age
+given as "N years old" (other fields null) and echo the response as a
+bullet, and rephrasing returns the original question. Every reply waits `latency` seconds to mimic the API.
+
+For Media Streams runs it also answers /v1/audio/transcriptions with the
+next entry of StubHandler.transcripts, and ElevenLabs text-to-speech
+(ELEVENLABS_BASE_URL=<same base url>) with a mu-law tone whose length
+grows with the text.
+
+StubHandler.tts_outage makes text-to-speech fail ("error") or hang ("hang"),
+for circuit breaker runs; GET /v1/models answers health probes.
+
+With StubHandler.max_rps set, chat requests beyond that many per second get
+a 429 with Retry-After: 1, like an account over its rate limit.
+
+    python bench/openai_stub.py [--port 8765] [--latency 0.8]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def quoted_after(label, prompt, last=False):
+    matches = re.findall(re.escape(label) + r'\s*"([^"]*)"', prompt)
+    if not matches:
+        return ""
+    return matches[-1] if last else matches[0]
+
+
+def canned_answer(prompt):
+    if "categorize it into one of the following options:" in prompt:
+        options_line = prompt.split("following options:", 1)[1].split("\n", 1)[0]
+        options = [o.strip() for o in options_line.split(",") if o.strip()]
+        response = quoted_after("Given the user response:", prompt).lower()
+        words = set(re.findall(r"[\w<>-]+", response))
+        for option in options:
+            if re.search(rf"(?<!\w){re.escape(option.replace('_', ' '))}(?!\w)", response):
+                return option
+        if "no" in words or "not" in words:
+            return "no" if "no" in options else "none" if "none" in options else "invalid"
+        return "invalid"
+    if "Extract the following information" in prompt:
+        response = quoted_after("And the user" + chr(39) + "s response:", prompt)
+        fields = {"fname": None, "lname": None, "age": None, "gender": None, "height": None, "weight": None}
+        age = re.search(r"\b(\d{1,3}) years? old\b", response)
+        if age:
+            fields["age"] = age.group(1)
+        return json.dumps({**fields, "bullets": [f"- {response}"]})
+    if "Original Question:" in prompt:
+        return quoted_after("Original Question:", prompt, last=True)
+    if prompt.startswith("Translate the following text"):
+        return prompt.split("\n\n", 1)[1].rsplit("\n\nTranslation:", 1)[0]
+    return prompt[-200:]
+
+
+# One cycle of a 400 Hz sine at 8 kHz, mu-law encoded
+TONE_CYCLE = bytes.fromhex("ffbbada6a1a0a1a6adbbff3b2d26212021262d3b")
+
+
+def tone_ulaw(seconds, sample_rate=8000):
+    samples = int(seconds * sample_rate)
+    return (TONE_CYCLE * (samples // len(TONE_CYCLE) + 1))[:samples]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.8
+    calls = 0
+    calls_lock = threading.Lock()
+    # Transcripts returned, in order, for uploaded utterances
+    transcripts = []
+    # Synthesis time per request and spoken seconds per character of text
+    tts_latency = 0.3
+    tts_seconds_per_char = 0.06
+    # Chat requests allowed per second before answering 429 (None: unlimited)
+    max_rps = None
+    recent_requests = deque()
+    rate_limited = 0
+    # Simulated text-to-speech outage: None, "error" (503) or "hang" (no answer for tts_hang_seconds)
+    tts_outage = None
+    tts_hang_seconds = 30
+
+    def do_GET(self):
+        # Health probes: GET /v1/models on either API
+        if self.path.endswith("/models"):
+            if self.tts_outage and "xi-api-key" in self.headers:
+                return self.fail_tts()
+            return self.send_json({"data": []})
+        self.send_error(404)
+
+    def do_POST(self):
+        raw_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/audio/transcriptions"):
+            return self.transcribe()
+        if "/text-to-speech/" in self.path:
+            return self.synthesize(json.loads(raw_body))
+
+        body = json.loads(raw_body)
+        prompt = body["messages"][-1]["content"]
+        if self.over_rate_limit():
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with StubHandler.calls_lock:
+            StubHandler.calls += 1
+        time.sleep(self.latency)
+
+        content = canned_answer(prompt)
+        self.send_json(
+            {
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                },
+            }
+        )
+
+    def over_rate_limit(self):
+        if self.max_rps is None:
+            return False
+        now = time.monotonic()
+        with StubHandler.calls_lock:
+            while self.recent_requests and self.recent_requests[0] < now - 1:
+                self.recent_requests.popleft()
+            if len(self.recent_requests) >= self.max_rps:
+                StubHandler.rate_limited += 1
+                return True
+            self.recent_requests.append(now)
+        return False
+
+    def transcribe(self):
+        time.sleep(self.latency)
+        with StubHandler.calls_lock:
+            text = StubHandler.transcripts.pop(0) if StubHandler.transcripts else ""
+        self.send_json({"text": text})
+
+    def fail_tts(self):
+        if self.tts_outage == "hang":
+            time.sleep(self.tts_hang_seconds)
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def synthesize(self, body):
+        if self.tts_outage:
+            return self.fail_tts()
+        time.sleep(self.tts_latency)
+        audio = tone_ulaw(len(body["text"]) * self.tts_seconds_per_char)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/basic")
+        self.send_header("Content-Length", str(len(audio)))
+        self.end_headers()
+        self.wfile.write(audio)
+
+    def send_json(self, data):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursty load tests open many connections at once
+    request_queue_size = 256
+
+
+def start_stub(port=0, latency=0.8):
+    """Starts the stub in a background thread and returns (server, base_url)."""
+    StubHandler.latency = latency
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.8)
+    args = parser.parse_args()
+    server, base_url = start_stub(args.port, args.latency)
+    print(f"OpenAI stub listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,198 @@
+"""
+What the profiling hooks cost, and what the sampler sees. Client threads post
+scripted triage turns from recordings/triage_cases.jsonl to /handle_input on
+a threaded server, against the OpenAI/ElevenLabs stub with no latency, so the
+turns are bound by the app's own CPU time. Audio goes to the local audio
+store and histories to a temporary folder.
+
+Modes, run in turn for --seconds each, --rounds times (the median is
+reported, since throughput drifts as pools and histories warm up):
+- no token: ADMIN_TOKEN unset, the hooks only check that no sampler runs
+- idle: ADMIN_TOKEN set, nothing profiling
+- sampling: /admin/profile sampling request threads for the whole run
+- cprofile: every turn sent with "X-Profile: cprofile"
+
+    python bench/profiler_overhead.py [--clients 8] [--seconds 5] [--rounds 3]
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path.insert(0, ROOT)
+sys.path.append(BENCH)
+
+from openai_stub import StubHandler, start_stub  # noqa: E402
+
+TOKEN = "bench-admin-token"
+
+# Every conversation gets a fresh call and caller, so no turn is answered
+# from the idempotency cache and no history grows across modes
+conversation_ids = itertools.count()
+
+
+def report(line):
+    print(line, file=sys.stderr)
+
+
+def drive(base_url, cases, seconds, headers):
+    """Runs conversations from every client until `seconds` pass; returns turns made."""
+    import requests
+
+    deadline = time.monotonic() + seconds
+    turns = Counter()
+
+    def client(number):
+        session = requests.Session()
+        while True:
+            conversation = next(conversation_ids)
+            case = cases[conversation % len(cases)]
+            call_sid = f"CA{conversation:032d}"
+            for answer in case["answers"]:
+                if time.monotonic() >= deadline:
+                    return
+                response = session.post(
+                    f"{base_url}/handle_input?language=en",
+                    data={
+                        "CallSid": call_sid,
+                        "To": f"+1555{conversation:07d}",
+                        "SpeechResult": answer,
+                        "Confidence": "0.9",
+                    },
+                    headers=headers,
+                )
+                response.raise_for_status()
+                turns[number] += 1
+                if "<Gather" not in response.text:
+                    break
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(turns.values())
+
+
+def run(base_url, cases, headers=None, sample=False):
+    """Drives one mode; returns (turns/s, /admin/profile response or None)."""
+    import requests
+
+    profile = {}
+    sampler_thread = None
+    if sample:
+        def profile_run():
+            profile["response"] = requests.post(
+                f"{base_url}/admin/profile",
+                params={"seconds": args.seconds},
+                headers={"Authorization": f"Bearer {TOKEN}"},
+            )
+
+        sampler_thread = threading.Thread(target=profile_run)
+        sampler_thread.start()
+
+    turns = drive(base_url, cases, args.seconds, headers or {})
+    if sampler_thread:
+        sampler_thread.join()
+    return turns / args.seconds, profile.get("response")
+
+
+def leaf_frames(collapsed_stacks, limit):
+    """Share of samples by innermost frame."""
+    counts = Counter()
+    for line in collapsed_stacks.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        counts[stack.split(";")[-1]] += int(count)
+    total = sum(counts.values())
+    return [(frame, count / total) for frame, count in counts.most_common(limit)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    _, stub_url = start_stub(latency=0)
+    StubHandler.tts_latency = 0
+    os.environ.update(
+        OPENAI_BASE_URL=stub_url,
+        ELEVENLABS_BASE_URL=stub_url,
+        OPENAI_RPM="1000000",
+        OPENAI_TPM="1000000000",
+        INTENT_LOGGING="0",
+        INTENT_MODEL_PATH=os.path.join(tempfile.gettempdir(), "no-intent-model.json"),
+        TWILIO_STANDIN="1",
+        AUDIO_STORE="local",
+        AUDIO_STORE_DIR=tempfile.mkdtemp(prefix="profiler-audio-"),
+        AUDIO_BASE_URL="http://127.0.0.1",
+        PROFILE_DIR=tempfile.mkdtemp(prefix="profiler-stats-"),
+    )
+    os.environ.pop("ADMIN_TOKEN", None)
+
+    import logging
+
+    from werkzeug.serving import make_server
+
+    import profiler
+    import user_history
+    from index import create_app
+
+    user_history.FOLDER_PATH = tempfile.mkdtemp(prefix="profiler-histories-")
+    profiler.PROFILE_DIR = os.environ["PROFILE_DIR"]
+    with open(os.path.join(BENCH, "recordings", "triage_cases.jsonl")) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # The app narrates every turn on stdout and in INFO logs; the report goes to stderr
+    sys.stdout = open(os.devnull, "w")
+    logging.disable(logging.INFO)
+    report(f"{args.clients} clients, {args.seconds:.0f}s per mode")
+    drive(base_url, cases, 2, {})  # warm up pools and imports
+
+    modes = {
+        "no token": {},
+        "idle": {"token": True},
+        "sampling": {"token": True, "sample": True},
+        "cprofile": {
+            "token": True,
+            "headers": {"X-Profile": "cprofile", "Authorization": f"Bearer {TOKEN}"},
+        },
+    }
+    rates = {label: [] for label in modes}
+    for _ in range(args.rounds):
+        for label, mode in modes.items():
+            if mode.get("token"):
+                os.environ["ADMIN_TOKEN"] = TOKEN
+            else:
+                os.environ.pop("ADMIN_TOKEN", None)
+            rate, profile_response = run(
+                base_url, cases, mode.get("headers"), mode.get("sample", False)
+            )
+            rates[label].append(rate)
+            if profile_response is not None:
+                response = profile_response
+    for label, mode_rates in rates.items():
+        report(
+            f"{label:<10} median {statistics.median(mode_rates):6.1f} turns/s "
+            f"(rounds: {', '.join(f'{rate:.1f}' for rate in mode_rates)})"
+        )
+
+    report(
+        f"\nlast sampling run: {response.headers['X-Profile-Samples']} samples, "
+        f"{response.headers['X-Profile-Requests']} requests; innermost frames:"
+    )
+    for frame, share in leaf_frames(response.text, 12):
+        report(f"  {share:6.1%}  {frame}")
@@ -0,0 +1,88 @@
+"""
+Replays recorded Gather partial-result callbacks against the app with the
+OpenAI stub (bench/openai_stub.py) and the local Twilio stand-in, and
+reports how long each final /handle_input takes with and without
+speculative interpretation.
+
+    python bench/replay_partials.py [bench/recordings/partial_results_fever.json] [--latency 0.8]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import StubHandler, start_stub  # noqa: E402
+
+
+def replay(app, recording, speculation_enabled):
+    import speculation
+
+    speculation.SPECULATION_ENABLED = speculation_enabled
+    client = app.test_client()
+    call_sid = f"{recording['call_sid']}-{int(speculation_enabled)}"
+    latencies = []
+    for turn in recording["turns"]:
+        started = time.perf_counter()
+        for partial in turn["partials"]:
+            time.sleep(max(0, partial["at"] - (time.perf_counter() - started)))
+            client.post(
+                "/partial_input",
+                data=dict(partial, CallSid=call_sid, To=recording["to"]),
+            )
+        final = turn["final"]
+        time.sleep(max(0, final["at"] - (time.perf_counter() - started)))
+
+        final_started = time.perf_counter()
+        client.post(
+            "/handle_input?language=en",
+            data=dict(
+                CallSid=call_sid,
+                To=recording["to"],
+                SpeechResult=final["SpeechResult"],
+                Confidence=final["Confidence"],
+            ),
+        )
+        latencies.append(time.perf_counter() - final_started)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "recording",
+        nargs="?",
+        default=os.path.join(ROOT, "bench", "recordings", "partial_results_fever.json"),
+    )
+    parser.add_argument("--latency", type=float, default=0.8)
+    args = parser.parse_args()
+
+    with open(args.recording) as f:
+        recording = json.load(f)
+
+    _, base_url = start_stub(latency=args.latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["TWILIO_STANDIN"] = "1"
+    os.chdir(tempfile.mkdtemp())  # user histories are written under ./static/user_data
+
+    import index
+
+    # Prompt audio is not part of what is being measured
+    index.text_to_speech = lambda *args, **kwargs: None
+    app = index.create_app()
+
+    for enabled in (False, True):
+        calls_before = StubHandler.calls
+        latencies = replay(app, recording, enabled)
+        label = "with speculation" if enabled else "without speculation"
+        print(
+            f"{label:<20} final-result latency per turn: "
+            + ", ".join(f"{latency * 1000:.0f} ms" for latency in latencies)
+            + f" | mean {sum(latencies) / len(latencies) * 1000:.0f} ms"
+            + f" | LLM calls {StubHandler.calls - calls_before}"
+        )
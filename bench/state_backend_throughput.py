@@ -0,0 +1,83 @@
+"""
+Measures state backend throughput with 1, 4 and 8 worker processes.
+
+Each worker appends messages to its own conversations and reads them back
+(the pattern of /handle_input followed by a viewer poll), and one listener
+measures how long a message appended by a worker takes to reach a waiter in
+another process.
+
+    python bench/state_backend_throughput.py [--ops 2000] [--db /tmp/state_bench.db]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_backend import SQLiteStateBackend  # noqa: E402
+
+
+def worker(db_path, worker_id, ops, start_event):
+    state = SQLiteStateBackend(db_path)
+    start_event.wait()
+    for i in range(ops):
+        conversation_id = f"CA{worker_id}-{i % 20}"
+        state.append_message(conversation_id, {"speaker": "user", "text": f"turn {i}"})
+        state.get_messages(conversation_id, since=max(0, i // 20 - 1))
+        state.set_value(f"tree:{conversation_id}", "root")
+
+
+def listener(db_path, ready, result):
+    state = SQLiteStateBackend(db_path)
+    ready.set()
+    messages = state.wait_for_messages("CA-latency", 0, timeout=10)
+    if messages:
+        result.value = time.time() - messages[0]["sent_at"]
+
+
+def run(workers, ops, db_path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    SQLiteStateBackend(db_path)
+
+    start_event = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=worker, args=(db_path, i, ops, start_event))
+        for i in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    started = time.perf_counter()
+    start_event.set()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    ready = multiprocessing.Event()
+    latency = multiprocessing.Value("d", -1.0)
+    p = multiprocessing.Process(target=listener, args=(db_path, ready, latency))
+    p.start()
+    ready.wait()
+    time.sleep(0.2)
+    SQLiteStateBackend(db_path).append_message(
+        "CA-latency", {"speaker": "ai", "text": "hi", "sent_at": time.time()}
+    )
+    p.join()
+
+    turns = workers * ops
+    print(
+        f"{workers} worker(s): {turns} turns in {elapsed:.2f}s = {turns / elapsed:,.0f} turns/s, "
+        f"cross-worker delivery {latency.value * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--db", default="/tmp/state_bench.db")
+    args = parser.parse_args()
+    for workers in (1, 4, 8):
+        run(workers, args.ops, args.db)
@@ -0,0 +1,326 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_DB_PATH = os.getenv("CAMPAIGN_DB_PATH", "campaigns.db")
+
+# Twilio's default outbound limits are one call and one message per second per number
+CALLS_PER_SECOND = float(os.getenv("TWILIO_CALLS_PER_SECOND", "1"))
+MESSAGES_PER_SECOND = float(os.getenv("TWILIO_MESSAGES_PER_SECOND", "1"))
+
+# Only the process holding the dispatcher lease places calls and sends
+# messages, so the rates above hold across all workers. A lease not renewed
+# for this long belongs to a dead process and is taken over.
+DISPATCHER_LEASE_SECONDS = 30
+
+# How often a dispatcher checks for targets queued by other workers and
+# retries the lease
+DISPATCHER_POLL_SECONDS = 5
+
+# Call statuses reported to /call_status that end a campaign target
+FINAL_CALL_STATUSES = ["completed", "busy", "no-answer", "failed", "canceled"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    language TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_targets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id INTEGER NOT NULL REFERENCES campaigns(id),
+    to_number TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    status TEXT NOT NULL,
+    sid TEXT,
+    outcome TEXT,
+    error TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_campaign_targets_status ON campaign_targets(status, id);
+CREATE INDEX IF NOT EXISTS idx_campaign_targets_sid ON campaign_targets(sid);
+CREATE TABLE IF NOT EXISTS dispatcher_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class TokenBucket:
+    """
+    Blocking token bucket: `rate` tokens are added per second, up to `capacity`.
+    Buckets are per process; the dispatcher lease keeps dispatch to one process.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+buckets = {
+    "call": TokenBucket(CALLS_PER_SECOND),
+    "text": TokenBucket(MESSAGES_PER_SECOND),
+}
+
+dispatcher_thread = None
+dispatcher_lock = threading.Lock()
+work_available = threading.Event()
+lease_owners = {}
+
+
+def now_str():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def connect():
+    conn = sqlite3.connect(CAMPAIGN_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db():
+    with connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+
+def create_campaign(targets, language="en"):
+    """
+    Stores a campaign and its (to_number, channel) targets as queued, and
+    wakes the dispatcher. Returns the campaign id.
+    """
+    init_db()
+    created_at = now_str()
+    with connect() as conn:
+        cursor = conn.execute(
+            "INSERT INTO campaigns (language, status, created_at) VALUES (?, ?, ?)",
+            (language, "running", created_at),
+        )
+        campaign_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO campaign_targets (campaign_id, to_number, channel, status, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?)",
+            [(campaign_id, to_number, channel, created_at) for to_number, channel in targets],
+        )
+    work_available.set()
+    return campaign_id
+
+
+def campaign_progress(campaign_id):
+    init_db()
+    with connect() as conn:
+        campaign = conn.execute(
+            "SELECT * FROM campaigns WHERE id = ?", (campaign_id,)
+        ).fetchone()
+        if campaign is None:
+            return None
+        status_counts = conn.execute(
+            "SELECT status, COUNT(*) FROM campaign_targets WHERE campaign_id = ? GROUP BY status",
+            (campaign_id,),
+        ).fetchall()
+        outcome_counts = conn.execute(
+            "SELECT outcome, COUNT(*) FROM campaign_targets "
+            "WHERE campaign_id = ? AND outcome IS NOT NULL GROUP BY outcome",
+            (campaign_id,),
+        ).fetchall()
+
+    return {
+        "campaign_id": campaign["id"],
+        "language": campaign["language"],
+        "status": campaign["status"],
+        "created_at": campaign["created_at"],
+        "targets": {status: count for status, count in status_counts},
+        "outcomes": {outcome: count for outcome, count in outcome_counts},
+    }
+
+
+def record_call_status(call_sid, call_status):
+    """
+    Records the outcome reported by Twilio's status callback for a campaign call.
+    Calls that were not placed by a campaign are ignored.
+    """
+    if call_status not in FINAL_CALL_STATUSES or not os.path.exists(CAMPAIGN_DB_PATH):
+        return
+    with connect() as conn:
+        conn.execute(
+            "UPDATE campaign_targets SET outcome = ?, updated_at = ? WHERE sid = ?",
+            (call_status, now_str(), call_sid),
+        )
+
+
+def lease_owner():
+    # Per pid, as forked workers share this module; the random part tells a
+    # restarted container apart from its predecessor with the same pid
+    if lease_owners.get("pid") != os.getpid():
+        lease_owners.update(
+            pid=os.getpid(), owner=f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+    return lease_owners["owner"]
+
+
+def renew_lease(conn):
+    """
+    Takes or extends the dispatcher lease inside the caller's write
+    transaction. Returns None if another live process holds it, else whether
+    it was taken over from a different owner.
+    """
+    owner = lease_owner()
+    now = time.time()
+    lease = conn.execute("SELECT owner, expires FROM dispatcher_lease WHERE id = 1").fetchone()
+    if lease is not None and lease["owner"] != owner and lease["expires"] > now:
+        return None
+    conn.execute(
+        "INSERT OR REPLACE INTO dispatcher_lease (id, owner, expires) VALUES (1, ?, ?)",
+        (owner, now + DISPATCHER_LEASE_SECONDS),
+    )
+    return lease is None or lease["owner"] != owner
+
+
+def start_dispatcher(dispatch):
+    """
+    Starts the background dispatcher for this process if it is not running.
+    `dispatch(to_number, channel, language)` places the call or sends the
+    message and returns its Twilio SID.
+    """
+    global dispatcher_thread
+    with dispatcher_lock:
+        if dispatcher_thread is not None and dispatcher_thread.is_alive():
+            return
+        init_db()
+        dispatcher_thread = threading.Thread(
+            target=dispatch_loop, args=(dispatch,), daemon=True
+        )
+        dispatcher_thread.start()
+
+
+def resume_campaigns(dispatch):
+    """
+    Starts the dispatcher if a previous process left campaigns unfinished.
+    Targets it was dispatching are marked interrupted by whichever process
+    takes over its lease (see claim_target), never while it is still alive.
+    """
+    if not os.path.exists(CAMPAIGN_DB_PATH):
+        return
+    init_db()
+    with connect() as conn:
+        pending = conn.execute(
+            "SELECT COUNT(*) FROM campaign_targets WHERE status IN ('queued', 'dispatching')"
+        ).fetchone()[0]
+    if pending:
+        logger.info(f"Resuming campaigns with {pending} pending target(s)")
+        work_available.set()
+        start_dispatcher(dispatch)
+
+
+def claim_target(conn):
+    """
+    Claims the next queued target for this process, or returns None if there
+    is none or another process holds the dispatcher lease. The lease check
+    and the claim share one write transaction, so a target is only ever
+    claimed by the lease holder and only once.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        taken_over = renew_lease(conn)
+        if taken_over is None:
+            conn.execute("COMMIT")
+            return None
+        if taken_over:
+            # Targets the previous holder was dispatching when it died may
+            # already have been contacted, so they are not retried
+            interrupted = conn.execute(
+                "UPDATE campaign_targets SET status = 'failed', error = 'interrupted', "
+                "updated_at = ? WHERE status = 'dispatching'",
+                (now_str(),),
+            ).rowcount
+            if interrupted:
+                logger.warning(f"Marked {interrupted} interrupted campaign target(s) as failed")
+
+        target = conn.execute(
+            "SELECT t.id, t.campaign_id, t.to_number, t.channel, c.language "
+            "FROM campaign_targets t JOIN campaigns c ON c.id = t.campaign_id "
+            "WHERE t.status = 'queued' ORDER BY t.id LIMIT 1"
+        ).fetchone()
+        if target is None:
+            conn.execute(
+                "UPDATE campaigns SET status = 'dispatched' WHERE status = 'running' "
+                "AND NOT EXISTS (SELECT 1 FROM campaign_targets t "
+                "WHERE t.campaign_id = campaigns.id AND t.status IN ('queued', 'dispatching'))"
+            )
+        elif conn.execute(
+            "UPDATE campaign_targets SET status = 'dispatching', updated_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (now_str(), target["id"]),
+        ).rowcount == 0:
+            target = None
+        conn.execute("COMMIT")
+        return target
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def dispatch_loop(dispatch):
+    while True:
+        # Also wakes periodically for targets queued through other workers
+        work_available.wait(DISPATCHER_POLL_SECONDS)
+        work_available.clear()
+        try:
+            dispatch_queued(dispatch)
+        except Exception:
+            # A locked or unreadable database must not end the thread
+            logger.exception("Campaign dispatcher failed, retrying")
+            time.sleep(DISPATCHER_POLL_SECONDS)
+
+
+def dispatch_queued(dispatch):
+    while True:
+        conn = connect()
+        conn.isolation_level = None
+        try:
+            target = claim_target(conn)
+        finally:
+            conn.close()
+        if target is None:
+            return
+
+        buckets[target["channel"]].acquire()
+        try:
+            sid = dispatch(target["to_number"], target["channel"], target["language"])
+            update = ("dispatched", sid, None)
+        except Exception as e:
+            logger.error(f"Failed to contact {target['to_number']}: {str(e)}")
+            update = ("failed", None, str(e))
+
+        with connect() as conn:
+            conn.execute(
+                "UPDATE campaign_targets SET status = ?, sid = ?, error = ?, updated_at = ? "
+                "WHERE id = ?",
+                update + (now_str(), target["id"]),
+            )
@@ -0,0 +1,183 @@
+"""
+Circuit breakers for the external services a turn depends on (OpenAI,
+ElevenLabs, S3). Each breaker tracks the error rate and latency of recent
+calls; once too many fail or are too slow it opens, and callers take their
+fallback path right away (<Say> instead of <Play>, the tree question as
+written instead of a rephrasing) instead of waiting on a dead service.
+
+After BREAKER_OPEN_SECONDS an open breaker goes half-open and runs its health
+probe in the background, closing again only once the probe succeeds. Breakers
+without a probe let a single trial call through instead.
+
+Breakers live in the process, like the clients in clients.py; their state and
+recent transitions are served at /metrics.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# A breaker opens when at least BREAKER_MIN_CALLS calls in the last
+# BREAKER_WINDOW_SECONDS were made and this fraction of them failed or were slow
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+
+# How long a breaker stays open before probing the service
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Latencies kept per breaker for the percentiles in metrics()
+LATENCY_SAMPLES = 200
+
+breakers = {}
+
+
+class CircuitBreaker:
+    def __init__(self, name, slow_seconds, probe=None):
+        self.name = name
+        self.slow_seconds = slow_seconds
+        self.probe = probe
+        self.state = CLOSED
+        self.opened_at = 0
+        self.trial_in_flight = False
+        self.outcomes = deque()  # (time, failed) within the window
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.transitions = deque(maxlen=20)
+        self.counts = {"calls": 0, "failures": 0, "slow": 0, "short_circuited": 0}
+        self.lock = threading.Lock()
+        breakers[name] = self
+
+    def allow(self):
+        """Returns whether a call may go out now; counts it as short-circuited if not."""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS:
+                self.transition(HALF_OPEN, "open period elapsed")
+                if self.probe:
+                    threading.Thread(target=self.run_probe, daemon=True).start()
+            if self.state == HALF_OPEN and not self.probe and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.counts["short_circuited"] += 1
+            return False
+
+    def record(self, failed, seconds):
+        with self.lock:
+            now = time.monotonic()
+            slow = seconds >= self.slow_seconds
+            self.counts["calls"] += 1
+            self.counts["failures"] += failed
+            self.counts["slow"] += slow
+            self.latencies.append(seconds)
+
+            if self.state == HALF_OPEN:
+                if self.trial_in_flight:
+                    self.trial_in_flight = False
+                    if failed or slow:
+                        self.open("trial call failed")
+                    else:
+                        self.close("trial call succeeded")
+                return
+            if self.state == OPEN:
+                # A call that started before the breaker opened
+                return
+
+            self.outcomes.append((now, failed or slow))
+            while self.outcomes and self.outcomes[0][0] < now - BREAKER_WINDOW_SECONDS:
+                self.outcomes.popleft()
+            bad = sum(1 for _, bad_call in self.outcomes if bad_call)
+            if (
+                len(self.outcomes) >= BREAKER_MIN_CALLS
+                and bad / len(self.outcomes) >= BREAKER_FAILURE_RATE
+            ):
+                self.open(f"{bad} of the last {len(self.outcomes)} calls failed or were slow")
+
+    def track(self, func, *args, is_failure=None, **kwargs):
+        """
+        Calls func, which allow() has let through, and records its outcome.
+        Exceptions and results for which is_failure(result) is true count as
+        failures.
+        """
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(True, time.monotonic() - started)
+            raise
+        self.record(bool(is_failure and is_failure(result)), time.monotonic() - started)
+        return result
+
+    async def track_async(self, func, *args, is_failure=None, **kwargs):
+        started = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self.record(True, time.monotonic() - started)
+            raise
+        self.record(bool(is_failure and is_failure(result)), time.monotonic() - started)
+        return result
+
+    def run_probe(self):
+        started = time.monotonic()
+        try:
+            healthy = self.probe()
+        except Exception as e:
+            logger.info(f"{self.name} health probe failed: {e}")
+            healthy = False
+        elapsed = time.monotonic() - started
+        with self.lock:
+            if self.state != HALF_OPEN:
+                return
+            if healthy and elapsed < self.slow_seconds:
+                self.close("health probe succeeded")
+            else:
+                self.open("health probe failed")
+
+    # Transitions are made with self.lock held
+
+    def open(self, reason):
+        self.opened_at = time.monotonic()
+        self.transition(OPEN, reason)
+
+    def close(self, reason):
+        self.outcomes.clear()
+        self.transition(CLOSED, reason)
+
+    def transition(self, state, reason):
+        logger.warning(f"{self.name} circuit {self.state} -> {state}: {reason}")
+        self.transitions.append(
+            {"at": time.time(), "from": self.state, "to": state, "reason": reason}
+        )
+        self.state = state
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            bad = sum(1 for _, bad_call in self.outcomes if bad_call)
+            return {
+                "state": self.state,
+                "window_calls": len(self.outcomes),
+                "window_failure_rate": bad / len(self.outcomes) if self.outcomes else 0.0,
+                "latency_p50_seconds": percentile(latencies, 0.5),
+                "latency_p95_seconds": percentile(latencies, 0.95),
+                **self.counts,
+                "transitions": list(self.transitions),
+            }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def breaker_metrics():
+    return {name: breaker.metrics() for name, breaker in breakers.items()}
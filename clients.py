@@ -0,0 +1,130 @@
+import asyncio
+import os
+import threading
+import weakref
+
+# Clients are created on first use and cached per process, so importing the app
+# stays cheap and forked workers never share a connection pool.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def per_process(name, factory):
+    key = (name, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def get_twilio_client():
+    def build():
+        # TWILIO_STANDIN=1 swaps in a local stand-in for offline runs
+        if os.getenv("TWILIO_STANDIN") == "1":
+            from twilio_standin import LocalTwilioClient
+
+            return LocalTwilioClient()
+
+        from twilio.rest import Client
+
+        return Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+
+    return per_process("twilio", build)
+
+
+def get_s3_client():
+    def build():
+        import boto3
+        from botocore.config import Config
+
+        # Ensure correct signature version and region are used
+        # Uploads that hang fail fast so the turn can fall back to <Say>
+        my_config = Config(
+            region_name="us-east-2",
+            signature_version="s3v4",
+            connect_timeout=3,
+            read_timeout=float(os.getenv("S3_TIMEOUT", "10")),
+            retries={"max_attempts": 2},
+        )
+
+        # AWS credentials are assumed to be configured via environment or AWS CLI;
+        # S3_ENDPOINT_URL points the client at an S3-compatible server instead
+        return boto3.client(
+            "s3",
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            config=my_config,
+        )
+
+    return per_process("s3", build)
+
+
+def get_http_session():
+    def build():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # Enough pooled connections for every thread that calls out concurrently
+        pool_size = int(os.getenv("HTTP_POOL_SIZE", "32"))
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+        session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+        return session
+
+    return per_process("http", build)
+
+
+# Async clients are bound to the event loop that created them
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def per_loop(name, factory):
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None:
+        client = clients[name] = factory()
+    return client
+
+
+def get_aiohttp_session():
+    def build():
+        import aiohttp
+
+        # One pooled session per loop multiplexes every in-flight turn
+        pool_size = int(os.getenv("AIOHTTP_POOL_SIZE", "200"))
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+
+    return per_loop("aiohttp", build)
+
+
+def get_async_twilio_client():
+    def build():
+        if os.getenv("TWILIO_STANDIN") == "1":
+            return get_twilio_client()
+
+        from twilio.http.async_http_client import AsyncTwilioHttpClient
+        from twilio.rest import Client
+
+        return Client(
+            os.getenv("TWILIO_ACCOUNT_SID"),
+            os.getenv("TWILIO_AUTH_TOKEN"),
+            http_client=AsyncTwilioHttpClient(),
+        )
+
+    return per_loop("twilio", build)
+
+
+async def close_loop_clients():
+    """Closes the running loop's async clients, e.g. on ASGI shutdown."""
+    clients = _loop_clients.pop(asyncio.get_running_loop(), {})
+    if "aiohttp" in clients:
+        await clients["aiohttp"].close()
+    http_client = getattr(clients.get("twilio"), "http_client", None)
+    if http_client is not None and hasattr(http_client, "close"):
+        await http_client.close()
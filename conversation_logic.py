@@ -1,8 +1,19 @@
 import json
-import requests
 import logging
 import os
-from dotenv import load_dotenv
+import re
+from contextvars import ContextVar
+
+if __name__ == "__main__":
+    # Run as the terminal client: load .env before the modules below read their settings
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+from circuit_breaker import CircuitBreaker
+from clients import get_aiohttp_session, get_http_session
+from intent_classifier import INTENT_CONFIDENCE, log_intent_example, predict_intent
+from openai_limiter import estimate_tokens, get_limiter, send, send_async
 from tree import decisionTree
 from user_history import (
     load_user_history,
@@ -11,8 +22,6 @@ from user_history import (
     update_user_info,
 )
 
-load_dotenv()
-
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,14 +29,80 @@ logger = logging.getLogger(__name__)
 # Global variables
 predictionState = "root"
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
+# Fields update_user_history extracts into the history header
+DEMOGRAPHIC_FIELDS = ("fname", "lname", "age", "gender", "height", "weight")
+
+# update_user_history asks for JSON mode, which gpt-4-turbo supports
+JSON_OBJECT = {"type": "json_object"}
+
+# Answers with nothing to extract, recorded without an LLM call
+BARE_ANSWERS = {
+    "yes",
+    "yeah",
+    "yep",
+    "yes i do",
+    "yes i have",
+    "y",
+    "no",
+    "nope",
+    "nah",
+    "no i don't",
+    "no i haven't",
+    "not really",
+    "n",
+}
+
+# (connect, read) timeouts for OpenAI requests, in seconds
+OPENAI_TIMEOUT = (3.05, float(os.getenv("OPENAI_TIMEOUT", "30")))
+
+# OpenAI calls slower than this count against its circuit breaker
+OPENAI_SLOW_SECONDS = float(os.getenv("OPENAI_SLOW_SECONDS", "15"))
+
+# Per-context LLM usage counter, see track_usage()
+openai_usage = ContextVar("openai_usage", default=None)
+
+
+def interpret_response(user_response, question_node, node_name):
+    # Confident local predictions skip the LLM (see intent_classifier.py)
+    local_option = local_interpretation(user_response, node_name)
+    if local_option:
+        return local_option
+
+    llm_response = generate_openai_response(
+        interpretation_prompt(user_response, question_node)
+    )
+    return parse_interpretation(llm_response, user_response, question_node, node_name)
+
 
+async def interpret_response_async(user_response, question_node, node_name):
+    local_option = local_interpretation(user_response, node_name)
+    if local_option:
+        return local_option
 
-def interpret_response(user_response, question_node):
+    llm_response = await generate_openai_response_async(
+        interpretation_prompt(user_response, question_node)
+    )
+    return parse_interpretation(llm_response, user_response, question_node, node_name)
+
+
+def question_options(question_node):
     options = list(question_node.keys())
     options.remove("question")
+    return options
 
-    prompt = f"""
+
+def local_interpretation(user_response, node_name):
+    # Models are per node name: nodes such as weight_child and weight_teen ask the same question
+    prediction = predict_intent(node_name, user_response)
+    if prediction and prediction[1] >= INTENT_CONFIDENCE:
+        logger.info(f"Local intent {prediction[0]} ({prediction[1]:.3f}) for {user_response!r}")
+        return prediction[0]
+    return None
+
+
+def interpretation_prompt(user_response, question_node):
+    options = question_options(question_node)
+    return f"""
     Given the user response: "{user_response}"
     And the question: "{question_node['question']}"
     Interpret the response and categorize it into one of the following options: {', '.join(options)}
@@ -36,80 +111,309 @@ def interpret_response(user_response, question_node):
     Please return only one option from the list above, not multiple options.
     """
 
-    interpreted_response = generate_openai_response(prompt).strip().lower()
+
+def parse_interpretation(llm_response, user_response, question_node, node_name):
+    options = question_options(question_node)
+    if llm_response is None:
+        logger.error("No GPT response for interpretation.")
+        return "invalid"
+    interpreted_response = llm_response.strip().lower()
 
     # Post-processing to ensure only one option is returned
     if interpreted_response in options:
-        return interpreted_response
+        result = interpreted_response
     elif ',' in interpreted_response:
         # If multiple options are returned, take the first one
         first_option = interpreted_response.split(',')[0].strip()
-        return first_option if first_option in options else "invalid"
-    
-    return "invalid"
+        result = first_option if first_option in options else "invalid"
+    else:
+        result = "invalid"
+
+    # Each LLM interpretation is a training example for the local classifier
+    log_intent_example(node_name, user_response, result)
+    return result
+
+
+def track_usage():
+    """
+    Starts counting LLM calls and tokens for the current context (one thread
+    or task) and returns the counter, which later calls update in place.
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    openai_usage.set(usage)
+    return usage
+
+
+def record_usage(usage):
+    counter = openai_usage.get()
+    if counter is None:
+        return
+    counter["calls"] += 1
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        counter[key] += usage.get(key, 0)
+
+
+def openai_base_url():
+    return os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+
+def probe_openai():
+    # Any answer short of a server error means the API is reachable again
+    response = get_http_session().get(
+        f"{openai_base_url()}/models",
+        headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"},
+        timeout=5,
+    )
+    return response.status_code < 500
+
 
+def server_error(response):
+    return response.status_code >= 500
 
-def generate_openai_response(transcript):
-    url = "https://api.openai.com/v1/chat/completions"
+
+openai_breaker = CircuitBreaker("openai", OPENAI_SLOW_SECONDS, probe_openai)
+
+
+def chat_request(transcript, response_format=None):
+    url = f"{openai_base_url()}/chat/completions"
     headers = {
-        "Authorization": f"Bearer {openai_api_key}",
+        "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
         "Content-Type": "application/json",
     }
     data = {
         "model": "gpt-4-turbo",
         "messages": [{"role": "user", "content": transcript}],
     }
-    response = requests.post(url, headers=headers, json=data)
+    if response_format:
+        data["response_format"] = response_format
+    return url, headers, data
+
+
+def read_completion(status_code, body, estimated_tokens):
+    """Returns the reply text of a chat completion, or None if it failed."""
+    if status_code == 200:
+        usage = body.get("usage", {})
+        get_limiter().settle(
+            estimated_tokens, usage.get("total_tokens", estimated_tokens)
+        )
+        record_usage(usage)
+        return body["choices"][0]["message"]["content"]
+    get_limiter().settle(estimated_tokens, 0)
+    return None
+
+
+def generate_openai_response(transcript, response_format=None):
+    """
+    Returns the reply to `transcript`, or None if OpenAI failed, timed out
+    or its circuit is open; callers fall back to a canned answer.
+    """
+    # HTTP clients are imported on first use, like the sessions in clients.py
+    import requests
+
+    if not openai_breaker.allow():
+        logger.warning("OpenAI circuit is open; skipping the request")
+        return None
+
+    url, headers, data = chat_request(transcript, response_format)
+    # Queued behind the shared rate limit; 429s are retried after Retry-After
+    estimated_tokens = estimate_tokens(transcript)
+    try:
+        response = send(
+            lambda: openai_breaker.track(
+                get_http_session().post,
+                url,
+                headers=headers,
+                json=data,
+                timeout=OPENAI_TIMEOUT,
+                is_failure=server_error,
+            ),
+            estimated_tokens,
+        )
+    except requests.RequestException as e:
+        logger.error(f"OpenAI request failed: {str(e)}")
+        return None
     logger.info(f"OpenAI response: {response.status_code}")
+    body = response.json() if response.status_code == 200 else None
+    return read_completion(response.status_code, body, estimated_tokens)
+
+
+async def generate_openai_response_async(transcript, response_format=None):
+    import asyncio
+
+    import aiohttp
+
+    if not openai_breaker.allow():
+        logger.warning("OpenAI circuit is open; skipping the request")
+        return None
+
+    url, headers, data = chat_request(transcript, response_format)
+    estimated_tokens = estimate_tokens(transcript)
+    try:
+        response = await send_async(
+            lambda: openai_breaker.track_async(
+                get_aiohttp_session().post,
+                url,
+                headers=headers,
+                json=data,
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=OPENAI_TIMEOUT[0], sock_read=OPENAI_TIMEOUT[1]
+                ),
+                is_failure=lambda response: response.status >= 500,
+            ),
+            estimated_tokens,
+        )
+        async with response:
+            logger.info(f"OpenAI response: {response.status}")
+            body = await response.json() if response.status == 200 else None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"OpenAI request failed: {str(e)}")
+        return None
+    return read_completion(response.status, body, estimated_tokens)
+
+
+def transcribe_speech(wav_data, language="en"):
+    """
+    Transcribes a caller utterance (WAV bytes) with OpenAI's transcription
+    API. Returns the text, or None if the request failed.
+    """
+    import requests
+
+    if not openai_breaker.allow():
+        logger.warning("OpenAI circuit is open; skipping transcription")
+        return None
+
+    url = f"{openai_base_url()}/audio/transcriptions"
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+    try:
+        response = send(
+            lambda: openai_breaker.track(
+                get_http_session().post,
+                url,
+                headers=headers,
+                data={"model": "whisper-1", "language": language},
+                files={"file": ("utterance.wav", wav_data, "audio/wav")},
+                timeout=OPENAI_TIMEOUT,
+                is_failure=server_error,
+            )
+        )
+    except requests.RequestException as e:
+        logger.error(f"OpenAI transcription failed: {str(e)}")
+        return None
+    logger.info(f"OpenAI transcription response: {response.status_code}")
     if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
+        return response.json()["text"]
     return None
 
 
+def parse_json_object(text):
+    """
+    Returns the first JSON object in an LLM reply, tolerating code fences and
+    surrounding prose, or {} if there is none.
+    """
+    if not text:
+        return {}
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        parsed = json.loads(text[start : end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def is_bare_answer(answer):
+    words = re.sub(r"[^\w\s']", " ", answer.lower()).split()
+    return " ".join(words) in BARE_ANSWERS
+
+
 def update_user_history(question, answer, user_history):
-    prompt = f"""
+    # A bare yes/no holds no demographics and its bullet needs no rewording
+    if is_bare_answer(answer):
+        add_entry_to_history(user_history, [f"- {question} {answer.strip()}"])
+        return user_history
+
+    gpt_response = generate_openai_response(
+        extraction_prompt(question, answer), response_format=JSON_OBJECT
+    )
+    apply_extraction(gpt_response, answer, user_history)
+    return user_history
+
+
+async def update_user_history_async(question, answer, user_history):
+    if is_bare_answer(answer):
+        add_entry_to_history(user_history, [f"- {question} {answer.strip()}"])
+        return user_history
+
+    gpt_response = await generate_openai_response_async(
+        extraction_prompt(question, answer), response_format=JSON_OBJECT
+    )
+    apply_extraction(gpt_response, answer, user_history)
+    return user_history
+
+
+def extraction_prompt(question, answer):
+    return f"""
     Given the question: "{question}"
     And the user's response: "{answer}"
     Extract the following information: fname, lname, age, gender, height, weight.
-    Return the extracted information in the format: {{ "fname": <fname>, "lname": <lname>, "age": <age>, "gender": <gender>, "height": <height>, "weight": <weight> }}.
+    Also create a concise bullet point summary of the key information in the response. Do not have redundancy.
+    Return a JSON object in the format: {{ "fname": <fname>, "lname": <lname>, "age": <age>, "gender": <gender>, "height": <height>, "weight": <weight>, "bullets": ["- <point>", ...] }}.
     If any information is not available, return null for that field.
     """
-    gpt_response = generate_openai_response(prompt)
 
-    try:
-        extracted_info = json.loads(gpt_response)
-        for key, value in extracted_info.items():
-            if value is not None:
-                update_user_info(user_history, key, value)
-    except json.JSONDecodeError:
+
+def apply_extraction(gpt_response, answer, user_history):
+    extracted_info = parse_json_object(gpt_response)
+    if not extracted_info:
         logger.error("Failed to parse GPT response for user information.")
 
-    # Generate bullet points for additional information
-    prompt = f"""
-    Given the question: "{question}"
-    And the user's response: "{answer}"
-    Create a concise bullet point summary of the key information in the response. Do not have redundancy.
-    """
-    gpt_response = generate_openai_response(prompt)
-    bullet_points = [
-        line.strip() for line in gpt_response.strip().split("\n") if line.strip()
-    ]
+    for key in DEMOGRAPHIC_FIELDS:
+        value = extracted_info.get(key)
+        if isinstance(value, str):
+            value = value.strip()
+            if value.lower() in ("", "null", "none", "n/a"):
+                continue
+        if value is not None:
+            update_user_info(user_history, key, value)
+
+    bullets = extracted_info.get("bullets")
+    if isinstance(bullets, str):
+        bullets = bullets.split("\n")
+    if not isinstance(bullets, list):
+        bullets = []
+    bullet_points = [str(line).strip() for line in bullets if str(line).strip()]
+    if not bullet_points:
+        logger.error("No bullet points in GPT response.")
+        bullet_points = [f"- {answer}"]
+    add_entry_to_history(user_history, bullet_points)
 
-    try:
-        if isinstance(bullet_points, list):
-            add_entry_to_history(user_history, bullet_points)
-        else:
-            logger.error("GPT response for bullet points is not a valid list.")
-    except:
-        logger.error("Failed to parse GPT response for bullet points.")
-        add_entry_to_history(user_history, [f"Error processing: {answer}"])
 
-    return user_history
+def rephrase_question(
+    original_question, user_response, invalid_response=False, user_history=None
+):
+    rephrased = generate_openai_response(
+        rephrase_prompt(original_question, user_response, invalid_response, user_history)
+    )
+    if rephrased is None:
+        # Ask the question as written rather than failing the turn
+        return original_question
+    return rephrased.strip('"')
 
 
-def rephrase_question(
+async def rephrase_question_async(
     original_question, user_response, invalid_response=False, user_history=None
 ):
+    rephrased = await generate_openai_response_async(
+        rephrase_prompt(original_question, user_response, invalid_response, user_history)
+    )
+    if rephrased is None:
+        return original_question
+    return rephrased.strip('"')
+
+
+def rephrase_prompt(original_question, user_response, invalid_response, user_history):
     if user_history is None:
         user_history = {"entries": []}
 
@@ -182,41 +486,105 @@ def rephrase_question(
         User history: 
         {user_history_formatted}
         """
+    return context
 
-    return generate_openai_response(context).strip('"')
 
+def triage_turn(prediction_state, user_response, user_history, rephrase=True):
+    """
+    Runs one answer through the decision tree, updating `user_history` in
+    memory only. Returns (next_state, response, understood); next_state is
+    a diagnosis when it is not a node of decisionTree.
+    """
+    current_node = decisionTree[prediction_state]
+    current_question = current_node["question"]
+    interpreted_response = interpret_response(
+        user_response, current_node, prediction_state
+    )
 
-def gpt_call(user_response, phone_number):
-    global predictionState
+    if interpreted_response == "invalid":
+        if rephrase:
+            current_question = rephrase_question(
+                current_question, user_response, True, user_history
+            )
+        return prediction_state, current_question, False
+
+    update_user_history(current_question, user_response, user_history)
+
+    if interpreted_response not in current_node:
+        return (
+            prediction_state,
+            f"I couldn't understand your response. {current_question}",
+            True,
+        )
+
+    next_state = current_node[interpreted_response]
+    if next_state not in decisionTree:
+        return (
+            next_state,
+            f"Based on your answers, you may have {next_state}. Please consult a medical professional for proper diagnosis.",
+            True,
+        )
+
+    next_question = decisionTree[next_state]["question"]
+    if rephrase:
+        next_question = rephrase_question(
+            next_question, user_response, False, user_history
+        )
+    return next_state, next_question, True
 
-    user_history = load_user_history(phone_number)
 
-    current_node = decisionTree[predictionState]
+async def triage_turn_async(
+    prediction_state, user_response, user_history, rephrase=True
+):
+    """Async counterpart of triage_turn()."""
+    current_node = decisionTree[prediction_state]
     current_question = current_node["question"]
-    interpreted_response = interpret_response(user_response, current_node)
+    interpreted_response = await interpret_response_async(
+        user_response, current_node, prediction_state
+    )
 
     if interpreted_response == "invalid":
-        rephrased_question = rephrase_question(
-            current_question, user_response, True, user_history
+        if rephrase:
+            current_question = await rephrase_question_async(
+                current_question, user_response, True, user_history
+            )
+        return prediction_state, current_question, False
+
+    await update_user_history_async(current_question, user_response, user_history)
+
+    if interpreted_response not in current_node:
+        return (
+            prediction_state,
+            f"I couldn't understand your response. {current_question}",
+            True,
+        )
+
+    next_state = current_node[interpreted_response]
+    if next_state not in decisionTree:
+        return (
+            next_state,
+            f"Based on your answers, you may have {next_state}. Please consult a medical professional for proper diagnosis.",
+            True,
         )
-        return rephrased_question
 
-    user_history = update_user_history(current_question, user_response, user_history)
-    save_user_history(phone_number, user_history)
+    next_question = decisionTree[next_state]["question"]
+    if rephrase:
+        next_question = await rephrase_question_async(
+            next_question, user_response, False, user_history
+        )
+    return next_state, next_question, True
 
-    if interpreted_response in current_node:
-        predictionState = current_node[interpreted_response]
-    else:
-        return f"I couldn't understand your response. {current_question}"
 
-    if predictionState not in decisionTree:
-        return f"Based on your answers, you may have {predictionState}. Please consult a medical professional for proper diagnosis."
+def gpt_call(user_response, phone_number):
+    global predictionState
 
-    next_question = decisionTree[predictionState]["question"]
-    rephrased_question = rephrase_question(
-        next_question, user_response, False, user_history
+    user_history = load_user_history(phone_number)
+    predictionState, response, understood = triage_turn(
+        predictionState, user_response, user_history
     )
-    return rephrased_question
+    if understood:
+        save_user_history(phone_number, user_history)
+    return response
 
 
 def terminal():
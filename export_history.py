@@ -0,0 +1,273 @@
+"""
+Exports the user history store (static/user_data) to gzip-compressed JSONL
+for analytics, and answers fleet-level questions from the export instead of
+from the live files.
+
+    python export_history.py export [--out exports] [--full]
+    python export_history.py stats [--out exports]
+
+Each export run writes one visits-<timestamp>.jsonl.gz part holding one
+row per visit: phone number, visit position, the visit time normalized to
+ISO 8601, its notes, and the call outcome (channel, leaf reached, turns)
+when one was recorded. Runs are incremental: export_state.json remembers
+each file's size and mtime, and only visits added since the last run, or
+still being processed by GPT at the time, are exported again. Later parts
+supersede earlier rows for the same visit.
+
+Files are read one at a time, through their visit index when it is fresh,
+and each part lists them in phone number order, so both the export and the
+merge of parts in stats hold at most one patient's visits in memory.
+"""
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from user_history import FOLDER_PATH, index_path, processing_positions
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+STATE_FILE = "export_state.json"
+
+# Visit dates are written as "%m/%d/%Y %I:%M%p"; older records may lack the AM/PM
+VISIT_TIME_FORMATS = ("%m/%d/%Y %I:%M%p", "%m/%d/%Y %I:%M", "%m/%d/%Y %H:%M", "%m/%d/%Y")
+
+# Header fields exported per visit; credentials and free-form state stay behind
+PATIENT_FIELDS = ("age", "gender", "height", "weight")
+
+
+def normalize_visit_time(text):
+    text = text.strip().rstrip("%")
+    for fmt in VISIT_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def read_history(filename):
+    """
+    Returns (header, entries) for one history file. `entries` is an iterator
+    that reads visits one by one through the index when it matches the file.
+    """
+    stat = os.stat(filename)
+    try:
+        with open(index_path(filename)) as f:
+            index = json.load(f)
+        fresh = index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns
+    except (OSError, ValueError, KeyError):
+        fresh = False
+
+    if not fresh:
+        with open(filename) as f:
+            user_history = json.load(f)
+        entries = user_history.pop("entries", [])
+        return user_history, iter(entries)
+
+    def entries():
+        with open(filename, "rb") as f:
+            for offset, length in index["offsets"]:
+                f.seek(offset)
+                yield json.loads(f.read(length))
+
+    return index["header"], entries()
+
+
+def history_phone_number(name):
+    # The store's key for the patient, which the header may not repeat
+    return name[len("user_history_") : -len(".json")]
+
+
+def visit_rows(filename, since_position=0, also=()):
+    header, entries = read_history(filename)
+    outcomes = header.get("visit_outcomes", {})
+    processing = processing_positions(header)
+    patient = {field: header.get(field) for field in PATIENT_FIELDS}
+    phone_number = history_phone_number(os.path.basename(filename))
+
+    last_position = -1
+    for position, entry in enumerate(entries):
+        last_position = position
+        if position < since_position and position not in also:
+            continue
+        for visit_time, notes in entry.items():
+            outcome = outcomes.get(str(position), {})
+            yield {
+                "phone_number": phone_number,
+                "position": position,
+                "visited_at": normalize_visit_time(visit_time),
+                "visit_time_raw": visit_time,
+                "notes": notes,
+                "processing": position in processing,
+                "channel": outcome.get("channel"),
+                "leaf": outcome.get("leaf"),
+                "turns": outcome.get("turns"),
+                **patient,
+            }
+    return last_position + 1, sorted(processing)
+
+
+def load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def save_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def export(folder=FOLDER_PATH, out_dir=EXPORT_DIR, full=False):
+    os.makedirs(out_dir, exist_ok=True)
+    state = {"files": {}} if full else load_state(out_dir)
+    part_name = f"visits-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.jsonl.gz"
+    part_path = os.path.join(out_dir, part_name)
+    totals = {"files": 0, "changed": 0, "rows": 0}
+
+    # Histories are exported in phone number order, which iter_export relies on
+    names = sorted(
+        (
+            name
+            for name in os.listdir(folder)
+            if name.startswith("user_history_") and name.endswith(".json")
+        ),
+        key=history_phone_number,
+    )
+    with gzip.open(f"{part_path}.tmp", "wt", encoding="utf-8") as part:
+        for name in names:
+            path = os.path.join(folder, name)
+            totals["files"] += 1
+            stat = os.stat(path)
+            previous = state["files"].get(name)
+            if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                continue
+
+            totals["changed"] += 1
+            rows = visit_rows(
+                path,
+                previous["visits"] if previous else 0,
+                set(previous["processing"]) if previous else set(),
+            )
+            try:
+                while True:
+                    part.write(json.dumps(next(rows)) + "\n")
+                    totals["rows"] += 1
+            except StopIteration as done:
+                visits, processing = done.value
+            except (OSError, ValueError) as e:
+                print(f"Skipping {name}: {e}")
+                continue
+            state["files"][name] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "visits": visits,
+                "processing": processing,
+            }
+
+    if totals["rows"]:
+        os.replace(f"{part_path}.tmp", part_path)
+    else:
+        os.remove(f"{part_path}.tmp")
+        part_path = None
+    save_state(out_dir, state)
+    return part_path, totals
+
+
+def read_part(path):
+    previous = None
+    with gzip.open(path, "rt", encoding="utf-8") as part:
+        for line in part:
+            row = json.loads(line)
+            if previous is not None and row["phone_number"] < previous:
+                raise ValueError(
+                    f"{path} is not in phone number order; "
+                    "run a --full export into a new directory"
+                )
+            previous = row["phone_number"]
+            yield row
+
+
+def iter_export(out_dir=EXPORT_DIR):
+    """
+    Yields the latest exported row for every visit. The parts are merged by
+    phone number, so only one patient's rows are held at a time; for equal
+    phone numbers, rows from older parts come first and are superseded.
+    """
+    parts = sorted(
+        name
+        for name in os.listdir(out_dir)
+        if name.startswith("visits-") and name.endswith(".jsonl.gz")
+    )
+    rows = heapq.merge(
+        *(read_part(os.path.join(out_dir, name)) for name in parts),
+        key=lambda row: row["phone_number"],
+    )
+    for phone_number, patient_rows in itertools.groupby(rows, key=lambda row: row["phone_number"]):
+        latest = {}
+        for row in patient_rows:
+            latest[(row["position"], row["visit_time_raw"])] = row
+        for row in latest.values():
+            yield {
+                "phone_number": phone_number,
+                "position": row["position"],
+                "visited_at": row["visited_at"],
+                "channel": row["channel"],
+                "leaf": row["leaf"],
+                "turns": row["turns"],
+            }
+
+
+def stats(out_dir=EXPORT_DIR):
+    visits_per_day = Counter()
+    leaves = Counter()
+    channels = Counter()
+    patients = set()
+    call_turns = []
+    visits = 0
+    for row in iter_export(out_dir):
+        visits += 1
+        patients.add(row["phone_number"])
+        visits_per_day[(row["visited_at"] or "unknown")[:10]] += 1
+        channels[row["channel"] or "unrecorded"] += 1
+        if row["leaf"]:
+            leaves[row["leaf"]] += 1
+        if row["channel"] == "call" and row["turns"] is not None:
+            call_turns.append(row["turns"])
+
+    print(f"{visits} visits from {len(patients)} patients")
+    print("Visits per day:")
+    for day, count in sorted(visits_per_day.items()):
+        print(f"  {day}  {count}")
+    print("Channels: " + ", ".join(f"{name} {count}" for name, count in channels.most_common()))
+    print("Leaves reached:")
+    for leaf, count in leaves.most_common():
+        print(f"  {leaf:<35} {count}")
+    if call_turns:
+        print(f"Average turns per call: {sum(call_turns) / len(call_turns):.2f} over {len(call_turns)} calls")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export", "stats"])
+    parser.add_argument("--folder", default=FOLDER_PATH)
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--full", action="store_true", help="ignore the state of earlier runs")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        part_path, totals = export(args.folder, args.out, args.full)
+        print(
+            f"Scanned {totals['files']} histories, {totals['changed']} changed since the last export; "
+            f"wrote {totals['rows']} visits to {part_path or 'nothing (no changes)'}"
+        )
+    else:
+        stats(args.out)
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+from flask import Response, current_app
+
+from state_backend import get_state_backend
+
+logger = logging.getLogger(__name__)
+
+# How long a finished turn's response is replayed to retries of the same webhook
+RESULT_TTL = 300
+
+# How long a retry waits for the in-flight attempt before asking Twilio to try again.
+# Twilio gives up on a webhook after 15 seconds.
+WAIT_TIMEOUT = 14
+
+# Claims older than this belong to a worker that died mid-turn and can be taken over
+CLAIM_TTL = 60
+
+# Expired results and claims are deleted at most this often per process
+SWEEP_INTERVAL = 60
+
+# Local attempts in flight, so a retry on the same worker wakes as soon as it finishes
+in_flight = {}
+in_flight_lock = threading.Lock()
+
+last_sweep = {"at": 0.0}
+sweep_lock = threading.Lock()
+
+
+def webhook_key(request):
+    """
+    Identifies one webhook delivery across Twilio's retries. Twilio sends the
+    same I-Twilio-Idempotency-Token with every retry; without it, the CallSid,
+    the turn number the Gather's action URL carries (see speech_gather) and
+    the exact speech result and confidence fingerprint the turn. The turn
+    number keeps the same answer given at two nodes from sharing a key.
+    """
+    call_sid = request.form.get("CallSid", "")
+    token = request.headers.get("I-Twilio-Idempotency-Token")
+    if token:
+        return f"{call_sid}:{token}"
+
+    fields = [f"turn={request.args.get('turn', '')}"] + [
+        f"{name}={request.form.get(name, '')}"
+        for name in ("CallSid", "SpeechResult", "Confidence", "Digits")
+    ]
+    fingerprint = hashlib.sha256("\n".join(fields).encode("utf-8")).hexdigest()
+    return f"{call_sid}:{fingerprint}"
+
+
+def cached_response(result):
+    return Response(result["body"], status=result["status"], headers=result["headers"])
+
+
+def load_result(state, key):
+    result = state.get_value(f"turn-result:{key}")
+    if result is None:
+        return None
+    if result["expires"] <= time.time():
+        state.delete_value(f"turn-result:{key}")
+        return None
+    return result
+
+
+def sweep_expired(state):
+    """Deletes expired results and claims, at most once per SWEEP_INTERVAL."""
+    with sweep_lock:
+        if time.time() - last_sweep["at"] < SWEEP_INTERVAL:
+            return
+        last_sweep["at"] = time.time()
+    try:
+        deleted = sum(
+            state.delete_expired(prefix, time.time())
+            for prefix in ("turn-result:", "turn-claim:")
+        )
+    except Exception as e:
+        logger.error(f"Failed to sweep expired webhook results: {str(e)}")
+        return
+    if deleted:
+        logger.info(f"Deleted {deleted} expired webhook results and claims")
+
+
+def run_once(key, handler):
+    """
+    Runs `handler` (a Flask view body) once per webhook key. A retry that
+    arrives while the first attempt is running waits for its response; a
+    retry after it finished gets the stored response back immediately.
+    """
+    state = get_state_backend()
+    sweep_expired(state)
+    result = load_result(state, key)
+    if result:
+        logger.info(f"Replaying stored response for retried webhook {key}")
+        return cached_response(result)
+
+    if not claim_turn(state, key):
+        logger.info(f"Webhook {key} is already in flight, waiting for its response")
+        return wait_for_result(state, key)
+
+    with in_flight_lock:
+        finished = in_flight.setdefault(key, threading.Event())
+    try:
+        response = current_app.make_response(handler())
+        store_result(
+            state, key, response.get_data(as_text=True), response.status_code, response.headers
+        )
+        # Retries look for the result before the claim, so the claim is done
+        state.delete_value(f"turn-claim:{key}")
+        return response
+    except Exception:
+        state.delete_value(f"turn-claim:{key}")
+        raise
+    finally:
+        finished.set()
+        with in_flight_lock:
+            in_flight.pop(key, None)
+
+
+def claim_turn(state, key):
+    claim_key = f"turn-claim:{key}"
+    if state.set_value_if_absent(claim_key, {"expires": time.time() + CLAIM_TTL}):
+        return True
+    claim = state.get_value(claim_key)
+    if claim is None or claim["expires"] < time.time():
+        state.set_value(claim_key, {"expires": time.time() + CLAIM_TTL})
+        return True
+    return False
+
+
+def store_result(state, key, body, status, headers):
+    result = {
+        "body": body,
+        "status": status,
+        "headers": {
+            name: value
+            for name, value in headers.items()
+            if name in ("Content-Type", "Location")
+        },
+        "expires": time.time() + RESULT_TTL,
+    }
+    state.set_value(f"turn-result:{key}", result)
+
+
+async def run_once_async(key, handler):
+    """
+    run_once() for the ASGI app: `handler` is a coroutine function returning
+    (status, headers, body) and the result is returned in the same form.
+    """
+    # State backend calls run off the loop: a SQLite write can wait on a lock
+    # for seconds, which would stall every turn in flight on the loop
+    state = get_state_backend()
+    await asyncio.to_thread(sweep_expired, state)
+    result = await asyncio.to_thread(load_result, state, key)
+    if result:
+        logger.info(f"Replaying stored response for retried webhook {key}")
+        return result["status"], result["headers"], result["body"]
+
+    if not await asyncio.to_thread(claim_turn, state, key):
+        logger.info(f"Webhook {key} is already in flight, waiting for its response")
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            result = await asyncio.to_thread(load_result, state, key)
+            if result:
+                return result["status"], result["headers"], result["body"]
+        return 503, {"Content-Type": "text/plain"}, "Turn still in progress"
+
+    try:
+        status, headers, body = await handler()
+    except Exception:
+        await asyncio.to_thread(state.delete_value, f"turn-claim:{key}")
+        raise
+    await asyncio.to_thread(store_result, state, key, body, status, headers)
+    await asyncio.to_thread(state.delete_value, f"turn-claim:{key}")
+    return status, headers, body
+
+
+def wait_for_result(state, key):
+    with in_flight_lock:
+        finished = in_flight.get(key)
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        if finished is not None:
+            finished.wait(0.1)
+        else:
+            # The attempt is running on another worker
+            time.sleep(0.1)
+        result = load_result(state, key)
+        if result:
+            return cached_response(result)
+
+    # Still running; a 503 makes Twilio retry, by which time the result is stored
+    return Response("Turn still in progress", status=503)
@@ -1,27 +1,62 @@
+# Load environment variables first: the project modules imported below read
+# their settings when imported
+from dotenv import load_dotenv
+
+load_dotenv()
+
 from datetime import datetime
+import gzip
 import logging
+import math
 import re
 from flask import (
+    Blueprint,
     Flask,
+    current_app,
+    g,
     redirect,
     request,
     render_template,
     jsonify,
     Response,
+    stream_template,
     stream_with_context,
+    send_file,
     session,
     url_for,
 )
-from twilio.twiml.voice_response import VoiceResponse, Gather
+from twilio.twiml.voice_response import VoiceResponse, Connect, Gather
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
-from dotenv import load_dotenv
 import os
 import time
-from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor
 from tts import text_to_speech
 import json
-from user_history import finalize_call, load_user_history, save_user_history
+from clients import get_twilio_client
+from state_backend import get_state_backend
+from idempotency import run_once, webhook_key
+from speculation import discard_speculation, speculate, take_speculation
+from openai_limiter import PRIORITY_VOICE, get_limiter, openai_priority
+from circuit_breaker import breaker_metrics
+from audio_store import AUDIO_MAX_AGE, audio_path
+import profiler
+from auth import is_admin
+from assets import ASSET_MAX_AGE, asset_url, find_asset
+from user_history import (
+    RECORD_PAGE_SIZE,
+    close_current_call,
+    finalize_call,
+    history_lock,
+    iter_history_entries,
+    load_history_page,
+    load_user_history,
+    mark_processing,
+    patch_history_entry,
+    processing_positions,
+    read_history_index,
+    save_user_history,
+    write_history_file,
+)
 from conversation_logic import (
     generate_openai_response,
     interpret_response,
@@ -29,32 +64,75 @@ from conversation_logic import (
     rephrase_question,
 )
 from tree import decisionTree
+from sms_buffer import buffer_message
+from campaigns import (
+    campaign_progress,
+    create_campaign,
+    record_call_status,
+    resume_campaigns,
+    start_dispatcher,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY")
-CORS(app)
+bp = Blueprint("main", __name__)
+# Templates link static assets with asset_url() (see assets.py)
+bp.add_app_template_global(asset_url)
+
+
+def create_app():
+    app = Flask(__name__)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY")
+
+    from flask_cors import CORS
+
+    CORS(app)
+    app.register_blueprint(bp)
+
+    # Continue any campaigns a previous process left unfinished
+    resume_campaigns(dispatch_campaign_target)
+    return app
+
+
+# Twilio settings are read on use so they are picked up after load_dotenv
+def twilio_phone_number():
+    return os.getenv("TWILIO_PHONE_NUMBER")
+
+
+def ngrok_url():
+    return os.getenv("NGROK_URL")
+
+
+# VOICE_MODE=gather plays S3-hosted prompts and listens with <Gather>;
+# VOICE_MODE=stream connects calls to the Media Streams websocket at MEDIA_STREAM_URL
+def voice_mode():
+    return os.getenv("VOICE_MODE", "gather")
+
+
+def media_stream_url():
+    return os.getenv("MEDIA_STREAM_URL")
+
+
+# Conversation transcripts and decision tree positions live in the state
+# backend (see state_backend.py) so any worker can serve any conversation.
+def tree_key(conversation_id):
+    return f"tree:{conversation_id}"
 
-# Load environment variables
-load_dotenv()
 
-# Twilio and OpenAI credentials
-account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-openai_api_key = os.getenv("OPENAI_API_KEY")
-twilio_phone_number = os.getenv("TWILIO_PHONE_NUMBER")
-ngrok_url = os.getenv("NGROK_URL")
-print("ngrok_url: ", ngrok_url)
-print("eleven_api_key: ", os.getenv("ELEVEN_API_KEY"))
-# Twilio client
-client = Client(account_sid, auth_token)
-
-# Global variables
-predictionState = "root"
-conversation_history = {}
+# Long-polls are held for less than common proxy idle timeouts (30-60s)
+LONG_POLL_MAX_SECONDS = 25
+
+# JSON responses smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+
+# Work that should not hold up a response (e.g. structuring webform reasons with GPT)
+background_tasks = ThreadPoolExecutor(max_workers=4)
+
+# Pre-synthesized campaign welcome audio per language: language -> (url, expires_at)
+welcome_audio_urls = {}
+WELCOME_AUDIO_TTL = 3000  # Presigned URLs are valid for an hour
 
 language_mappings = {
     "en": {
@@ -93,29 +171,87 @@ language_mappings = {
 }
 
 
-@app.route("/get_conversation", methods=["GET"])
+def speech_gather(language, turn=0):
+    # Twilio retries repeat the action URL, so the turn number tells a retry
+    # from the next answer (see idempotency.webhook_key)
+    return Gather(
+        input="speech",
+        language=language_mappings[language]["gather_language"],
+        action=f"{ngrok_url()}/handle_input?language={language}&turn={turn}",
+        method="POST",
+        speechTimeout=1,
+        timeout=8,
+        partial_result_callback=f"{ngrok_url()}/partial_input",
+        partial_result_callback_method="POST",
+    )
+
+
+def stream_twiml(to_number, language):
+    twiml = VoiceResponse()
+    connect = Connect()
+    stream = connect.stream(url=f"{media_stream_url()}/media-stream")
+    stream.parameter(name="to_number", value=to_number)
+    stream.parameter(name="language", value=language)
+    twiml.append(connect)
+    # Reached when the stream closes after the last prompt
+    twiml.hangup()
+    return twiml
+
+
+def json_response(payload):
+    """JSON response, gzipped when it is large and the client accepts gzip."""
+    body = json.dumps(payload).encode()
+    response = Response(body, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get(
+        "Accept-Encoding", ""
+    ):
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@bp.route("/get_conversation", methods=["GET"])
 def get_conversation():
-    global conversation_history
+    """
+    Without `since`, returns the whole transcript as a list. With `since=N`,
+    returns {"messages": [...], "next": M} holding only the messages after the
+    first N; pass `next` back as `since` on the following request. `wait=S`
+    holds the request up to S seconds (at most LONG_POLL_MAX_SECONDS) until
+    a message arrives, returning an empty list on timeout.
+    """
     call_sid = request.args.get("call_sid")
-    if call_sid in conversation_history:
-        return jsonify(conversation_history[call_sid])
-    return jsonify([])
+    state = get_state_backend()
+    if "since" not in request.args:
+        return json_response(state.get_messages(call_sid))
+
+    since = request.args.get("since", 0, type=int)
+    wait = request.args.get("wait", 0, type=float)
+    if not (math.isfinite(since) and math.isfinite(wait)) or since < 0 or wait < 0:
+        return jsonify({"error": "since and wait must be finite and not negative"}), 400
+
+    if wait:
+        messages = state.wait_for_messages(
+            call_sid, since, min(wait, LONG_POLL_MAX_SECONDS)
+        )
+    else:
+        messages = state.get_messages(call_sid, since)
+    return json_response({"messages": messages, "next": since + len(messages)})
 
 
-@app.route("/", methods=["GET", "POST"])
+@bp.route("/", methods=["GET", "POST"])
 def index():
     return render_template("index.html")
 
 
-@app.route("/webform")
+@bp.route("/webform")
 def webform():
     return render_template("webform.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     language = session.get("language", "en")
-    global predictionState, conversation_history
     if request.method == "POST":
         to_number = request.form["to_number"]
         to_number = "".join(filter(str.isdigit, to_number))
@@ -135,7 +271,6 @@ def login():
 
             if contact_method == "call":
                 twiml = VoiceResponse()
-                predictionState = "root"
                 root_question = decisionTree["root"]["question"]
 
                 if user_history["fname"]:
@@ -151,31 +286,28 @@ def login():
                         language_mappings[language]["welcome"] + " " + root_question
                     )
 
-                # Generate speech file and get S3 URL
-                s3_url = text_to_speech(speech_text, language)
-                if s3_url:
-                    print(f"Audio data URL: {s3_url[:100]}...")
-                    twiml.play(s3_url)
+                if voice_mode() == "stream":
+                    # The greeting is spoken over the stream once the call connects
+                    twiml = stream_twiml(to_number, language)
                 else:
-                    twiml.say(
-                        "I'm sorry, I couldn't generate the audio. Let's try again."
-                    )
+                    # Generate speech file and get S3 URL
+                    with openai_priority(PRIORITY_VOICE):
+                        s3_url = text_to_speech(speech_text, language)
+                    if s3_url:
+                        print(f"Audio data URL: {s3_url[:100]}...")
+                        twiml.play(s3_url)
+                    else:
+                        twiml.say(
+                            "I'm sorry, I couldn't generate the audio. Let's try again."
+                        )
 
-                gather = Gather(
-                    input="speech",
-                    language=language_mappings[language]["gather_language"],
-                    action=f"{ngrok_url}/handle_input?language={language}",
-                    method="POST",
-                    speechTimeout=1,
-                    timeout=8,
-                )
-                twiml.append(gather)
+                    twiml.append(speech_gather(language))
 
-                call = client.calls.create(
+                call = get_twilio_client().calls.create(
                     twiml=str(twiml),
                     to=to_number,
-                    from_=twilio_phone_number,
-                    status_callback=f"{ngrok_url}/call_status",
+                    from_=twilio_phone_number(),
+                    status_callback=f"{ngrok_url()}/call_status",
                     status_callback_event=[
                         "completed",
                         "busy",
@@ -185,12 +317,10 @@ def login():
                     ],
                 )
 
-                # Add the first message to conversation history
-                if call.sid not in conversation_history:
-                    conversation_history[call.sid] = []
-                conversation_history[call.sid].append(
-                    {"speaker": "ai", "text": speech_text}
-                )
+                # Start the call at the root of the tree and record the first message
+                state = get_state_backend()
+                state.set_value(tree_key(call.sid), "root")
+                state.append_message(call.sid, {"speaker": "ai", "text": speech_text})
 
                 logger.info(f"Initiating call to {to_number}. Call SID: {call.sid}")
                 return render_template(
@@ -200,17 +330,18 @@ def login():
                 logger.info(f"Initiating text conversation with {to_number}")
 
                 # Send initial text message
-                message = client.messages.create(
+                message = get_twilio_client().messages.create(
                     body=language_mappings[language]["welcome"],
-                    from_=twilio_phone_number,
+                    from_=twilio_phone_number(),
                     to=to_number,
                 )
 
-                # Add the first message to conversation history
-                if message.sid not in conversation_history:
-                    conversation_history[message.sid] = []
-                conversation_history[message.sid].append(
-                    {"speaker": "ai", "text": language_mappings[language]["welcome"]}
+                # SMS replies are matched by phone number, so the tree position is kept per phone
+                state = get_state_backend()
+                state.set_value(tree_key(to_number), "root")
+                state.append_message(
+                    message.sid,
+                    {"speaker": "ai", "text": language_mappings[language]["welcome"]},
                 )
 
                 logger.info(
@@ -228,21 +359,44 @@ def login():
     return render_template("login.html")
 
 
-@app.route("/sms", methods=["POST"])
+@bp.route("/sms", methods=["POST"])
 def handle_sms():
     language = session.get("language", "en")
-    global predictionState, conversation_history
 
     incoming_msg = request.values.get("Body", "").lower()
     from_number = request.values.get("From", "")
 
-    user_history = load_user_history(from_number)
+    # Fragments sent in quick succession are merged into one turn; the reply
+    # is sent through the REST API once the burst is over.
+    buffer_message(
+        from_number,
+        incoming_msg,
+        lambda merged_msg: run_sms_turn(from_number, merged_msg, language),
+    )
+
+    return str(MessagingResponse())
+
+
+def run_sms_turn(from_number, incoming_msg, language):
+    """
+    Runs the conversation logic for one (possibly merged) SMS turn and
+    returns a callback that commits it. Nothing is saved or sent until the
+    callback runs, so a turn superseded by newer fragments leaves no trace.
+    """
+    state = get_state_backend()
+    next_state = None
+    finished = False
 
     # Process the incoming message using the same conversation logic
     try:
+        user_history = load_user_history(from_number)
+        predictionState = state.get_value(tree_key(from_number), "root")
+        next_state = predictionState
         current_node = decisionTree[predictionState]
         current_question = current_node["question"]
-        interpreted_response = interpret_response(incoming_msg, current_node)
+        interpreted_response = interpret_response(
+            incoming_msg, current_node, predictionState
+        )
 
         new_user_history = update_user_history(
             current_question, incoming_msg, user_history
@@ -254,41 +408,58 @@ def handle_sms():
             )
         else:
             if interpreted_response in current_node:
-                predictionState = current_node[interpreted_response]
+                next_state = current_node[interpreted_response]
             else:
                 ai_response = f"{language_mappings[language]['couldnt_understand']} {current_question}"
 
-            if predictionState not in decisionTree:
+            if next_state not in decisionTree:
                 ai_response = language_mappings[language][
                     "consult_professional"
-                ].format(predictionState)
-                finalize_call(user_history)
+                ].format(next_state)
+                finished = True
             else:
-                next_question = decisionTree[predictionState]["question"]
+                next_question = decisionTree[next_state]["question"]
                 ai_response = rephrase_question(
                     next_question, incoming_msg, False, user_history
                 )
+    except Exception as e:
+        logger.error(f"Error processing SMS: {str(e)}")
+        ai_response = language_mappings[language]["error_occurred"]
+        user_history = None
 
-        save_user_history(from_number, user_history)
-
-        # Send the response back via SMS
-        resp = MessagingResponse()
-        resp.message(ai_response)
+    def commit():
+        try:
+            if user_history is not None:
+                state.set_value(tree_key(from_number), next_state)
+                if finished:
+                    close_current_call(
+                        user_history, {"channel": "sms", "leaf": next_state}
+                    )
+                save_user_history(from_number, user_history)
 
-        return str(resp)
+            # Send the response back via SMS
+            get_twilio_client().messages.create(
+                body=ai_response,
+                from_=twilio_phone_number(),
+                to=from_number,
+            )
+        except Exception as e:
+            logger.error(f"Error sending SMS reply: {str(e)}")
 
-    except Exception as e:
-        logger.error(f"Error processing SMS: {str(e)}")
-        resp = MessagingResponse()
-        resp.message(language_mappings[language]["error_occurred"])
-        return str(resp)
+    return commit
 
 
-@app.route("/handle_input", methods=["POST"])
+@bp.route("/handle_input", methods=["POST"])
 def handle_input():
+    # Twilio retries slow webhooks; each turn runs once and retries share its response
+    with openai_priority(PRIORITY_VOICE):
+        return run_once(webhook_key(request), handle_input_turn)
+
+
+def handle_input_turn():
     language = request.args.get("language", session.get("language", "en"))
     print("language in handle_input:", language)
-    global predictionState, conversation_history
+    state = get_state_backend()
     try:
         logger.info("handle_input called")
 
@@ -307,75 +478,33 @@ def handle_input():
             user_history = load_user_history(to_number)
 
             # Store user input in conversation history
-            if call_sid not in conversation_history:
-                conversation_history[call_sid] = []
-            conversation_history[call_sid].append(
-                {"speaker": "user", "text": user_input}
-            )
+            state.append_message(call_sid, {"speaker": "user", "text": user_input})
 
             try:
-                current_node = decisionTree[predictionState]
-                current_question = current_node["question"]
-                interpreted_response = interpret_response(user_input, current_node)
-
-                # Still update user information if doesn't answer question
-                new_user_history = update_user_history(
-                    current_question, user_input, user_history
+                ai_response, action = voice_turn(
+                    call_sid, to_number, user_input, language, user_history
                 )
-                if interpreted_response == "invalid":
-                    ai_response = rephrase_question(
-                        current_question, user_input, True, new_user_history
-                    )
-                else:
-                    if interpreted_response in current_node:
-                        predictionState = current_node[interpreted_response]
-                    else:
-                        ai_response = f"{language_mappings[language]['couldnt_understand']} {current_question}"
-
-                    if predictionState not in decisionTree:
-                        ai_response = language_mappings[language][
-                            "consult_professional"
-                        ].format(predictionState)
-                        logger.info(f"AI response: {ai_response}")
-                        redirect_url = finalize_call(user_history)
-                        s3_url = text_to_speech(ai_response, language)
-
-                        if language != 'en':
-                            twiml.pause(length=7)  
-
-                        if s3_url:
-                            twiml.play(s3_url)
-                        else:
-                            twiml.say(ai_response)
-
-                        twiml.hangup()
-                        return str(twiml)
-                    else:
-                        next_question = decisionTree[predictionState]["question"]
-                        ai_response = rephrase_question(
-                            next_question, user_input, False, user_history
-                        )
-
                 logger.info(f"AI response: {ai_response}")
 
-                if ai_response.lower() == "stop call":
+                if action == "stop":
                     redirect_url = finalize_call(user_history)
-                    ai_response = language_mappings[language]["thank_you"]
                     twiml.say(ai_response)
                     twiml.hangup()
                     return redirect(redirect_url)
-                else:
-                    s3_url = text_to_speech(ai_response, language)
 
-                    if language != 'en':
-                        twiml.pause(length=7)  
+                s3_url = text_to_speech(ai_response, language)
 
-                    if s3_url:
-                        twiml.play(s3_url)
-                    else:
-                        twiml.say(ai_response)
+                if language != 'en':
+                    twiml.pause(length=7)  
 
-                save_user_history(to_number, user_history)
+                if s3_url:
+                    twiml.play(s3_url)
+                else:
+                    twiml.say(ai_response)
+
+                if action == "diagnosis":
+                    twiml.hangup()
+                    return str(twiml)
             except Exception as e:
                 logger.error(f"Error processing input: {str(e)}")
                 ai_response = language_mappings[language]["error_processing"]
@@ -386,22 +515,12 @@ def handle_input():
                 return redirect(redirect_url)
 
             # Store AI response in conversation history
-            conversation_history[call_sid].append(
-                {"speaker": "ai", "text": ai_response}
-            )
+            state.append_message(call_sid, {"speaker": "ai", "text": ai_response})
 
         # Always add a new Gather unless we're hanging up
         if "hangup" not in twiml.verbs:
             print("language in gather:", language)
-            gather = Gather(
-                input="speech",
-                language=language_mappings[language]["gather_language"],
-                action=f"{ngrok_url}/handle_input?language={language}",
-                method="POST",
-                speechTimeout=1,
-                timeout=8,
-            )
-            twiml.append(gather)
+            twiml.append(speech_gather(language, request.args.get("turn", 0, type=int) + 1))
             print("twiml in gather")
 
         logger.info(f"Returning TwiML: {twiml}")
@@ -409,7 +528,7 @@ def handle_input():
         # Update the call with the new TwiML
         if call_sid:
             try:
-                client.calls(call_sid).update(twiml=str(twiml))
+                get_twilio_client().calls(call_sid).update(twiml=str(twiml))
                 logger.info(f"Updated call {call_sid} with new TwiML")
             except Exception as e:
                 logger.error(f"Error updating call {call_sid}: {str(e)}")
@@ -428,27 +547,164 @@ def handle_input():
         redirect_url = finalize_call(user_history)
 
         # Send a text message to continue the conversation
-        client.messages.create(
+        get_twilio_client().messages.create(
             body=f"{error_message} The call has been disconnected due to unknown issues. Please text this number to continue the conversation.",
-            from_=twilio_phone_number,
+            from_=twilio_phone_number(),
             to=to_number,
         )
 
         return redirect(redirect_url)
 
 
-@app.route("/stream/<call_sid>")
+def voice_turn(call_sid, to_number, user_input, language, user_history):
+    """
+    Advances a call's decision tree by one caller answer and saves the
+    caller's history. Returns (ai_response, action), where action is
+    "continue", "diagnosis" (a leaf was reached) or "stop". Shared by the
+    Gather webhook and Media Streams calls.
+    """
+    state = get_state_backend()
+    predictionState = state.get_value(tree_key(call_sid), "root")
+    current_node = decisionTree[predictionState]
+    current_question = current_node["question"]
+    action = "continue"
+
+    # Reuse work started on the caller's partial transcript if it matches
+    speculation = take_speculation(call_sid, user_input, predictionState)
+    if speculation:
+        interpreted_response, speculated_history = speculation
+        user_history.clear()
+        user_history.update(speculated_history)
+    else:
+        interpreted_response = interpret_response(
+            user_input, current_node, predictionState
+        )
+
+        # Still update user information if doesn't answer question
+        update_user_history(current_question, user_input, user_history)
+
+    if interpreted_response == "invalid":
+        ai_response = rephrase_question(
+            current_question, user_input, True, user_history
+        )
+    else:
+        if interpreted_response in current_node:
+            predictionState = current_node[interpreted_response]
+            state.set_value(tree_key(call_sid), predictionState)
+        else:
+            ai_response = f"{language_mappings[language]['couldnt_understand']} {current_question}"
+
+        if predictionState not in decisionTree:
+            ai_response = language_mappings[language]["consult_professional"].format(
+                predictionState
+            )
+            action = "diagnosis"
+        else:
+            next_question = decisionTree[predictionState]["question"]
+            ai_response = rephrase_question(
+                next_question, user_input, False, user_history
+            )
+
+    return finish_voice_turn(
+        call_sid, to_number, language, user_history, ai_response, action, predictionState
+    )
+
+
+def finish_voice_turn(
+    call_sid, to_number, language, user_history, ai_response, action, predictionState
+):
+    """
+    Shared end of voice_turn and its async counterpart in asgi.py: applies a
+    "stop call" reply, closes the visit when the call is ending, and saves.
+    """
+    if action == "continue" and ai_response.lower() == "stop call":
+        ai_response = language_mappings[language]["thank_you"]
+        action = "stop"
+
+    if action != "continue":
+        turns = sum(
+            1
+            for message in get_state_backend().get_messages(call_sid)
+            if message.get("speaker") == "user"
+        )
+        close_current_call(
+            user_history,
+            {
+                "channel": "call",
+                "leaf": predictionState if action == "diagnosis" else None,
+                "turns": turns,
+            },
+        )
+    save_user_history(to_number, user_history)
+    return ai_response, action
+
+
+def stream_greeting(call_sid):
+    # The first message recorded when the call was placed
+    messages = get_state_backend().get_messages(call_sid)
+    return messages[0]["text"] if messages else None
+
+
+def run_stream_turn(call_sid, to_number, user_input, language):
+    """
+    Media Streams counterpart of handle_input_turn: records the turn in the
+    conversation and returns (ai_response, action) for the stream to speak.
+    """
+    if not user_input:
+        logger.warning("No speech recognized in media stream utterance")
+        return language_mappings[language]["didnt_catch"], "continue"
+
+    state = get_state_backend()
+    state.append_message(call_sid, {"speaker": "user", "text": user_input})
+    user_history = load_user_history(to_number)
+    try:
+        with openai_priority(PRIORITY_VOICE):
+            ai_response, action = voice_turn(
+                call_sid, to_number, user_input, language, user_history
+            )
+    except Exception as e:
+        logger.error(f"Error processing streamed input: {str(e)}")
+        ai_response = language_mappings[language]["error_processing"]
+        action = "stop"
+        close_current_call(user_history)
+        save_user_history(to_number, user_history)
+
+    logger.info(f"AI response: {ai_response}")
+    state.append_message(call_sid, {"speaker": "ai", "text": ai_response})
+    return ai_response, action
+
+
+@bp.route("/partial_input", methods=["POST"])
+def partial_input():
+    # Interim transcripts from Gather's partialResultCallback
+    call_sid = request.form.get("CallSid")
+    stable_text = request.form.get("StableSpeechResult", "")
+    if call_sid and stable_text:
+        node_name = get_state_backend().get_value(tree_key(call_sid), "root")
+        if node_name in decisionTree:
+            speculate(
+                call_sid,
+                request.form.get("To"),
+                stable_text,
+                node_name,
+                decisionTree[node_name],
+            )
+    return "", 204
+
+
+@bp.route("/stream/<call_sid>")
 def stream(call_sid):
     def event_stream():
+        state = get_state_backend()
         last_message_index = 0
         while True:
-            if call_sid in conversation_history:
-                current_messages = conversation_history[call_sid]
-                if last_message_index < len(current_messages):
-                    for message in current_messages[last_message_index:]:
-                        yield f"data: {json.dumps(message)}\n\n"
-                    last_message_index = len(current_messages)
-            time.sleep(0.5)
+            # Blocks until a message is appended by any worker, or sends a keep-alive
+            new_messages = state.wait_for_messages(call_sid, last_message_index)
+            if not new_messages:
+                yield ": keep-alive\n\n"
+            for message in new_messages:
+                yield f"data: {json.dumps(message)}\n\n"
+            last_message_index += len(new_messages)
 
     return Response(
         stream_with_context(event_stream()), content_type="text/event-stream"
@@ -465,8 +721,7 @@ def read_medical_record(file_path):
 
 # Utility to write to the JSON file
 def write_medical_record(data, file_path):
-    with open(file_path, "w") as file:
-        json.dump(data, file, indent=4)
+    write_history_file(data, file_path)
 
 
 def add_entry_to_medical_record(new_entries, file_path):
@@ -481,7 +736,16 @@ def add_entry_to_medical_record(new_entries, file_path):
     write_medical_record(record, file_path)
 
 
-@app.route("/medical-record", methods=["GET"])
+def medical_record_path(phone_number):
+    # Sanitize the phone number to prevent directory traversal
+    phone_number = "".join(filter(str.isalnum, phone_number))
+
+    # Construct the JSON file path -- need + beforehand because queryargs doesn't accept +
+    json_file = f"user_history_+{phone_number}.json"
+    return os.path.join(current_app.root_path, "static", "user_data", json_file)
+
+
+@bp.route("/medical-record", methods=["GET"])
 def medical_record():
     # Get the phone number from query parameters
     phone_number = request.args.get("phone_number")
@@ -489,52 +753,78 @@ def medical_record():
     if not phone_number:
         return "Phone number is required", 400
 
-    # Sanitize the phone number to prevent directory traversal
-    phone_number = "".join(filter(str.isalnum, phone_number))
+    json_file_path = medical_record_path(phone_number)
+    # Only the index is read up front; visits are read from disk as the page streams
+    index = read_history_index(json_file_path)
+    if index is None:
+        record, entries, next_cursor = {}, iter(()), None
+    else:
+        record = index["header"]
+        entries = iter_history_entries(json_file_path, index)
+        visit_count = len(index["offsets"])
+        next_cursor = (
+            visit_count - RECORD_PAGE_SIZE if visit_count > RECORD_PAGE_SIZE else None
+        )
 
-    # Construct the JSON file path -- need + beforehand because queryargs doesn't accept +
-    json_file = f"user_history_+{phone_number}.json"
-    json_file_path = os.path.join(app.root_path, "static", "user_data", json_file)
-    # Read the medical record data from the JSON file
-    record = read_medical_record(json_file_path)
+    # Stream the medical-record.html template so the header and latest visits arrive first
+    return stream_template(
+        "medical-record.html",
+        record=record,
+        entries=entries,
+        processing=processing_positions(record),
+        next_cursor=next_cursor,
+        phone_number="".join(filter(str.isalnum, phone_number)),
+    )
+
+
+@bp.route("/api/medical-record", methods=["GET"])
+def medical_record_page():
+    phone_number = request.args.get("phone_number")
+
+    if not phone_number:
+        return jsonify({"error": "Phone number is required"}), 400
 
-    # Render the medical-record.html template and pass the record data
-    return render_template("medical-record.html", record=record)
+    cursor = request.args.get("cursor", type=int)
+    limit = min(request.args.get("limit", RECORD_PAGE_SIZE, type=int), 100)
+    page = load_history_page(medical_record_path(phone_number), cursor, max(limit, 1))
+    return jsonify(page)
 
 
-@app.route("/set_language", methods=["POST"])
+@bp.route("/set_language", methods=["POST"])
 def set_language():
     language = request.form.get("language")
     session["language"] = language
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 
-@app.template_filter("remove_trailing_punctuation")
+@bp.app_template_filter("remove_trailing_punctuation")
 def remove_trailing_punctuation(text):
     return re.sub(r"[.!?]+$", "", text)
 
 
-@app.route("/call_status", methods=["POST"])
+@bp.route("/call_status", methods=["POST"])
 def call_status():
     call_sid = request.form.get("CallSid")
     call_status = request.form.get("CallStatus")
     to_number = request.form.get("To")
 
+    record_call_status(call_sid, call_status)
+
     if call_status in ["completed", "busy", "no-answer", "failed", "canceled"]:
         print("Call status:", call_status)
+        discard_speculation(call_sid)
         user_history = load_user_history(to_number)
         finalize_call(user_history)
         save_user_history(to_number, user_history)
 
         # Store the call status and medical record URL
-        if call_sid not in conversation_history:
-            conversation_history[call_sid] = []
-        conversation_history[call_sid].append(
+        get_state_backend().append_message(
+            call_sid,
             {
                 "type": "call_status",
                 "status": call_status,
                 "medical_record_url": url_for(
-                    "medical_record", phone_number=to_number[1:]
+                    "main.medical_record", phone_number=to_number[1:]
                 ),
             }
         )
@@ -543,7 +833,7 @@ def call_status():
     return "", 204  # No content response
 
 
-@app.route("/submit_webform", methods=["POST"])
+@bp.route("/submit_webform", methods=["POST"])
 def submit_webform():
     # Get form data
     first_name = request.form.get("first_name")
@@ -564,9 +854,54 @@ def submit_webform():
         - ((today.month, today.day) < (birth_date.month, birth_date.day))
     )
 
+    # Construct the JSON file path
+    json_file = f"user_history_{phone_number}.json"
+    json_file_path = os.path.join(current_app.root_path, "static", "user_data", json_file)
+
+    with history_lock(json_file_path):
+        # Read existing user history
+        user_history = read_medical_record(json_file_path)
+
+        # Update user information
+        user_history["fname"] = first_name
+        user_history["lname"] = last_name
+        user_history["age"] = str(age)
+        user_history["gender"] = gender
+        user_history["height"] = height
+        user_history["weight"] = weight
+        user_history["phone_number"] = phone_number
+
+        # Add new entry with the raw reason; GPT structures it in the background
+        current_time = datetime.now().strftime("%m/%d/%Y %I:%M%p")
+        new_entry = {current_time: ["- Patient filled out webform.", f"- {reason}"]}
+
+        if "entries" not in user_history:
+            user_history["entries"] = []
+        user_history["entries"].append(new_entry)
+        position = len(user_history["entries"]) - 1
+        mark_processing(user_history, position)
+
+        # Write updated user history back to file
+        write_medical_record(user_history, json_file_path)
+
+    background_tasks.submit(
+        process_webform_reason, json_file_path, position, current_time, reason
+    )
+
+    # Redirect to medical history page
+    return redirect(
+        url_for("main.medical_record", phone_number=phone_number[1:])
+    )  # Remove leading '+' for URL
+
+
+def process_webform_reason(json_file_path, position, current_time, reason):
     # Process reason for visit with GPT
     gpt_prompt = f"Given the following description of a patient's reason for visit, extract and convert it into a concise, organized bulleted list of symptoms and concerns. Do not use 'You' or 'Your' in the response. '{reason}'"
-    processed_reason = generate_openai_response(gpt_prompt)
+    try:
+        processed_reason = generate_openai_response(gpt_prompt)
+    except Exception as e:
+        logger.error(f"Failed to process webform reason: {str(e)}")
+        processed_reason = None
 
     if processed_reason:
         processed_reason = processed_reason.strip().split("\n")
@@ -575,53 +910,282 @@ def submit_webform():
             f"- {reason}"
         ]  # Fallback to original reason if GPT processing fails
 
-    # Construct the JSON file path
-    json_file = f"user_history_{phone_number}.json"
-    json_file_path = os.path.join(app.root_path, "static", "user_data", json_file)
-
-    # Read existing user history
-    user_history = read_medical_record(json_file_path)
-
-    # Update user information
-    user_history["fname"] = first_name
-    user_history["lname"] = last_name
-    user_history["age"] = str(age)
-    user_history["gender"] = gender
-    user_history["height"] = height
-    user_history["weight"] = weight
-    user_history["phone_number"] = phone_number
-
-    # Add new entry
-    current_time = datetime.now().strftime("%m/%d/%Y %I:%M%p")
     new_entry = {current_time: ["- Patient filled out webform."] + processed_reason}
+    try:
+        patch_history_entry(json_file_path, position, new_entry)
+    except Exception as e:
+        logger.error(f"Failed to update webform entry: {str(e)}")
 
-    if "entries" not in user_history:
-        user_history["entries"] = []
-    user_history["entries"].append(new_entry)
 
-    # Write updated user history back to file
-    write_medical_record(user_history, json_file_path)
+def normalize_phone_number(phone_number):
+    digits = "".join(filter(str.isdigit, str(phone_number)))
+    if len(digits) == 10:
+        return f"+1{digits}"
+    if 8 <= len(digits) <= 15:
+        return f"+{digits}"
+    return None
 
-    # Redirect to medical history page
-    return redirect(
-        url_for("medical_record", phone_number=phone_number[1:])
-    )  # Remove leading '+' for URL
 
+def welcome_audio_url(language):
+    # Synthesize the campaign welcome once per language and reuse it for every call
+    url, expires_at = welcome_audio_urls.get(language, (None, 0))
+    if url and expires_at > time.time():
+        return url
+
+    speech_text = (
+        language_mappings[language]["welcome"] + " " + decisionTree["root"]["question"]
+    )
+    try:
+        url = text_to_speech(speech_text, language, object_stem=f"welcome_{language}")
+    except Exception as e:
+        logger.error(f"Failed to synthesize welcome audio: {str(e)}")
+        url = None
+    if url:
+        welcome_audio_urls[language] = (url, time.time() + WELCOME_AUDIO_TTL)
+    return url
+
+
+def dispatch_campaign_target(to_number, channel, language):
+    if channel == "call":
+        speech_text = (
+            language_mappings[language]["welcome"]
+            + " "
+            + decisionTree["root"]["question"]
+        )
+        if voice_mode() == "stream":
+            twiml = stream_twiml(to_number, language)
+        else:
+            twiml = VoiceResponse()
+            s3_url = welcome_audio_url(language)
+            if s3_url:
+                twiml.play(s3_url)
+            else:
+                twiml.say(speech_text)
+            twiml.append(speech_gather(language))
+
+        call = get_twilio_client().calls.create(
+            twiml=str(twiml),
+            to=to_number,
+            from_=twilio_phone_number(),
+            status_callback=f"{ngrok_url()}/call_status",
+            status_callback_event=[
+                "completed",
+                "busy",
+                "no-answer",
+                "failed",
+                "canceled",
+            ],
+        )
+        state = get_state_backend()
+        state.set_value(tree_key(call.sid), "root")
+        state.append_message(call.sid, {"speaker": "ai", "text": speech_text})
+        return call.sid
+
+    message = get_twilio_client().messages.create(
+        body=language_mappings[language]["welcome"],
+        from_=twilio_phone_number(),
+        to=to_number,
+    )
+    state = get_state_backend()
+    state.set_value(tree_key(to_number), "root")
+    state.append_message(
+        message.sid, {"speaker": "ai", "text": language_mappings[language]["welcome"]}
+    )
+    return message.sid
+
+
+@bp.route("/campaigns", methods=["POST"])
+def start_campaign():
+    """
+    Starts a follow-up campaign; requires "Authorization: Bearer <ADMIN_TOKEN>".
+    Accepts JSON of the form
+    {"numbers": [...], "channel": "call" | "text", "language": "en"} and/or
+    {"targets": [{"to": ..., "channel": ...}, ...]}.
+    """
+    if not is_admin(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    numbers = payload.get("numbers", [])
+    raw_targets = payload.get("targets", [])
+    if not isinstance(numbers, list) or not isinstance(raw_targets, list):
+        return jsonify({"error": "numbers and targets must be lists"}), 400
+
+    language = payload.get("language", "en")
+    if not isinstance(language, str) or language not in language_mappings:
+        return jsonify({"error": f"Unsupported language: {language}"}), 400
+
+    default_channel = payload.get("channel", "call")
+    raw_targets = [
+        {"to": number, "channel": default_channel} for number in numbers
+    ] + raw_targets
+
+    targets = []
+    invalid = []
+    for target in raw_targets:
+        if not isinstance(target, dict) or not isinstance(target.get("to"), str):
+            invalid.append(target)
+            continue
+        to_number = normalize_phone_number(target["to"])
+        channel = target.get("channel", default_channel)
+        if to_number is None or channel not in ("call", "text"):
+            invalid.append(target)
+        else:
+            targets.append((to_number, channel))
 
-# Ensure these utility functions are defined:
+    if not targets:
+        return jsonify({"error": "No valid targets", "invalid": invalid}), 400
 
+    campaign_id = create_campaign(targets, language)
+    start_dispatcher(dispatch_campaign_target)
+    logger.info(f"Started campaign {campaign_id} with {len(targets)} targets")
+    return (
+        jsonify(
+            {
+                "campaign_id": campaign_id,
+                "queued": len(targets),
+                "invalid": invalid,
+                "progress_url": url_for("main.get_campaign", campaign_id=campaign_id),
+            }
+        ),
+        202,
+    )
 
-def read_medical_record(file_path):
-    if os.path.exists(file_path):
-        with open(file_path, "r") as file:
-            return json.load(file)
-    return {}
 
+@bp.route("/campaigns/<int:campaign_id>", methods=["GET"])
+def get_campaign(campaign_id):
+    if not is_admin(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    progress = campaign_progress(campaign_id)
+    if progress is None:
+        return jsonify({"error": "Campaign not found"}), 404
+    return jsonify(progress)
+
+
+@bp.route("/audio/<name>", methods=["GET"])
+def serve_audio(name):
+    # Clips from the local audio store (AUDIO_STORE=local). send_file answers
+    # Range and conditional requests, and hands whole files to the server's
+    # wsgi.file_wrapper (sendfile under gunicorn) instead of copying them.
+    clip = audio_path(name)
+    if clip is None:
+        return "Not found", 404
+    path, etag, content_type = clip
+    response = send_file(
+        path,
+        mimetype=content_type,
+        conditional=True,
+        etag=etag,
+        max_age=AUDIO_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    # Werkzeug only sets this on responses to range requests
+    response.headers.setdefault("Accept-Ranges", "bytes")
+    return response
+
+
+@bp.route("/assets/<name>", methods=["GET"])
+def serve_asset(name):
+    # Fingerprinted assets from `python assets.py build`: a new build means new
+    # URLs, so browsers can keep these for a year without revalidating
+    accepted = [encoding for encoding in ("br", "gzip") if request.accept_encodings[encoding]]
+    asset = find_asset(name, accepted)
+    if asset is None:
+        return "Not found", 404
+    path, content_type, encoding = asset
+    response = send_file(
+        path, mimetype=content_type, conditional=True, max_age=ASSET_MAX_AGE
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    # Circuit breaker states and transitions, and OpenAI rate limiter waits, for this process
+    if not is_admin(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify(
+        {
+            "pid": os.getpid(),
+            "circuit_breakers": breaker_metrics(),
+            "openai_limiter": get_limiter().stats,
+        }
+    )
 
-def write_medical_record(data, file_path):
-    with open(file_path, "w") as file:
-        json.dump(data, file, indent=4)
+
+@bp.before_app_request
+def profile_request_start():
+    profiler.request_started()
+    # "X-Profile: cprofile" from an admin runs this request under cProfile
+    if request.headers.get("X-Profile") == "cprofile" and is_admin(
+        request.headers
+    ):
+        g.cprofile = profiler.start_cprofile(request.endpoint or request.path)
+
+
+@bp.after_app_request
+def profile_request_header(response):
+    if g.get("cprofile"):
+        response.headers["X-Profile-File"] = g.cprofile[1]
+    return response
+
+
+@bp.teardown_app_request
+def profile_request_finish(exc):
+    # Teardown runs after a streamed response (e.g. /medical-record) is sent,
+    # so its template rendering is included
+    profiler.request_finished()
+    if g.get("cprofile"):
+        profiler.finish_cprofile(*g.pop("cprofile"))
+
+
+@bp.route("/admin/profile", methods=["POST"])
+def admin_profile():
+    """
+    Samples the stacks of in-flight requests and returns them as collapsed
+    stacks for a flame graph. Query parameters: seconds (default 10),
+    requests (stop once this many have finished) and threads=all to sample
+    background threads too. Needs "Authorization: Bearer <ADMIN_TOKEN>" and
+    a threaded worker, since this request's thread does the sampling.
+    """
+    if not is_admin(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+
+    max_requests = request.args.get("requests", type=int)
+    seconds = request.args.get("seconds", None if max_requests else 10, type=float)
+    sampler = profiler.sample(
+        seconds, max_requests, all_threads=request.args.get("threads") == "all"
+    )
+    if sampler is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    return Response(
+        profiler.collapsed(sampler),
+        mimetype="text/plain",
+        headers={
+            "X-Profile-Samples": str(sampler.samples),
+            "X-Profile-Requests": str(sampler.finished_requests),
+        },
+    )
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app = create_app()
+    # The development server is a single process, so it can run the
+    # VOICE_MODE=stream websocket server itself; deployments run media_stream.py
+    if os.getenv("MEDIA_STREAM_PORT"):
+        from media_stream import start_media_stream_server
+
+        start_media_stream_server(
+            int(os.getenv("MEDIA_STREAM_PORT")), stream_greeting, run_stream_turn
+        )
+    # The reloader would start a second media stream server in its watcher process
+    app.run(debug=True, use_reloader=not os.getenv("MEDIA_STREAM_PORT"))
@@ -0,0 +1,279 @@
+"""
+Local intent classifier for decision-tree answers. Every interpretation the
+LLM makes is logged as a labeled example (node, utterance, option); a small
+softmax regression over character n-grams is trained per node from that log,
+and interpret_response only calls the LLM when the local model's calibrated
+confidence is below INTENT_CONFIDENCE.
+
+    python intent_classifier.py train
+    python intent_classifier.py evaluate [--holdout 0.2] [--thresholds 0.8 0.9 0.95 0.99]
+
+Examples hold caller utterances, so they are kept under data/, outside the
+static folder Flask serves.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from tree import decisionTree
+
+logger = logging.getLogger(__name__)
+
+INTENT_LOG_PATH = os.getenv("INTENT_LOG_PATH", "data/intent_examples.jsonl")
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "data/intent_model.json")
+
+# INTENT_LOGGING=0 stops recording LLM interpretations as training examples
+INTENT_LOGGING = os.getenv("INTENT_LOGGING", "1") == "1"
+
+# Local predictions below this confidence fall back to the LLM
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", "0.95"))
+
+# Nodes need this many logged examples, covering at least two options, to get a model
+MIN_NODE_EXAMPLES = 20
+
+EPOCHS = 30
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+log_lock = threading.Lock()
+
+# Loaded model and the model file's mtime, reloaded when the file is retrained
+loaded_model = {"mtime": None, "nodes": {}}
+model_lock = threading.Lock()
+
+
+def features(text):
+    """Character 2-4 grams and words of the normalized utterance, L2 normalized."""
+    text = " ".join(re.sub(r"[^\w\s']", " ", text.lower()).split())
+    padded = f" {text} "
+    counts = {}
+    for n in (2, 3, 4):
+        for i in range(len(padded) - n + 1):
+            gram = padded[i : i + n]
+            counts[gram] = counts.get(gram, 0) + 1
+    for word in text.split():
+        key = f"w:{word}"
+        counts[key] = counts.get(key, 0) + 1
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {feature: count / norm for feature, count in counts.items()}
+
+
+def softmax(scores, temperature=1.0):
+    top = max(scores)
+    exps = [math.exp((s - top) / temperature) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def class_scores(node_model, feats):
+    scores = list(node_model["bias"])
+    weights = node_model["weights"]
+    for feature, value in feats.items():
+        row = weights.get(feature)
+        if row:
+            for k, w in enumerate(row):
+                scores[k] += w * value
+    return scores
+
+
+def train_node(examples):
+    """
+    Fits a multinomial logistic regression to [(utterance, label), ...] with
+    SGD on all but a validation slice, then fits a softmax temperature for that
+    model on the slice so its confidences are calibrated. The model served is
+    the one the temperature was fit for; a refit on all examples would be more
+    confident than the validation slice measured.
+    """
+    classes = sorted({label for _, label in examples})
+    index = {label: k for k, label in enumerate(classes)}
+    rng = random.Random(0)
+    data = [(features(text), index[label]) for text, label in examples]
+    rng.shuffle(data)
+
+    validation = data[: max(1, len(data) // 5)] if len(data) >= 10 else []
+    model = fit_weights(data[len(validation):], len(classes), rng)
+    temperature = fit_temperature(model, validation) if validation else 1.0
+    model.update({"classes": classes, "temperature": temperature, "examples": len(examples)})
+    return model
+
+
+def fit_weights(data, class_count, rng):
+    model = {"bias": [0.0] * class_count, "weights": {}}
+    weights = model["weights"]
+    order = list(range(len(data)))
+    for epoch in range(EPOCHS):
+        rng.shuffle(order)
+        rate = LEARNING_RATE / (1 + epoch * 0.1)
+        for i in order:
+            feats, label = data[i]
+            probs = softmax(class_scores(model, feats))
+            for k in range(class_count):
+                gradient = probs[k] - (1.0 if k == label else 0.0)
+                model["bias"][k] -= rate * gradient
+                if abs(gradient) < 1e-6:
+                    continue
+                for feature, value in feats.items():
+                    row = weights.setdefault(feature, [0.0] * class_count)
+                    row[k] -= rate * (gradient * value + L2 * row[k])
+    return model
+
+
+def fit_temperature(model, validation):
+    best_temperature, best_loss = 1.0, float("inf")
+    for temperature in (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0):
+        loss = 0.0
+        for feats, label in validation:
+            probs = softmax(class_scores(model, feats), temperature)
+            loss -= math.log(max(probs[label], 1e-12))
+        if loss < best_loss:
+            best_temperature, best_loss = temperature, loss
+    return best_temperature
+
+
+def predict_node(node_model, utterance):
+    probs = softmax(class_scores(node_model, features(utterance)), node_model["temperature"])
+    best = max(range(len(probs)), key=probs.__getitem__)
+    return node_model["classes"][best], probs[best]
+
+
+def load_model():
+    try:
+        mtime = os.path.getmtime(INTENT_MODEL_PATH)
+    except OSError:
+        return {}
+    if loaded_model["mtime"] != mtime:
+        with model_lock:
+            if loaded_model["mtime"] != mtime:
+                with open(INTENT_MODEL_PATH) as f:
+                    loaded_model["nodes"] = json.load(f)["nodes"]
+                loaded_model["mtime"] = mtime
+                logger.info(f"Loaded intent models for {len(loaded_model['nodes'])} nodes")
+    return loaded_model["nodes"]
+
+
+def predict_intent(node_name, utterance):
+    """
+    Returns (option, confidence) from the local model of the decision tree
+    node `node_name`, or None if the node has no model yet.
+    """
+    node_model = load_model().get(node_name)
+    if node_model is None or not utterance:
+        return None
+    return predict_node(node_model, utterance)
+
+
+def log_intent_example(node_name, utterance, label):
+    if not INTENT_LOGGING or node_name not in decisionTree or not utterance:
+        return
+    line = json.dumps(
+        {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "node": node_name,
+            "utterance": utterance,
+            "label": label,
+        }
+    )
+    try:
+        with log_lock:
+            os.makedirs(os.path.dirname(INTENT_LOG_PATH) or ".", exist_ok=True)
+            with open(INTENT_LOG_PATH, "a") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.error(f"Failed to log intent example: {str(e)}")
+
+
+def read_examples(path=INTENT_LOG_PATH):
+    """Returns {node: [(utterance, label), ...]} in logged order."""
+    examples = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            example = json.loads(line)
+            if example["node"] in decisionTree:
+                examples.setdefault(example["node"], []).append(
+                    (example["utterance"], example["label"])
+                )
+    return examples
+
+
+def train(examples):
+    nodes = {}
+    for node_name, node_examples in examples.items():
+        if len(node_examples) < MIN_NODE_EXAMPLES:
+            continue
+        if len({label for _, label in node_examples}) < 2:
+            continue
+        nodes[node_name] = train_node(node_examples)
+    return nodes
+
+
+def save_model(nodes, path=INTENT_MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"trained_at": datetime.now().isoformat(timespec="seconds"), "nodes": nodes}, f)
+    os.replace(temp_path, path)
+
+
+def evaluate(examples, holdout, thresholds):
+    """
+    Trains on the earlier part of each node's log and replays the latest
+    `holdout` fraction, reporting for each threshold how many LLM calls the
+    local model would have saved and how often it agreed with the LLM.
+    """
+    train_examples, test_examples = {}, []
+    for node_name, node_examples in examples.items():
+        split = len(node_examples) - max(1, int(len(node_examples) * holdout))
+        train_examples[node_name] = node_examples[:split]
+        test_examples.extend((node_name, text, label) for text, label in node_examples[split:])
+
+    nodes = train(train_examples)
+    predictions = []
+    started = time.perf_counter()
+    for node_name, text, label in test_examples:
+        node_model = nodes.get(node_name)
+        prediction = predict_node(node_model, text) if node_model else None
+        predictions.append((prediction, label))
+    elapsed = time.perf_counter() - started
+
+    print(f"Trained {len(nodes)} node models; {len(test_examples)} held-out turns")
+    print(f"Local prediction: {elapsed / max(len(test_examples), 1) * 1e6:.0f} us per turn")
+    print(f"{'threshold':>9} {'LLM calls saved':>16} {'local accuracy':>15} {'overall accuracy':>17}")
+    for threshold in thresholds:
+        answered = [(p[0], label) for p, label in predictions if p and p[1] >= threshold]
+        correct = sum(1 for option, label in answered if option == label)
+        saved = len(answered) / max(len(predictions), 1)
+        local_accuracy = correct / len(answered) if answered else float("nan")
+        # Turns left to the LLM count as correct
+        overall = (correct + len(predictions) - len(answered)) / max(len(predictions), 1)
+        print(f"{threshold:>9.2f} {saved:>15.1%} {local_accuracy:>15.1%} {overall:>17.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--log", default=INTENT_LOG_PATH)
+    parser.add_argument("--model", default=INTENT_MODEL_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.8, 0.9, 0.95, 0.99]
+    )
+    args = parser.parse_args()
+
+    examples = read_examples(args.log)
+    if args.command == "train":
+        nodes = train(examples)
+        save_model(nodes, args.model)
+        for node_name, node_model in sorted(nodes.items()):
+            print(f"{node_name}: {node_model['examples']} examples, options {node_model['classes']}")
+        print(f"Saved models for {len(nodes)} of {len(examples)} logged nodes to {args.model}")
+    else:
+        evaluate(examples, args.holdout, args.thresholds)
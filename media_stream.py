@@ -0,0 +1,294 @@
+"""
+Media Streams voice mode. A call answered with <Connect><Stream> opens a
+websocket to this server: caller audio arrives as 20 ms mu-law frames,
+utterances are cut out with an energy detector, transcribed, and run
+through the same decision-tree turn as the Gather webhook. Replies are
+synthesized straight to mu-law and pushed back down the socket, so prompts
+never go through S3.
+
+Twilio plays media in the order it is sent and drops whatever is still
+buffered when it receives a "clear" message, which is how a caller talking
+over a prompt (barge-in) cuts it short.
+
+The server runs as one process of its own, next to the web workers, and
+shares their state backend (so use STATE_BACKEND=sqlite):
+
+    python media_stream.py
+
+It listens on MEDIA_STREAM_PORT (default 5002); MEDIA_STREAM_URL is the
+public wss:// address of that port.
+"""
+import asyncio
+import base64
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from aiohttp import WSMsgType, web
+
+from audio_formats import ULAW_DECODE_TABLE, pcm16_to_wav, ulaw_to_pcm16
+from conversation_logic import transcribe_speech
+from openai_limiter import PRIORITY_VOICE, call_with_priority
+from tts import synthesize_speech
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = 20
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+
+# Outbound audio is sent in chunks of this many frames
+SEND_FRAMES = 50
+
+# Frames whose RMS (16-bit PCM) reaches this count as speech
+SPEECH_RMS = int(os.getenv("STREAM_SPEECH_RMS", "600"))
+
+# Consecutive speech frames that open an utterance and interrupt a prompt
+SPEECH_START_FRAMES = 3
+
+# Trailing silence that closes an utterance
+SILENCE_END_FRAMES = int(os.getenv("STREAM_SILENCE_MS", "700")) // FRAME_MS
+
+MAX_UTTERANCE_FRAMES = 15000 // FRAME_MS
+
+
+def frame_rms(frame):
+    samples = [ULAW_DECODE_TABLE[b] for b in frame]
+    return math.sqrt(sum(s * s for s in samples) / len(samples)) if samples else 0
+
+
+class MediaStreamSession:
+    """
+    One call's websocket. `greeting(call_sid)` returns the first prompt and
+    `run_turn(call_sid, to_number, text, language)` returns (reply, action)
+    like index.voice_turn; both are blocking and run in the default executor.
+    """
+
+    def __init__(self, ws, greeting, run_turn):
+        self.ws = ws
+        self.greeting = greeting
+        self.run_turn = run_turn
+        self.stream_sid = None
+        self.call_sid = None
+        self.to_number = None
+        self.language = "en"
+
+        self.onset = []
+        self.utterance = None
+        self.silence_run = 0
+
+        self.prompt_task = None
+        self.playing_mark = None
+        self.mark_count = 0
+        self.hangup_after_prompt = False
+        self.utterances = asyncio.Queue()
+
+    async def run(self):
+        turns = asyncio.create_task(self.process_utterances())
+        try:
+            async for msg in self.ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                message = json.loads(msg.data)
+                event = message.get("event")
+                if event == "start":
+                    await self.on_start(message["start"])
+                elif event == "media":
+                    if message["media"].get("track", "inbound") == "inbound":
+                        await self.on_frame(base64.b64decode(message["media"]["payload"]))
+                elif event == "mark":
+                    await self.on_mark(message["mark"]["name"])
+                elif event == "stop":
+                    break
+        finally:
+            turns.cancel()
+            if self.prompt_task:
+                self.prompt_task.cancel()
+            logger.info(f"Media stream for {self.call_sid} closed")
+
+    async def on_start(self, start):
+        self.stream_sid = start["streamSid"]
+        self.call_sid = start["callSid"]
+        parameters = start.get("customParameters", {})
+        self.to_number = parameters.get("to_number")
+        self.language = parameters.get("language", "en")
+        logger.info(f"Media stream started for {self.call_sid}")
+
+        loop = asyncio.get_running_loop()
+        greeting = await loop.run_in_executor(None, self.greeting, self.call_sid)
+        if greeting:
+            self.start_prompt(greeting)
+
+    async def on_frame(self, frame):
+        if self.hangup_after_prompt:
+            # The closing prompt plays out and the call ends; talking over it
+            # neither cuts it short nor starts another turn
+            return
+
+        loud = frame_rms(frame) >= SPEECH_RMS
+
+        if self.utterance is None:
+            if not loud:
+                self.onset = []
+                return
+            self.onset.append(frame)
+            if len(self.onset) < SPEECH_START_FRAMES:
+                return
+            self.utterance = bytearray(b"".join(self.onset))
+            self.onset = []
+            self.silence_run = 0
+            await self.barge_in()
+            return
+
+        self.utterance += frame
+        self.silence_run = 0 if loud else self.silence_run + 1
+        if (
+            self.silence_run >= SILENCE_END_FRAMES
+            or len(self.utterance) >= MAX_UTTERANCE_FRAMES * FRAME_BYTES
+        ):
+            # Trailing silence is not worth transcribing
+            audio = bytes(self.utterance[: len(self.utterance) - self.silence_run * FRAME_BYTES])
+            self.utterance = None
+            self.utterances.put_nowait((audio, time.monotonic()))
+
+    async def barge_in(self):
+        if self.prompt_task and not self.prompt_task.done():
+            self.prompt_task.cancel()
+        if self.playing_mark:
+            logger.info(f"Caller interrupted the prompt on {self.call_sid}")
+            self.playing_mark = None
+            await self.send({"event": "clear", "streamSid": self.stream_sid})
+
+    async def on_mark(self, name):
+        if name != self.playing_mark:
+            return
+        self.playing_mark = None
+        if self.hangup_after_prompt:
+            await self.ws.close()
+
+    async def process_utterances(self):
+        # Utterances are handled one at a time so turns apply in order
+        while True:
+            audio, ended_at = await self.utterances.get()
+            try:
+                await self.take_turn(audio, ended_at)
+            except Exception as e:
+                logger.error(f"Media stream turn failed for {self.call_sid}: {str(e)}")
+
+    async def take_turn(self, audio, ended_at):
+        loop = asyncio.get_running_loop()
+        wav_data = pcm16_to_wav(ulaw_to_pcm16(audio))
+        try:
+            text = await loop.run_in_executor(
+                None,
+                call_with_priority,
+                PRIORITY_VOICE,
+                transcribe_speech,
+                wav_data,
+                self.language,
+            )
+        except Exception as e:
+            logger.error(f"Transcription failed for {self.call_sid}: {str(e)}")
+            text = None
+        logger.info(
+            f"Transcribed {len(audio) // FRAME_BYTES * FRAME_MS} ms on {self.call_sid} "
+            f"in {time.monotonic() - ended_at:.2f}s: {text!r}"
+        )
+
+        reply, action = await loop.run_in_executor(
+            None, self.run_turn, self.call_sid, self.to_number, text, self.language
+        )
+        if action != "continue":
+            self.hangup_after_prompt = True
+        self.start_prompt(reply)
+
+    def start_prompt(self, text):
+        self.prompt_task = asyncio.create_task(self.play_prompt(text))
+
+    async def play_prompt(self, text):
+        loop = asyncio.get_running_loop()
+        audio = await loop.run_in_executor(
+            None,
+            call_with_priority,
+            PRIORITY_VOICE,
+            synthesize_speech,
+            text,
+            self.language,
+            "telephony_ulaw",
+        )
+        if not audio:
+            logger.error(f"No audio synthesized for prompt on {self.call_sid}")
+            if self.hangup_after_prompt:
+                await self.ws.close()
+            return
+
+        self.mark_count += 1
+        mark = f"prompt-{self.mark_count}"
+        self.playing_mark = mark
+        chunk = SEND_FRAMES * FRAME_BYTES
+        for offset in range(0, len(audio), chunk):
+            await self.send(
+                {
+                    "event": "media",
+                    "streamSid": self.stream_sid,
+                    "media": {
+                        "payload": base64.b64encode(audio[offset : offset + chunk]).decode("ascii")
+                    },
+                }
+            )
+        # Twilio echoes the mark back once everything before it has played
+        await self.send({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": mark}})
+
+    async def send(self, message):
+        if not self.ws.closed:
+            await self.ws.send_str(json.dumps(message))
+
+
+def create_media_stream_app(greeting, run_turn):
+    async def media_stream(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await MediaStreamSession(ws, greeting, run_turn).run()
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/media-stream", media_stream)
+    return app
+
+
+def start_media_stream_server(port, greeting, run_turn, host="0.0.0.0"):
+    """
+    Serves /media-stream on `port` from a background thread with its own
+    event loop, next to the Flask app that shares its conversation state.
+    """
+    started = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_media_stream_app(greeting, run_turn))
+        loop.run_until_complete(runner.setup())
+        try:
+            loop.run_until_complete(web.TCPSite(runner, host, port).start())
+        except OSError as e:
+            logger.error(f"Media stream server could not listen on {port}: {str(e)}")
+            return
+        finally:
+            started.set()
+        logger.info(f"Media stream server listening on {host}:{port}")
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait(10)
+
+
+if __name__ == "__main__":
+    from index import run_stream_turn, stream_greeting
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(
+        create_media_stream_app(stream_greeting, run_stream_turn),
+        port=int(os.getenv("MEDIA_STREAM_PORT", "5002")),
+    )
@@ -0,0 +1,259 @@
+"""
+Process-wide rate limiter for OpenAI requests. Requests and estimated tokens
+are drawn from two token buckets sized to the account's RPM and TPM limits,
+and callers waiting for capacity are served in priority order: live voice
+turns, then SMS, then speculation on voice partial results, then background
+work such as webform processing and analytics, which absorbs the
+backpressure under load.
+
+A 429 blocks the limiter for the response's Retry-After and the request is
+queued again rather than failing. With several workers, OPENAI_LIMIT_WORKERS
+splits the account limits between them.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from clients import per_process
+
+logger = logging.getLogger(__name__)
+
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+OPENAI_LIMIT_WORKERS = int(os.getenv("OPENAI_LIMIT_WORKERS", "1"))
+
+# Buckets hold this many seconds' worth of each limit. OpenAI enforces its
+# per-minute limits over shorter windows, so a full minute is never sent at once.
+OPENAI_BURST_SECONDS = float(os.getenv("OPENAI_BURST_SECONDS", "1"))
+
+PRIORITY_VOICE = 0
+PRIORITY_SMS = 1
+PRIORITY_SPECULATION = 2
+PRIORITY_BACKGROUND = 3
+PRIORITY_NAMES = {
+    PRIORITY_VOICE: "voice",
+    PRIORITY_SMS: "sms",
+    PRIORITY_SPECULATION: "speculation",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# Tokens assumed for a completion until the response reports its usage
+COMPLETION_TOKEN_ESTIMATE = 150
+
+# Times a rate-limited request is queued again before its 429 is returned
+MAX_ATTEMPTS = 8
+
+# How often a waiting coroutine rechecks its place in the queue
+ASYNC_POLL_INTERVAL = 0.02
+
+# Work that does not set a priority is treated as background
+current_priority = ContextVar("openai_priority", default=PRIORITY_BACKGROUND)
+
+
+@contextmanager
+def openai_priority(priority):
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def call_with_priority(priority, func, *args):
+    """Runs func(*args) at `priority`, e.g. from an executor thread."""
+    with openai_priority(priority):
+        return func(*args)
+
+
+def estimate_tokens(prompt):
+    return len(prompt) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+
+class RateLimiter:
+    def __init__(self, rpm, tpm, burst_seconds=OPENAI_BURST_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_capacity = max(1.0, rpm / 60 * burst_seconds)
+        self.token_capacity = max(1.0, tpm / 60 * burst_seconds)
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.changed = threading.Condition()
+        self.stats = {
+            name: {"requests": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+        self.stats["rate_limited"] = 0
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, estimated_tokens, priority):
+        """
+        Blocks until the request can be sent without exceeding the limits
+        and no higher priority request is waiting. Returns the time waited.
+        """
+        # A request larger than the whole bucket goes out once the bucket is full
+        estimated_tokens = min(estimated_tokens, self.token_capacity)
+        started = time.monotonic()
+        with self.changed:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    timeout = None
+                    if self.waiting[0] == ticket:
+                        timeout = max(
+                            self.blocked_until - now,
+                            (1 - self.requests) * 60 / self.rpm,
+                            (estimated_tokens - self.tokens) * 60 / self.tpm,
+                        )
+                        if timeout <= 0:
+                            self.requests -= 1
+                            self.tokens -= estimated_tokens
+                            break
+                    self.changed.wait(timeout)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.changed.notify_all()
+
+            return self.record_wait(priority, time.monotonic() - started)
+
+    async def acquire_async(self, estimated_tokens, priority):
+        """
+        Event loop counterpart of acquire(): queues in the same priority order
+        as threads, but waits with asyncio.sleep instead of blocking a thread.
+        """
+        estimated_tokens = min(estimated_tokens, self.token_capacity)
+        started = time.monotonic()
+        with self.changed:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+        try:
+            while True:
+                with self.changed:
+                    now = time.monotonic()
+                    self.refill(now)
+                    delay = ASYNC_POLL_INTERVAL
+                    if self.waiting[0] == ticket:
+                        delay = max(
+                            self.blocked_until - now,
+                            (1 - self.requests) * 60 / self.rpm,
+                            (estimated_tokens - self.tokens) * 60 / self.tpm,
+                        )
+                        if delay <= 0:
+                            self.requests -= 1
+                            self.tokens -= estimated_tokens
+                            return self.record_wait(priority, now - started)
+                await asyncio.sleep(min(delay, ASYNC_POLL_INTERVAL))
+        finally:
+            with self.changed:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.changed.notify_all()
+
+    def record_wait(self, priority, waited):
+        # Called with self.changed held
+        stats = self.stats[PRIORITY_NAMES[priority]]
+        stats["requests"] += 1
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        return waited
+
+    def settle(self, estimated_tokens, actual_tokens):
+        # Return (or take) the difference once the real usage is known
+        with self.changed:
+            self.tokens = min(
+                self.token_capacity, self.tokens + estimated_tokens - actual_tokens
+            )
+            self.changed.notify_all()
+
+    def block(self, seconds):
+        with self.changed:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.stats["rate_limited"] += 1
+
+
+def get_limiter():
+    return per_process(
+        "openai-limiter",
+        lambda: RateLimiter(
+            max(1, OPENAI_RPM // OPENAI_LIMIT_WORKERS),
+            max(1, OPENAI_TPM // OPENAI_LIMIT_WORKERS),
+        ),
+    )
+
+
+def retry_after_seconds(response, attempt):
+    try:
+        return max(float(response.headers.get("Retry-After")), 0.1)
+    except (TypeError, ValueError):
+        return min(2**attempt, 30)
+
+
+def send(post, estimated_tokens=0):
+    """
+    Sends a request through the limiter. `post` performs the HTTP call and
+    returns the response; callers report real usage with get_limiter().settle().
+    """
+    limiter = get_limiter()
+    priority = current_priority.get()
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.acquire(estimated_tokens, priority)
+        try:
+            response = post()
+        except Exception:
+            limiter.settle(estimated_tokens, 0)
+            raise
+        if response.status_code != 429:
+            return response
+
+        retry_after = retry_after_seconds(response, attempt)
+        logger.warning(
+            f"OpenAI rate limited a {PRIORITY_NAMES[priority]} request; "
+            f"retrying after {retry_after:.1f}s"
+        )
+        limiter.block(retry_after)
+    return response
+
+
+async def send_async(post, estimated_tokens=0):
+    """
+    Async counterpart of send(): `post` is a coroutine function returning an
+    aiohttp response, whose body the caller reads.
+    """
+    limiter = get_limiter()
+    priority = current_priority.get()
+    for attempt in range(MAX_ATTEMPTS):
+        await limiter.acquire_async(estimated_tokens, priority)
+        try:
+            response = await post()
+        except Exception:
+            limiter.settle(estimated_tokens, 0)
+            raise
+        if response.status != 429:
+            return response
+
+        retry_after = retry_after_seconds(response, attempt)
+        response.release()
+        logger.warning(
+            f"OpenAI rate limited a {PRIORITY_NAMES[priority]} request; "
+            f"retrying after {retry_after:.1f}s"
+        )
+        limiter.block(retry_after)
+    return response
@@ -0,0 +1,165 @@
+"""
+On-demand profiling for turns that are slow while their external calls look
+fine (see circuit_breaker.py for those).
+
+- Sampling: sample() records the Python stack of every thread that is
+  handling a request, every PROFILE_SAMPLE_INTERVAL seconds, for a number of
+  seconds or until a number of requests have finished. collapsed() renders
+  the samples as collapsed stacks ("frame;frame;frame count" per line), the
+  input of flamegraph.pl and speedscope.
+- Per request: start_cprofile()/finish_cprofile() run one request under
+  cProfile and write its stats to PROFILE_DIR, for snakeviz or pstats.
+
+Both are served by admin-only routes in index.py (see auth.py).
+The request hooks always keep the set of threads handling a request, so a
+sampling run also covers requests already in flight when it starts; apart
+from that they only check a module global while no sampler runs.
+
+Sampling needs a threaded worker (e.g. gunicorn -k gthread --threads N, or
+the Flask development server): the sampler runs in the /admin/profile
+request's own thread for the whole run, and samples the worker's other
+request threads. A sync worker has no other request thread to sample, and
+requests served by the ASGI app (asgi.py) run on its event loop and are not
+seen at all.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# 5ms between samples costs well under 1% CPU and resolves a 100ms turn
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Upper bound on a sampling run, however it was requested
+PROFILE_MAX_SECONDS = 120
+
+# Where per-request cProfile stats are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+
+# The running Sampler, if any; read by the request hooks
+active = None
+_sampling = threading.Lock()
+
+# Idents of the threads currently handling a request, kept by the request hooks
+request_threads = set()
+_request_threads_lock = threading.Lock()
+
+
+class Sampler:
+    def __init__(self, max_requests=None, all_threads=False):
+        self.max_requests = max_requests
+        self.all_threads = all_threads
+        self.finished_requests = 0
+        self.samples = 0
+        self.counts = Counter()
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def request_finished(self):
+        with self.lock:
+            self.finished_requests += 1
+            if self.max_requests and self.finished_requests >= self.max_requests:
+                self.done.set()
+
+    def run(self, seconds):
+        own_thread = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while not self.done.is_set() and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if self.all_threads:
+                threads = frames
+            else:
+                with _request_threads_lock:
+                    threads = list(request_threads)
+            for thread in threads:
+                frame = frames.get(thread)
+                if thread != own_thread and frame is not None:
+                    self.counts[collapse(frame)] += 1
+            self.samples += 1
+            self.done.wait(PROFILE_SAMPLE_INTERVAL)
+
+
+def collapse(frame):
+    stack = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def sample(seconds=None, max_requests=None, all_threads=False):
+    """
+    Samples request threads (or every thread) in the calling thread until
+    `seconds` pass or `max_requests` requests finish, capped at
+    PROFILE_MAX_SECONDS. Returns the Sampler, or None if one is already running.
+    """
+    global active
+    if not _sampling.acquire(blocking=False):
+        return None
+    sampler = Sampler(max_requests, all_threads)
+    started = time.monotonic()
+    try:
+        active = sampler
+        sampler.run(min(seconds or PROFILE_MAX_SECONDS, PROFILE_MAX_SECONDS))
+    finally:
+        active = None
+        _sampling.release()
+    logger.info(
+        f"Sampled {sampler.samples} times over {time.monotonic() - started:.1f}s, "
+        f"{sampler.finished_requests} requests finished"
+    )
+    return sampler
+
+
+def collapsed(sampler):
+    return "".join(f"{stack} {count}\n" for stack, count in sampler.counts.most_common())
+
+
+# Request hooks; a set update, plus a count while a sampler is running
+
+def request_started():
+    with _request_threads_lock:
+        request_threads.add(threading.get_ident())
+
+
+def request_finished():
+    with _request_threads_lock:
+        request_threads.discard(threading.get_ident())
+    sampler = active
+    if sampler is not None:
+        sampler.request_finished()
+
+
+def start_cprofile(label):
+    """
+    Starts profiling the calling thread; returns (profile, stats path), or
+    None if another profiler already holds this interpreter (Python 3.12+
+    allows one at a time).
+    """
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        logger.warning(f"Could not start cProfile: {e}")
+        return None
+    safe_label = "".join(c if c.isalnum() else "_" for c in label)
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_label}-{uuid.uuid4().hex[:8]}.prof"
+    return profile, os.path.join(PROFILE_DIR, filename)
+
+
+def finish_cprofile(profile, path):
+    profile.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile.dump_stats(path)
+
+    summary = io.StringIO()
+    pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(15)
+    logger.info(f"cProfile stats written to {path}\n{summary.getvalue()}")
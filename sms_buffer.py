@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import threading
+
+from conversation_logic import track_usage
+from openai_limiter import PRIORITY_SMS, openai_priority
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for more fragments from the same phone before running a turn
+DEBOUNCE_SECONDS = float(os.getenv("SMS_DEBOUNCE_SECONDS", "2.5"))
+
+# Pending fragments per phone number: {"messages": [...], "generation": int, "timer": Timer}
+inbound_buffers = {}
+buffer_lock = threading.Lock()
+
+# LLM calls are counted with track_usage() around every turn run, superseded or not
+stats = {"fragments": 0, "turns": 0, "superseded": 0, "failed": 0, "llm_calls": 0}
+
+
+def buffer_message(phone_number, text, run_turn):
+    """
+    Adds an inbound SMS fragment to the phone's buffer and (re)starts the
+    debounce timer. When the timer fires, `run_turn(merged_text)` is called
+    with every buffered fragment and must return a commit callback that
+    applies the turn's side effects (state, history, reply).
+    """
+
+    def start_timer():
+        timer = threading.Timer(
+            DEBOUNCE_SECONDS, flush_buffer, args=(phone_number, run_turn)
+        )
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    add_fragment(phone_number, text, start_timer)
+
+
+def buffer_message_async(phone_number, text, run_turn):
+    """
+    Event loop counterpart of buffer_message(), called on the loop:
+    `run_turn` is a coroutine function and so is the commit it returns.
+    """
+    loop = asyncio.get_running_loop()
+
+    def start_timer():
+        return loop.call_later(
+            DEBOUNCE_SECONDS,
+            lambda: loop.create_task(flush_buffer_async(phone_number, run_turn)),
+        )
+
+    add_fragment(phone_number, text, start_timer)
+
+
+def add_fragment(phone_number, text, start_timer):
+    with buffer_lock:
+        buffer = inbound_buffers.setdefault(
+            phone_number, {"messages": [], "generation": 0, "timer": None}
+        )
+        buffer["messages"].append(text)
+        buffer["generation"] += 1
+        if buffer["timer"]:
+            buffer["timer"].cancel()
+        buffer["timer"] = start_timer()
+        stats["fragments"] += 1
+
+
+def flush_buffer(phone_number, run_turn):
+    pending = take_fragments(phone_number)
+    if pending is None:
+        return
+    generation, messages = pending
+
+    usage = track_usage()
+    try:
+        with openai_priority(PRIORITY_SMS):
+            commit = run_turn(" ".join(messages))
+    except Exception:
+        # The buffer is still cleared, so the next message starts a fresh turn
+        logger.exception(f"SMS turn for {phone_number} failed")
+        commit = None
+
+    if finish_turn(phone_number, generation, messages, usage["calls"], commit is None):
+        commit()
+
+
+async def flush_buffer_async(phone_number, run_turn):
+    pending = take_fragments(phone_number)
+    if pending is None:
+        return
+    generation, messages = pending
+
+    usage = track_usage()
+    try:
+        with openai_priority(PRIORITY_SMS):
+            commit = await run_turn(" ".join(messages))
+    except Exception:
+        logger.exception(f"SMS turn for {phone_number} failed")
+        commit = None
+
+    if finish_turn(phone_number, generation, messages, usage["calls"], commit is None):
+        await commit()
+
+
+def take_fragments(phone_number):
+    with buffer_lock:
+        buffer = inbound_buffers.get(phone_number)
+        if not buffer or not buffer["messages"]:
+            return None
+        return buffer["generation"], list(buffer["messages"])
+
+
+def finish_turn(phone_number, generation, messages, llm_calls, failed=False):
+    """
+    Records a turn run over `messages` that made `llm_calls` LLM calls and
+    returns whether it should be committed. A failed turn still clears the
+    buffer it ran over.
+    """
+    with buffer_lock:
+        stats["llm_calls"] += llm_calls
+        buffer = inbound_buffers.get(phone_number)
+        if buffer is None or buffer["generation"] != generation:
+            # Newer fragments arrived while this turn was in flight; their flush
+            # reruns the turn over every fragment, so this result is discarded.
+            stats["superseded"] += 1
+            logger.info(f"Discarding superseded SMS turn for {phone_number}")
+            return False
+        del inbound_buffers[phone_number]
+        if failed:
+            stats["failed"] += 1
+            return False
+        stats["turns"] += 1
+        runs = stats["turns"] + stats["superseded"] + stats["failed"]
+        # Without coalescing, every fragment would have run a turn of its own
+        baseline_calls = round(stats["llm_calls"] / runs * stats["fragments"])
+
+    logger.info(
+        f"Coalesced {len(messages)} SMS fragment(s) from {phone_number} into one turn "
+        f"({llm_calls} LLM calls). Totals: {stats['fragments']} fragments, "
+        f"{stats['turns']} turns, {stats['superseded']} superseded, {stats['failed']} failed, "
+        f"{stats['llm_calls']} LLM calls (about {baseline_calls} without coalescing)"
+    )
+    return True
@@ -0,0 +1,122 @@
+import copy
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conversation_logic import interpret_response, update_user_history
+from openai_limiter import PRIORITY_SPECULATION, openai_priority
+from user_history import load_user_history
+
+logger = logging.getLogger(__name__)
+
+# SPECULATION_ENABLED=0 turns partialResultCallback handling into a no-op
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "1") == "1"
+
+# Caps the LLM calls a single caller turn can spend on speculation
+MAX_SPECULATIONS_PER_TURN = 3
+
+# Speculations never taken (the caller hung up, or the final result never
+# arrived) are dropped after this long
+SPECULATION_TTL = 60
+
+speculation_pool = ThreadPoolExecutor(max_workers=8)
+
+# call_sid -> {"text", "node", "future", "count", "started"}
+speculations = {}
+speculations_lock = threading.Lock()
+
+
+def normalize_speech(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", text or "").lower().split())
+
+
+def run_speculation(user_input, node_name, current_node, to_number):
+    # Works on a copy so a discarded speculation never touches the saved history
+    user_history = copy.deepcopy(load_user_history(to_number))
+    # Below live turns, whose requests are never speculative
+    with openai_priority(PRIORITY_SPECULATION):
+        interpreted_response = interpret_response(user_input, current_node, node_name)
+        new_user_history = update_user_history(
+            current_node["question"], user_input, user_history
+        )
+    return interpreted_response, new_user_history
+
+
+def speculate(call_sid, to_number, stable_text, node_name, current_node):
+    """
+    Starts interpreting and extracting from the caller's stable partial
+    transcript while they are still speaking. A newer stable transcript
+    replaces the previous speculation.
+    """
+    if not SPECULATION_ENABLED or not call_sid:
+        return
+
+    text = normalize_speech(stable_text)
+    if not text:
+        return
+
+    with speculations_lock:
+        evict_expired()
+        current = speculations.get(call_sid)
+        count = current["count"] if current and current["node"] == node_name else 0
+        if current and current["text"] == text and current["node"] == node_name:
+            return
+        if count >= MAX_SPECULATIONS_PER_TURN:
+            return
+
+        future = speculation_pool.submit(
+            run_speculation, stable_text, node_name, current_node, to_number
+        )
+        speculations[call_sid] = {
+            "text": text,
+            "node": node_name,
+            "future": future,
+            "count": count + 1,
+            "started": time.monotonic(),
+        }
+    logger.info(f"Speculating on partial result for {call_sid}: {text!r}")
+
+
+def evict_expired():
+    # Called with speculations_lock held
+    cutoff = time.monotonic() - SPECULATION_TTL
+    for call_sid in [sid for sid, s in speculations.items() if s["started"] < cutoff]:
+        speculations.pop(call_sid)["future"].cancel()
+
+
+def discard_speculation(call_sid):
+    """Drops the call's speculation, e.g. when the call ends."""
+    with speculations_lock:
+        speculation = speculations.pop(call_sid, None)
+    if speculation:
+        speculation["future"].cancel()
+
+
+def take_speculation(call_sid, final_text, node_name, timeout=10):
+    """
+    Returns (interpreted_response, user_history) computed from partial results
+    if they match the final transcript at the same tree node, else None. The
+    speculation for the call is cleared either way.
+    """
+    with speculations_lock:
+        speculation = speculations.pop(call_sid, None)
+
+    if speculation is None:
+        return None
+    if (
+        speculation["node"] != node_name
+        or speculation["text"] != normalize_speech(final_text)
+    ):
+        logger.info(f"Discarding speculation for {call_sid}: final result differs")
+        return None
+
+    try:
+        result = speculation["future"].result(timeout=timeout)
+    except Exception as e:
+        logger.error(f"Speculation for {call_sid} failed: {str(e)}")
+        return None
+    logger.info(f"Confirmed speculation for {call_sid}")
+    return result
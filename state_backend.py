@@ -0,0 +1,238 @@
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from clients import per_process
+
+# STATE_BACKEND=memory keeps state in this process (single worker only);
+# STATE_BACKEND=sqlite shares it between workers through STATE_DB_PATH.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+
+# How often a SQLite waiter checks for writes made by other processes
+SQLITE_POLL_INTERVAL = 0.05
+
+
+class StateBackend(abc.ABC):
+    """
+    Conversation state shared by every request that handles a conversation:
+    the message transcript per conversation id (call or message SID) and
+    small JSON values such as the decision tree position.
+    """
+
+    @abc.abstractmethod
+    def append_message(self, conversation_id, message):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_messages(self, conversation_id, since=0):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def wait_for_messages(self, conversation_id, since=0, timeout=15):
+        """
+        Returns messages after index `since`, blocking up to `timeout`
+        seconds until one is appended (by any worker). Returns [] on timeout.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_value(self, key, default=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_value(self, key, value):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_value_if_absent(self, key, value):
+        """Stores `value` only if `key` is unset; returns whether it was stored."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_value(self, key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_expired(self, prefix, now):
+        """
+        Deletes the values under keys starting with `prefix` whose "expires"
+        field is before `now`; returns how many were deleted.
+        """
+        raise NotImplementedError
+
+
+class MemoryStateBackend(StateBackend):
+    def __init__(self):
+        self.messages = {}
+        self.values = {}
+        self.changed = threading.Condition()
+
+    def append_message(self, conversation_id, message):
+        with self.changed:
+            self.messages.setdefault(conversation_id, []).append(message)
+            self.changed.notify_all()
+
+    def get_messages(self, conversation_id, since=0):
+        with self.changed:
+            return list(self.messages.get(conversation_id, [])[since:])
+
+    def wait_for_messages(self, conversation_id, since=0, timeout=15):
+        with self.changed:
+            self.changed.wait_for(
+                lambda: len(self.messages.get(conversation_id, [])) > since, timeout
+            )
+            return list(self.messages.get(conversation_id, [])[since:])
+
+    def get_value(self, key, default=None):
+        with self.changed:
+            return self.values.get(key, default)
+
+    def set_value(self, key, value):
+        with self.changed:
+            self.values[key] = value
+
+    def set_value_if_absent(self, key, value):
+        with self.changed:
+            if key in self.values:
+                return False
+            self.values[key] = value
+            return True
+
+    def delete_value(self, key):
+        with self.changed:
+            self.values.pop(key, None)
+
+    def delete_expired(self, prefix, now):
+        with self.changed:
+            expired = [
+                key
+                for key, value in self.values.items()
+                if key.startswith(prefix) and value["expires"] < now
+            ]
+            for key in expired:
+                del self.values[key]
+            return len(expired)
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Stores state in a SQLite file every worker opens. Appends in this process
+    wake local waiters immediately; appends from other processes are noticed
+    through PRAGMA data_version, which changes whenever another connection
+    commits, so idle waiters only re-query the messages table after a write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.changed = threading.Condition()
+        conn = self.connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                PRIMARY KEY (conversation_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def append_message(self, conversation_id, message):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO messages (conversation_id, seq, body) "
+                "SELECT ?, COALESCE(MAX(seq) + 1, 0), ? FROM messages WHERE conversation_id = ?",
+                (conversation_id, json.dumps(message), conversation_id),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self.changed:
+            self.changed.notify_all()
+
+    def get_messages(self, conversation_id, since=0):
+        rows = self.connect().execute(
+            "SELECT body FROM messages WHERE conversation_id = ? AND seq >= ? ORDER BY seq",
+            (conversation_id, since),
+        ).fetchall()
+        return [json.loads(body) for (body,) in rows]
+
+    def wait_for_messages(self, conversation_id, since=0, timeout=15):
+        conn = self.connect()
+        deadline = time.monotonic() + timeout
+        data_version = None
+        while True:
+            current_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if current_version != data_version:
+                data_version = current_version
+                messages = self.get_messages(conversation_id, since)
+                if messages:
+                    return messages
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            # Local appends wake us early; other processes are picked up on the next poll
+            with self.changed:
+                self.changed.wait(min(SQLITE_POLL_INTERVAL, remaining))
+
+    def get_value(self, key, default=None):
+        row = self.connect().execute(
+            "SELECT value FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_value(self, key, value):
+        self.connect().execute(
+            "INSERT INTO kv (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value)),
+        )
+
+    def set_value_if_absent(self, key, value):
+        cursor = self.connect().execute(
+            "INSERT OR IGNORE INTO kv (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+        return cursor.rowcount == 1
+
+    def delete_value(self, key):
+        self.connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def delete_expired(self, prefix, now):
+        cursor = self.connect().execute(
+            "DELETE FROM kv WHERE substr(key, 1, ?) = ? "
+            "AND json_extract(value, '$.expires') < ?",
+            (len(prefix), prefix, now),
+        )
+        return cursor.rowcount
+
+
+def get_state_backend():
+    def build():
+        if STATE_BACKEND == "sqlite":
+            return SQLiteStateBackend(STATE_DB_PATH)
+        return MemoryStateBackend()
+
+    return per_process("state", build)
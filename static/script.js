@@ -424,4 +424,83 @@ document.addEventListener('DOMContentLoaded', function() {
             form.submit();
         });
     });
-});
\ No newline at end of file
+});
+// Format an encounter summary the same way the medical-record template does
+function formatEncounterSummary(summary) {
+    return summary
+        .map(item => item.replace(/^[-\s]+|[-\s]+$/g, '').replace(/[.!?]+$/, ''))
+        .join('. ') + '.';
+}
+
+// Fetch older visits for the medical record page, one page at a time
+var loadMoreButton = document.getElementById('load-more-button');
+if (loadMoreButton) {
+    loadMoreButton.addEventListener('click', function() {
+        var phoneNumber = loadMoreButton.getAttribute('data-phone-number');
+        var cursor = loadMoreButton.getAttribute('data-cursor');
+        loadMoreButton.disabled = true;
+
+        fetch(`/api/medical-record?phone_number=${encodeURIComponent(phoneNumber)}&cursor=${cursor}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                return response.json();
+            })
+            .then(page => {
+                const recordEntries = document.getElementById('record-entries');
+                page.entries.forEach(entry => {
+                    const row = document.createElement('tr');
+                    row.setAttribute('data-position', entry.position);
+
+                    const dateCell = document.createElement('td');
+                    dateCell.textContent = entry.date;
+                    row.appendChild(dateCell);
+
+                    const summaryCell = document.createElement('td');
+                    summaryCell.textContent = formatEncounterSummary(entry.summary);
+                    row.appendChild(summaryCell);
+
+                    recordEntries.appendChild(row);
+                });
+
+                if (page.next_cursor === null) {
+                    loadMoreButton.style.display = 'none';
+                } else {
+                    loadMoreButton.setAttribute('data-cursor', page.next_cursor);
+                    loadMoreButton.disabled = false;
+                }
+            })
+            .catch(error => {
+                console.error('Error fetching medical record page:', error);
+                loadMoreButton.disabled = false;
+            });
+    });
+}
+
+// Poll visits that are still being processed in the background until they are ready
+function pollProcessingEntries() {
+    var phoneNumberInput = document.getElementById('record-phone-number');
+    var pendingRows = document.querySelectorAll('#record-entries tr[data-processing="true"]');
+    if (!phoneNumberInput || pendingRows.length === 0) return;
+
+    pendingRows.forEach(row => {
+        var position = parseInt(row.getAttribute('data-position'), 10);
+        fetch(`/api/medical-record?phone_number=${encodeURIComponent(phoneNumberInput.value)}&cursor=${position + 1}&limit=1`)
+            .then(response => response.json())
+            .then(page => {
+                const entry = page.entries.find(e => e.position === position);
+                if (entry && !entry.processing) {
+                    row.removeAttribute('data-processing');
+                    row.cells[1].textContent = formatEncounterSummary(entry.summary);
+                }
+            })
+            .catch(error => console.error('Error polling medical record entry:', error));
+    });
+
+    setTimeout(pollProcessingEntries, 2000);
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    setTimeout(pollProcessingEntries, 2000);
+});
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import assets
+
+
+@pytest.fixture
+def built(tmp_path, monkeypatch):
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    (static_dir / "styles.css").write_text("body { color: black; }\n" * 200)
+    (static_dir / "logo.webp").write_bytes(os.urandom(2048))
+    build_dir = str(static_dir / "dist")
+    monkeypatch.setattr(assets, "ASSET_FILES", ("styles.css", "logo.webp"))
+    monkeypatch.setattr(assets, "BUILD_DIR", build_dir)
+    return assets.build(str(static_dir), build_dir)
+
+
+def test_build_fingerprints_and_compresses(built):
+    css = built["styles.css"]
+    assert css["name"].startswith("styles.") and css["name"].endswith(".css")
+    assert "gzip" in css["encodings"]
+    # Random bytes do not compress, so no copy is kept
+    assert built["logo.webp"]["encodings"] == {}
+    assert not [name for name in os.listdir(assets.BUILD_DIR) if name.startswith(".")]
+
+
+def test_find_asset_serves_the_best_accepted_encoding(built):
+    name = built["styles.css"]["name"]
+    path, content_type, encoding = assets.find_asset(name, {"gzip", "deflate"})
+    assert path.endswith(name + ".gz") and encoding == "gzip"
+    assert content_type == "text/css"
+
+    path, _, encoding = assets.find_asset(name, set())
+    assert path.endswith(name) and encoding is None
+
+
+@pytest.mark.parametrize(
+    "name", ["manifest.json", "../styles.css", ".tmp-styles", "missing.css"]
+)
+def test_find_asset_refuses_other_files(built, name):
+    assert assets.find_asset(name, {"gzip"}) is None
+
+
+def test_find_asset_refuses_compressed_copies(built):
+    assert assets.find_asset(built["styles.css"]["name"] + ".gz", {"gzip"}) is None
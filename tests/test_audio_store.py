@@ -0,0 +1,41 @@
+import pytest
+
+import audio_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_store, "AUDIO_STORE_DIR", str(tmp_path))
+    monkeypatch.setitem(audio_store._usage, "bytes", None)
+    return tmp_path
+
+
+def test_clips_are_named_by_content(store):
+    name = audio_store.store_audio(b"clip", "mp3")
+    assert audio_store.store_audio(b"clip", "mp3") == name
+    assert audio_store.store_audio(b"other clip", "mp3") != name
+
+    path, etag, content_type = audio_store.audio_path(name)
+    assert open(path, "rb").read() == b"clip"
+    assert name == f"{etag}.mp3"
+    assert content_type == "audio/mpeg"
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["../secret.mp3", "0123456789abcdef0123456789abcdef.exe", ".partial-abc", "ABC.mp3"],
+)
+def test_audio_path_refuses_other_names(store, name):
+    assert audio_store.audio_path(name) is None
+
+
+def test_audio_path_of_evicted_clip(store):
+    assert audio_store.audio_path("0" * 32 + ".mp3") is None
+
+
+def test_store_is_trimmed_to_the_cap(store, monkeypatch):
+    monkeypatch.setattr(audio_store, "AUDIO_STORE_MAX_BYTES", 2500)
+    for i in range(5):
+        audio_store.store_audio(bytes([i]) * 1000, "mp3")
+
+    assert sum(size for _, size, _ in audio_store.scan_store()) <= 2500
@@ -0,0 +1,14 @@
+from auth import is_admin
+
+
+def test_admin_token_is_required(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert is_admin({"Authorization": "Bearer secret"})
+    assert not is_admin({"Authorization": "Bearer wrong"})
+    assert not is_admin({})
+
+
+def test_nobody_is_admin_without_a_token(monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert not is_admin({"Authorization": "Bearer "})
+    assert not is_admin({"Authorization": "Bearer None"})
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import campaigns
+
+
+@pytest.fixture
+def campaign_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(campaigns, "CAMPAIGN_DB_PATH", str(tmp_path / "campaigns.db"))
+    campaigns.init_db()
+
+
+def dispatcher_connection():
+    conn = campaigns.connect()
+    conn.isolation_level = None
+    return conn
+
+
+def target_statuses():
+    with campaigns.connect() as conn:
+        return dict(conn.execute("SELECT to_number, status FROM campaign_targets").fetchall())
+
+
+def test_targets_are_claimed_once_in_order(campaign_db):
+    campaigns.create_campaign([("+15550000001", "call"), ("+15550000002", "text")])
+    first, second = dispatcher_connection(), dispatcher_connection()
+
+    claimed = [campaigns.claim_target(first), campaigns.claim_target(second)]
+
+    assert [target["to_number"] for target in claimed] == ["+15550000001", "+15550000002"]
+    assert campaigns.claim_target(first) is None
+    assert set(target_statuses().values()) == {"dispatching"}
+
+
+def test_no_claims_while_another_process_holds_the_lease(campaign_db):
+    campaigns.create_campaign([("+15550000001", "call")])
+    with campaigns.connect() as conn:
+        conn.execute(
+            "INSERT INTO dispatcher_lease (id, owner, expires) VALUES (1, 'other', ?)",
+            (time.time() + 60,),
+        )
+
+    assert campaigns.claim_target(dispatcher_connection()) is None
+    assert target_statuses() == {"+15550000001": "queued"}
+
+
+def test_taking_over_an_expired_lease_fails_its_inflight_targets(campaign_db):
+    campaigns.create_campaign([("+15550000001", "call"), ("+15550000002", "call")])
+    with campaigns.connect() as conn:
+        conn.execute("UPDATE campaign_targets SET status = 'dispatching' WHERE id = 1")
+        conn.execute(
+            "INSERT INTO dispatcher_lease (id, owner, expires) VALUES (1, 'dead', ?)",
+            (time.time() - 1,),
+        )
+
+    target = campaigns.claim_target(dispatcher_connection())
+
+    assert target["to_number"] == "+15550000002"
+    assert target_statuses() == {"+15550000001": "failed", "+15550000002": "dispatching"}
+
+
+def test_campaign_is_marked_dispatched_when_drained(campaign_db):
+    campaign_id = campaigns.create_campaign([("+15550000001", "call")])
+    conn = dispatcher_connection()
+    target = campaigns.claim_target(conn)
+    with campaigns.connect() as write:
+        write.execute(
+            "UPDATE campaign_targets SET status = 'dispatched' WHERE id = ?", (target["id"],)
+        )
+
+    assert campaigns.claim_target(conn) is None
+    assert campaigns.campaign_progress(campaign_id)["status"] == "dispatched"
+
+
+@pytest.fixture
+def client(campaign_db, monkeypatch):
+    from index import create_app
+
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr("index.start_dispatcher", lambda dispatch: None)
+    return create_app().test_client()
+
+
+def test_starting_a_campaign_needs_the_admin_token(client):
+    response = client.post("/campaigns", json={"numbers": ["5550000001"]})
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [["5550000001"], {"numbers": "5550000001"}, {"targets": ["5550000001"]}, {"language": []}],
+)
+def test_malformed_campaigns_are_rejected(client, payload):
+    response = client.post(
+        "/campaigns", json=payload, headers={"Authorization": "Bearer secret"}
+    )
+    assert response.status_code == 400
+
+
+def test_campaign_is_queued(client):
+    response = client.post(
+        "/campaigns",
+        json={"numbers": ["5550000001"], "targets": [{"to": "5550000002", "channel": "text"}, 7]},
+        headers={"Authorization": "Bearer secret"},
+    )
+    assert response.status_code == 202
+    assert response.get_json()["queued"] == 2
+    assert response.get_json()["invalid"] == [7]
+    assert target_statuses() == {"+15550000001": "queued", "+15550000002": "queued"}
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def short_open_period(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", 0.05)
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def trip(breaker):
+    for _ in range(4):
+        assert breaker.allow()
+        with pytest.raises(ConnectionError):
+            breaker.track(fail)
+
+
+def test_opens_once_enough_calls_fail():
+    breaker = CircuitBreaker("test-opens", slow_seconds=1)
+    breaker.track(lambda: 200)
+    breaker.track(lambda: 200)
+    breaker.track(lambda: 500, is_failure=lambda status: status >= 500)
+    assert breaker.state == CLOSED
+
+    with pytest.raises(ConnectionError):
+        breaker.track(fail)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.metrics()["short_circuited"] == 1
+
+
+def test_slow_calls_count_against_the_breaker():
+    breaker = CircuitBreaker("test-slow", slow_seconds=0.01)
+    for _ in range(4):
+        breaker.track(time.sleep, 0.02)
+    assert breaker.state == OPEN
+    assert breaker.metrics()["slow"] == 4
+
+
+def test_trial_call_closes_a_breaker_without_a_probe():
+    breaker = CircuitBreaker("test-trial", slow_seconds=1)
+    trip(breaker)
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # one trial at a time
+    breaker.track(lambda: 200)
+    assert breaker.state == CLOSED
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker("test-failed-trial", slow_seconds=1)
+    trip(breaker)
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    with pytest.raises(ConnectionError):
+        breaker.track(fail)
+    assert breaker.state == OPEN
+
+
+def test_probe_closes_the_breaker_in_the_background():
+    probed = threading.Event()
+
+    def probe():
+        probed.set()
+        return True
+
+    breaker = CircuitBreaker("test-probe", slow_seconds=1, probe=probe)
+    trip(breaker)
+    time.sleep(0.06)
+
+    # Calls keep taking the fallback while the probe runs
+    assert not breaker.allow()
+    assert probed.wait(1)
+    for _ in range(100):
+        if breaker.state == CLOSED:
+            break
+        time.sleep(0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    assert [t["to"] for t in breaker.metrics()["transitions"]] == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_metrics_need_the_admin_token(tmp_path, monkeypatch):
+    from index import create_app
+
+    monkeypatch.setattr("campaigns.CAMPAIGN_DB_PATH", str(tmp_path / "campaigns.db"))
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    client = create_app().test_client()
+
+    assert client.get("/metrics").status_code == 403
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "openai" in response.get_json()["circuit_breakers"]
@@ -0,0 +1,87 @@
+import gzip
+import json
+
+import pytest
+
+from export_history import export, iter_export
+from user_history import close_current_call, write_history_file
+
+
+def write_history(folder, phone_number, visits, outcome=None):
+    history = {
+        "fname": "Ada",
+        "age": "30",
+        "phone_number": phone_number,
+        "current_call": [],
+        "entries": [{f"01/{i + 1:02d}/2024 09:00AM": [f"- visit {i}"]} for i in range(visits)],
+    }
+    if outcome:
+        history["visit_outcomes"] = {str(visits - 1): outcome}
+    write_history_file(history, str(folder / f"user_history_{phone_number}.json"))
+    return history
+
+
+def test_export_is_incremental_and_stats_see_latest_rows(tmp_path):
+    folder, out = tmp_path / "user_data", str(tmp_path / "exports")
+    folder.mkdir()
+    for phone_number in ("+15550000003", "+15550000001", "+15550000002"):
+        write_history(folder, phone_number, 2)
+
+    first, totals = export(str(folder), out)
+    assert totals == {"files": 3, "changed": 3, "rows": 6}
+
+    history = write_history(folder, "+15550000002", 2)
+    history["current_call"] = ["- cough"]
+    close_current_call(history, {"channel": "call", "leaf": "rest", "turns": 4})
+    write_history_file(history, str(folder / "user_history_+15550000002.json"))
+    second, totals = export(str(folder), out)
+    assert totals == {"files": 3, "changed": 1, "rows": 1}
+    assert first != second
+
+    rows = list(iter_export(out))
+    assert [(row["phone_number"], row["position"]) for row in rows] == [
+        ("+15550000001", 0),
+        ("+15550000001", 1),
+        ("+15550000002", 0),
+        ("+15550000002", 1),
+        ("+15550000002", 2),
+        ("+15550000003", 0),
+        ("+15550000003", 1),
+    ]
+    assert rows[4]["leaf"] == "rest" and rows[4]["turns"] == 4
+
+
+def test_later_parts_supersede_earlier_rows(tmp_path):
+    folder, out = tmp_path / "user_data", str(tmp_path / "exports")
+    folder.mkdir()
+    write_history(folder, "+15550000001", 1)
+    write_history(folder, "+15550000002", 1)
+    export(str(folder), out)
+
+    write_history(folder, "+15550000001", 1, {"channel": "sms", "leaf": "clinic", "turns": 2})
+    export(str(folder), out, full=True)
+
+    rows = list(iter_export(out))
+    assert len(rows) == 2
+    assert rows[0]["phone_number"] == "+15550000001"
+    assert rows[0]["channel"] == "sms"
+
+
+def test_part_out_of_phone_order_is_rejected(tmp_path):
+    out = tmp_path / "exports"
+    out.mkdir()
+    with gzip.open(out / "visits-20240101T000000000000.jsonl.gz", "wt") as part:
+        for phone_number in ("+15550000002", "+15550000001"):
+            row = {
+                "phone_number": phone_number,
+                "position": 0,
+                "visited_at": None,
+                "visit_time_raw": "01/01/2024",
+                "channel": None,
+                "leaf": None,
+                "turns": None,
+            }
+            part.write(json.dumps(row) + "\n")
+
+    with pytest.raises(ValueError):
+        list(iter_export(str(out)))
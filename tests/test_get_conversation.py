@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from state_backend import MemoryStateBackend
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setattr("campaigns.CAMPAIGN_DB_PATH", str(tmp_path / "campaigns.db"))
+    state = MemoryStateBackend()
+    monkeypatch.setattr("index.get_state_backend", lambda: state)
+    monkeypatch.setattr("index.LONG_POLL_MAX_SECONDS", 0.2)
+    return state
+
+
+@pytest.fixture
+def client(state):
+    from index import create_app
+
+    return create_app().test_client()
+
+
+def test_without_since_returns_the_whole_transcript(client, state):
+    state.append_message("CA1", {"role": "assistant", "content": "Hello"})
+    response = client.get("/get_conversation?call_sid=CA1")
+    assert response.get_json() == [{"role": "assistant", "content": "Hello"}]
+
+
+def test_since_returns_only_new_messages(client, state):
+    for content in ("one", "two", "three"):
+        state.append_message("CA1", {"role": "user", "content": content})
+
+    body = client.get("/get_conversation?call_sid=CA1&since=1").get_json()
+    assert [message["content"] for message in body["messages"]] == ["two", "three"]
+    assert body["next"] == 3
+
+
+def test_wait_returns_when_a_message_arrives(client, state):
+    timer = threading.Timer(
+        0.05, state.append_message, ("CA1", {"role": "user", "content": "late"})
+    )
+    timer.start()
+    body = client.get("/get_conversation?call_sid=CA1&since=0&wait=5").get_json()
+    timer.join()
+    assert [message["content"] for message in body["messages"]] == ["late"]
+    assert body["next"] == 1
+
+
+def test_wait_is_capped_and_times_out_empty(client):
+    started = time.monotonic()
+    body = client.get("/get_conversation?call_sid=CA1&since=0&wait=60").get_json()
+    assert body == {"messages": [], "next": 0}
+    assert time.monotonic() - started < 2
+
+
+@pytest.mark.parametrize(
+    "query", ["since=-1", "since=0&wait=-1", "since=0&wait=nan", "since=0&wait=inf", "since=0&wait=-inf"]
+)
+def test_bad_since_or_wait_is_rejected(client, query):
+    started = time.monotonic()
+    response = client.get(f"/get_conversation?call_sid=CA1&{query}")
+    assert response.status_code == 400
+    assert time.monotonic() - started < 0.2
@@ -0,0 +1,72 @@
+import time
+from types import SimpleNamespace
+
+from flask import Flask
+
+import idempotency
+from idempotency import load_result, run_once, store_result, sweep_expired, webhook_key
+from state_backend import MemoryStateBackend
+
+
+def webhook(turn="1", speech="yes", token=None):
+    return SimpleNamespace(
+        form={"CallSid": "CA1", "SpeechResult": speech, "Confidence": "0.91"},
+        args={"turn": turn},
+        headers={"I-Twilio-Idempotency-Token": token} if token else {},
+    )
+
+
+def test_twilio_token_identifies_the_delivery():
+    assert webhook_key(webhook(token="tok")) == "CA1:tok"
+    assert webhook_key(webhook(turn="1", token="tok")) == webhook_key(webhook(turn="2", token="tok"))
+
+
+def test_retries_of_a_turn_share_a_key():
+    assert webhook_key(webhook()) == webhook_key(webhook())
+
+
+def test_same_answer_on_another_turn_gets_its_own_key():
+    assert webhook_key(webhook(turn="1")) != webhook_key(webhook(turn="2"))
+    assert webhook_key(webhook(speech="yes")) != webhook_key(webhook(speech="no"))
+
+
+def test_run_once_replays_the_stored_response(monkeypatch):
+    state = MemoryStateBackend()
+    monkeypatch.setattr(idempotency, "get_state_backend", lambda: state)
+    calls = []
+
+    def handler():
+        calls.append(1)
+        return f"<Response>{len(calls)}</Response>"
+
+    with Flask(__name__).app_context():
+        first = run_once("CA1:key", handler)
+        retry = run_once("CA1:key", handler)
+
+    assert len(calls) == 1
+    assert retry.get_data(as_text=True) == first.get_data(as_text=True)
+    # The claim is released once the result is stored
+    assert state.get_value("turn-claim:CA1:key") is None
+
+
+def test_expired_results_are_deleted():
+    state = MemoryStateBackend()
+    store_result(state, "old", "body", 200, {})
+    state.values["turn-result:old"]["expires"] = time.time() - 1
+
+    assert load_result(state, "old") is None
+    assert state.get_value("turn-result:old") is None
+
+
+def test_sweep_removes_only_expired_entries(monkeypatch):
+    state = MemoryStateBackend()
+    now = time.time()
+    state.set_value("turn-result:old", {"expires": now - 1})
+    state.set_value("turn-result:new", {"expires": now + 60})
+    state.set_value("turn-claim:old", {"expires": now - 1})
+    state.set_value("tree:CA1", "root")
+    monkeypatch.setitem(idempotency.last_sweep, "at", 0.0)
+
+    sweep_expired(state)
+
+    assert set(state.values) == {"turn-result:new", "tree:CA1"}
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import intent_classifier
+from tree import decisionTree
+
+# Two real nodes where the same answer means different options
+NODE_A, NODE_B = sorted(decisionTree)[:2]
+
+
+@pytest.fixture
+def model_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "intent_model.json")
+    monkeypatch.setattr(intent_classifier, "INTENT_MODEL_PATH", path)
+    monkeypatch.setattr(intent_classifier, "loaded_model", {"mtime": None, "nodes": {}})
+    return path
+
+
+def examples(yes_label, no_label):
+    answers = ["yes", "yeah", "yes I do", "sure", "yep"] * 3
+    negatives = ["no", "nope", "no I don't", "not really", "nah"] * 3
+    return [(text, yes_label) for text in answers] + [(text, no_label) for text in negatives]
+
+
+def test_models_are_looked_up_by_node_name(model_path):
+    nodes = intent_classifier.train(
+        {NODE_A: examples("option_1", "option_2"), NODE_B: examples("option_2", "option_1")}
+    )
+    intent_classifier.save_model(nodes, model_path)
+
+    assert intent_classifier.predict_intent(NODE_A, "yes I do")[0] == "option_1"
+    assert intent_classifier.predict_intent(NODE_B, "yes I do")[0] == "option_2"
+
+
+def test_nodes_without_a_model_fall_back(model_path):
+    intent_classifier.save_model(
+        intent_classifier.train({NODE_A: examples("option_1", "option_2")}), model_path
+    )
+
+    assert intent_classifier.predict_intent(NODE_B, "yes") is None
+    assert intent_classifier.predict_intent(NODE_A, "") is None
+
+
+def test_small_or_single_option_nodes_get_no_model():
+    assert intent_classifier.train({NODE_A: examples("option_1", "option_2")[:10]}) == {}
+    assert intent_classifier.train({NODE_A: examples("option_1", "option_1")}) == {}
+
+
+def test_examples_are_logged_under_their_node(tmp_path, monkeypatch):
+    log_path = str(tmp_path / "intent_examples.jsonl")
+    monkeypatch.setattr(intent_classifier, "INTENT_LOG_PATH", log_path)
+    monkeypatch.setattr(intent_classifier, "INTENT_LOGGING", True)
+
+    intent_classifier.log_intent_example(NODE_A, "yes", "option_1")
+    intent_classifier.log_intent_example("not a node", "yes", "option_1")
+
+    with open(log_path) as f:
+        logged = [json.loads(line) for line in f]
+    assert [(e["node"], e["utterance"], e["label"]) for e in logged] == [(NODE_A, "yes", "option_1")]
+    assert intent_classifier.read_examples(log_path) == {NODE_A: [("yes", "option_1")]}
@@ -0,0 +1,83 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import openai_limiter
+from openai_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_SPECULATION,
+    PRIORITY_VOICE,
+    RateLimiter,
+    estimate_tokens,
+    openai_priority,
+    send,
+)
+
+
+def drained_limiter():
+    # 10 requests a second, one at a time
+    limiter = RateLimiter(rpm=600, tpm=10**6, burst_seconds=0.1)
+    limiter.acquire(0, PRIORITY_VOICE)
+    return limiter
+
+
+def test_waiters_are_served_in_priority_order():
+    limiter = drained_limiter()
+    served = []
+
+    def wait(name, priority):
+        limiter.acquire(0, priority)
+        served.append(name)
+
+    threads = []
+    for name, priority in (
+        ("background", PRIORITY_BACKGROUND),
+        ("speculation", PRIORITY_SPECULATION),
+        ("voice", PRIORITY_VOICE),
+    ):
+        threads.append(threading.Thread(target=wait, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(2)
+
+    assert served == ["voice", "speculation", "background"]
+    assert limiter.stats["background"]["max_wait_seconds"] > limiter.stats["voice"]["max_wait_seconds"]
+
+
+def test_requests_are_paced_to_the_rate():
+    limiter = drained_limiter()
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(0, PRIORITY_VOICE)
+    # Three more requests at 10 per second
+    assert time.monotonic() - started == pytest.approx(0.3, abs=0.1)
+
+
+def test_token_estimates_are_settled_against_real_usage():
+    limiter = RateLimiter(rpm=600, tpm=6000, burst_seconds=1)
+    limiter.acquire(80, PRIORITY_VOICE)
+    assert limiter.tokens == pytest.approx(20, abs=1)
+    limiter.settle(80, 30)
+    assert limiter.tokens == pytest.approx(70, abs=1)
+    assert estimate_tokens("x" * 400) == 100 + openai_limiter.COMPLETION_TOKEN_ESTIMATE
+
+
+def test_rate_limited_requests_are_retried_after_retry_after(monkeypatch):
+    limiter = RateLimiter(rpm=6000, tpm=10**6)
+    monkeypatch.setattr(openai_limiter, "get_limiter", lambda: limiter)
+    responses = [
+        SimpleNamespace(status_code=429, headers={"Retry-After": "0.2"}),
+        SimpleNamespace(status_code=200, headers={}),
+    ]
+
+    started = time.monotonic()
+    with openai_priority(PRIORITY_VOICE):
+        response = send(lambda: responses.pop(0))
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.2
+    assert limiter.stats["rate_limited"] == 1
+    assert limiter.stats["voice"]["requests"] == 2
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+import sms_buffer
+from conversation_logic import record_usage
+
+
+@pytest.fixture(autouse=True)
+def fresh_buffers(monkeypatch):
+    monkeypatch.setattr(sms_buffer, "DEBOUNCE_SECONDS", 0.05)
+    monkeypatch.setattr(sms_buffer, "inbound_buffers", {})
+    monkeypatch.setattr(
+        sms_buffer,
+        "stats",
+        {"fragments": 0, "turns": 0, "superseded": 0, "failed": 0, "llm_calls": 0},
+    )
+
+
+def turn_runner(llm_calls=3, fail=False):
+    """A run_turn that records its merged text and makes `llm_calls` calls."""
+    committed = []
+    done = threading.Event()
+
+    def run_turn(merged_text):
+        for _ in range(llm_calls):
+            record_usage({"total_tokens": 10})
+        if fail:
+            raise RuntimeError("history unreadable")
+
+        def commit():
+            committed.append(merged_text)
+            done.set()
+
+        return commit
+
+    return run_turn, committed, done
+
+
+def test_fragments_are_coalesced_into_one_turn():
+    run_turn, committed, done = turn_runner()
+    for text in ("i have", "a fever", "since monday"):
+        sms_buffer.buffer_message("+15550000001", text, run_turn)
+
+    assert done.wait(2)
+    assert committed == ["i have a fever since monday"]
+    assert sms_buffer.inbound_buffers == {}
+    assert sms_buffer.stats["llm_calls"] == 3
+    assert sms_buffer.stats["turns"] == 1
+
+
+def test_llm_calls_are_measured_not_assumed():
+    # A turn answered by the local intent model makes fewer calls
+    run_turn, _, done = turn_runner(llm_calls=1)
+    sms_buffer.buffer_message("+15550000001", "yes", run_turn)
+
+    assert done.wait(2)
+    assert sms_buffer.stats["llm_calls"] == 1
+
+
+def test_a_turn_superseded_by_a_newer_fragment_is_discarded():
+    sms_buffer.add_fragment("+15550000001", "i have", lambda: None)
+    pending = sms_buffer.take_fragments("+15550000001")
+    sms_buffer.add_fragment("+15550000001", "a fever", lambda: None)
+
+    assert not sms_buffer.finish_turn("+15550000001", pending[0], pending[1], 3)
+    assert sms_buffer.stats["superseded"] == 1
+    assert sms_buffer.inbound_buffers["+15550000001"]["messages"] == ["i have", "a fever"]
+
+
+def test_a_failed_turn_still_clears_the_buffer():
+    run_turn, _, _ = turn_runner(fail=True)
+    sms_buffer.buffer_message("+15550000001", "i have a fever", run_turn)
+    deadline = time.monotonic() + 2
+    while sms_buffer.stats["failed"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sms_buffer.inbound_buffers == {}
+
+    run_turn, committed, done = turn_runner()
+    sms_buffer.buffer_message("+15550000001", "yes", run_turn)
+    assert done.wait(2)
+
+    # The failed fragment is not merged into the next turn
+    assert committed == ["yes"]
+    assert sms_buffer.stats["failed"] == 1
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from state_backend import MemoryStateBackend, SQLiteStateBackend, StateBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStateBackend(str(tmp_path / "state.db"))
+    return MemoryStateBackend()
+
+
+def test_values(state):
+    assert state.get_value("tree:CA1", "root") == "root"
+    assert state.set_value_if_absent("tree:CA1", "fever")
+    assert not state.set_value_if_absent("tree:CA1", "cough")
+    assert state.get_value("tree:CA1") == "fever"
+    state.delete_value("tree:CA1")
+    assert state.get_value("tree:CA1") is None
+
+
+def test_messages(state):
+    state.append_message("CA1", {"speaker": "ai", "text": "Hello"})
+    state.append_message("CA1", {"speaker": "user", "text": "Hi"})
+    assert [m["text"] for m in state.get_messages("CA1", since=1)] == ["Hi"]
+    assert state.wait_for_messages("CA1", since=2, timeout=0.1) == []
+
+
+def test_delete_expired(state):
+    now = time.time()
+    state.set_value("turn-result:a", {"expires": now - 1})
+    state.set_value("turn-result:b", {"expires": now + 60})
+    state.set_value("turn-claim:c", {"expires": now - 1})
+
+    assert state.delete_expired("turn-result:", now) == 1
+    assert state.get_value("turn-result:a") is None
+    assert state.get_value("turn-result:b") is not None
+    assert state.get_value("turn-claim:c") is not None
+
+
+def test_backends_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        StateBackend()
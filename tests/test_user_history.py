@@ -0,0 +1,143 @@
+import json
+
+import user_history
+from user_history import (
+    load_history_page,
+    mark_processing,
+    patch_history_entry,
+    read_history_index,
+    write_history_file,
+)
+
+
+def make_history(visits):
+    return {
+        "fname": "Ada",
+        "phone_number": "+15550000000",
+        "current_call": [],
+        "entries": [{f"01/{i % 28 + 1:02d}/2024 09:00AM": [f"- visit {i}"]} for i in range(visits)],
+    }
+
+
+def test_history_file_stays_plain_json(tmp_path):
+    filename = str(tmp_path / "user_history_+15550000000.json")
+    history = make_history(3)
+    write_history_file(history, filename)
+
+    with open(filename) as f:
+        assert json.load(f) == history
+
+
+def test_pages_walk_visits_newest_first(tmp_path):
+    filename = str(tmp_path / "user_history_+15550000000.json")
+    write_history_file(make_history(25), filename)
+
+    positions, cursor, pages = [], None, 0
+    while True:
+        page = load_history_page(filename, cursor, limit=10)
+        positions += [entry["position"] for entry in page["entries"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert positions == list(range(24, -1, -1))
+    assert load_history_page(filename, 5, limit=1)["entries"][0]["summary"] == ["- visit 4"]
+
+
+def test_missing_history_has_no_pages(tmp_path):
+    assert load_history_page(str(tmp_path / "missing.json")) == {"entries": [], "next_cursor": None}
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    filename = str(tmp_path / "user_history_+15550000000.json")
+    write_history_file(make_history(2), filename)
+
+    # Written by something that does not maintain the index
+    history = make_history(4)
+    with open(filename, "w") as f:
+        json.dump(history, f)
+
+    index = read_history_index(filename)
+    assert len(index["offsets"]) == 4
+    page = load_history_page(filename, limit=10)
+    assert [entry["position"] for entry in page["entries"]] == [3, 2, 1, 0]
+
+
+def test_patch_clears_processing_flag(tmp_path):
+    filename = str(tmp_path / "user_history_+15550000000.json")
+    history = make_history(3)
+    mark_processing(history, 2)
+    write_history_file(history, filename)
+    assert load_history_page(filename, 3, limit=1)["entries"][0]["processing"]
+
+    patch_history_entry(filename, 2, {"01/03/2024 09:00AM": ["- processed"]})
+
+    entry = load_history_page(filename, 3, limit=1)["entries"][0]
+    assert entry["summary"] == ["- processed"]
+    assert not entry["processing"]
+
+
+def test_processing_flag_expires(tmp_path, monkeypatch):
+    filename = str(tmp_path / "user_history_+15550000000.json")
+    monkeypatch.setattr(user_history, "PROCESSING_TIMEOUT", -1)
+    history = make_history(1)
+    mark_processing(history, 0)
+    write_history_file(history, filename)
+
+    assert not load_history_page(filename)["entries"][0]["processing"]
+
+
+def test_turn_save_keeps_a_webform_patch_made_meanwhile(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_history, "FOLDER_PATH", str(tmp_path))
+    phone_number = "+15550000000"
+    filename = str(tmp_path / f"user_history_{phone_number}.json")
+    history = make_history(2)
+    history["entries"].append({"01/03/2024 09:00AM": ["- Patient filled out webform.", "- cough"]})
+    mark_processing(history, 2)
+    write_history_file(history, filename)
+
+    # A call turn loads the history, then the webform's processing finishes
+    turn = user_history.load_user_history(phone_number)
+    patch_history_entry(filename, 2, {"01/03/2024 09:00AM": ["- Patient filled out webform.", "- Cough"]})
+
+    turn["current_call"].append("- Fever")
+    turn["age"] = "41"
+    user_history.save_user_history(phone_number, turn)
+    turn["current_call"].append("- Chills")
+    user_history.close_current_call(turn, {"channel": "call", "leaf": "influenza"})
+    user_history.save_user_history(phone_number, turn)
+
+    with open(filename) as f:
+        saved = json.load(f)
+    assert saved["entries"][2]["01/03/2024 09:00AM"][1] == "- Cough"
+    assert saved["processing_entries"] == {}
+    assert len(saved["entries"]) == 4
+    assert list(saved["entries"][3].values()) == [["- Fever", "- Chills"]]
+    assert saved["visit_outcomes"] == {"3": {"channel": "call", "leaf": "influenza"}}
+    assert saved["age"] == "41" and saved["current_call"] == []
+
+
+def test_turn_save_shifts_visits_past_a_new_webform_visit(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_history, "FOLDER_PATH", str(tmp_path))
+    phone_number = "+15550000000"
+    filename = str(tmp_path / f"user_history_{phone_number}.json")
+    write_history_file(make_history(1), filename)
+
+    turn = user_history.load_user_history(phone_number)
+    # The webform appends a visit while the turn runs
+    with open(filename) as f:
+        stored = json.load(f)
+    stored["entries"].append({"01/05/2024 09:00AM": ["- Patient filled out webform."]})
+    write_history_file(stored, filename)
+
+    turn["current_call"].append("- Fever")
+    user_history.close_current_call(turn, {"channel": "sms", "leaf": None})
+    user_history.save_user_history(phone_number, turn)
+
+    with open(filename) as f:
+        saved = json.load(f)
+    assert len(saved["entries"]) == 3
+    assert list(saved["entries"][2].values()) == [["- Fever"]]
+    assert saved["visit_outcomes"] == {"2": {"channel": "sms", "leaf": None}}
@@ -1,18 +1,62 @@
-from dotenv import load_dotenv
+import hashlib
 import os
-import requests
-import boto3
-from botocore.exceptions import NoCredentialsError
-from botocore.config import Config
-from conversation_logic import generate_openai_response
-
-load_dotenv()
+import time
+from audio_formats import (
+    AUDIO_FORMATS,
+    TELEPHONY_AUDIO_FORMAT,
+    audio_stats,
+    ulaw_to_wav,
+)
+from audio_store import audio_url, local_store_enabled, store_audio
+from circuit_breaker import CircuitBreaker
+from clients import get_aiohttp_session, get_http_session, get_s3_client
+from conversation_logic import (
+    generate_openai_response,
+    generate_openai_response_async,
+)
 
 # AWS S3 bucket details
 S3_BUCKET_NAME = "jhubuckethophacks"
-S3_OBJECT_NAME = "doctor1.mp3"  # Name of the file when uploaded to S3
+S3_OBJECT_STEM = "doctor1"  # Prefix of uploaded file names, see s3_object_name()
 S3_REGION = "us-east-2"  # Ensure this matches your bucket's region
 
+# (connect, read) timeouts for ElevenLabs requests, in seconds
+ELEVENLABS_TIMEOUT = (3.05, float(os.getenv("ELEVENLABS_TIMEOUT", "10")))
+
+# Calls slower than these count against the services' circuit breakers
+ELEVENLABS_SLOW_SECONDS = float(os.getenv("ELEVENLABS_SLOW_SECONDS", "8"))
+S3_SLOW_SECONDS = float(os.getenv("S3_SLOW_SECONDS", "5"))
+
+
+def elevenlabs_base_url():
+    return os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")
+
+
+def probe_elevenlabs():
+    response = get_http_session().get(
+        f"{elevenlabs_base_url()}/models",
+        headers={"xi-api-key": os.getenv("ELEVEN_API_KEY") or ""},
+        timeout=5,
+    )
+    return response.status_code < 500
+
+
+def probe_s3():
+    from botocore.exceptions import ClientError
+
+    try:
+        get_s3_client().head_bucket(Bucket=S3_BUCKET_NAME)
+    except ClientError:
+        # S3 answered (e.g. 403); it is reachable
+        pass
+    return True
+
+
+elevenlabs_breaker = CircuitBreaker(
+    "elevenlabs", ELEVENLABS_SLOW_SECONDS, probe_elevenlabs
+)
+s3_breaker = CircuitBreaker("s3", S3_SLOW_SECONDS, probe_s3)
+
 # Language voice mapping
 language_voice_map = {
     "en": {"voice_id": "mCQMfsqGDT6IDkEKR20a", "language": "English"},
@@ -20,87 +64,218 @@ language_voice_map = {
     "ta": {"voice_id": "mCQMfsqGDT6IDkEKR20a", "language": "Tamil"},
 }
 
-# Ensure correct signature version and region are used
-my_config = Config(region_name="us-east-2", signature_version="s3v4")
 
-# AWS credentials are assumed to be configured via environment or AWS CLI
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    config=my_config,
-)
+def translation_prompt(text, target_language):
+    return f"Translate the following text to {target_language}:\n\n{text}\n\nTranslation:"
 
 
 def translate_text(text, target_language):
     """
     Translates the given text to the target language using OpenAI's GPT model.
     """
-    prompt = (
-        f"Translate the following text to {target_language}:\n\n{text}\n\nTranslation:"
-    )
-    translated_text = generate_openai_response(prompt)
+    translated_text = generate_openai_response(translation_prompt(text, target_language))
+    if translated_text is None:
+        print("Translation failed; using the untranslated text")
+        return text
     return translated_text.strip()
 
 
-def text_to_speech(text, language="en"):
-    print(f"Starting text_to_speech function with text: {text[:50]}... and language: {language}")
+async def translate_text_async(text, target_language):
+    translated_text = await generate_openai_response_async(
+        translation_prompt(text, target_language)
+    )
+    if translated_text is None:
+        print("Translation failed; using the untranslated text")
+        return text
+    return translated_text.strip()
+
 
+def synthesize_speech(text, language="en", audio_format=TELEPHONY_AUDIO_FORMAT):
+    """
+    Returns the encoded audio for `text` in `audio_format` (see
+    audio_formats.AUDIO_FORMATS), or None if ElevenLabs did not return audio.
+    """
     if language != "en":
         print(f"Translating text to {language}")
         text = translate_text(text, language_voice_map.get(language)["language"])
         print(f"Translated text: {text[:50]}...")
 
     CHUNK_SIZE = 1024
+    format_info = AUDIO_FORMATS[audio_format]
+    url, params, data, headers = speech_request(text, language, format_info)
+
+    if not elevenlabs_breaker.allow():
+        print("ElevenLabs circuit is open; skipping speech synthesis")
+        return None
+    print(f"Sending request to Eleven Labs API for {format_info['output_format']}")
+    import requests
+
+    try:
+        response = elevenlabs_breaker.track(
+            get_http_session().post,
+            url,
+            params=params,
+            json=data,
+            headers=headers,
+            timeout=ELEVENLABS_TIMEOUT,
+            is_failure=lambda response: response.status_code >= 500,
+        )
+    except requests.RequestException as e:
+        print(f"Eleven Labs request failed: {e}")
+        return None
+    print(f"Response status code: {response.status_code}")
+    print(f"Response headers: {response.headers}")
+
+    if response.status_code != 200 or not response.headers.get(
+        "Content-Type", ""
+    ).startswith("audio/"):
+        print("Failed to retrieve valid audio data.")
+        print(f"Response text: {response.text}")
+        return None
+
+    print("Successfully received audio data")
+    binary_audio_data = b""
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        if chunk:
+            binary_audio_data += chunk
+
+    return finish_audio(binary_audio_data, format_info)
+
+
+async def synthesize_speech_async(
+    text, language="en", audio_format=TELEPHONY_AUDIO_FORMAT
+):
+    """Async counterpart of synthesize_speech()."""
+    import asyncio
+
+    import aiohttp
+
+    if language != "en":
+        text = await translate_text_async(
+            text, language_voice_map.get(language)["language"]
+        )
+
+    format_info = AUDIO_FORMATS[audio_format]
+    url, params, data, headers = speech_request(text, language, format_info)
+    if not elevenlabs_breaker.allow():
+        print("ElevenLabs circuit is open; skipping speech synthesis")
+        return None
+
+    async def fetch():
+        async with get_aiohttp_session().post(
+            url,
+            params=params,
+            json=data,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=ELEVENLABS_TIMEOUT[0], sock_read=ELEVENLABS_TIMEOUT[1]
+            ),
+        ) as response:
+            print(f"Response status code: {response.status}")
+            if response.status != 200 or not response.headers.get(
+                "Content-Type", ""
+            ).startswith("audio/"):
+                print("Failed to retrieve valid audio data.")
+                print(f"Response text: {await response.text()}")
+                return response.status, None
+            return response.status, await response.read()
+
+    try:
+        status, binary_audio_data = await elevenlabs_breaker.track_async(
+            fetch, is_failure=lambda result: result[0] >= 500
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Eleven Labs request failed: {e}")
+        return None
+    if binary_audio_data is None:
+        return None
+    return finish_audio(binary_audio_data, format_info)
+
+
+def speech_request(text, language, format_info):
+    """Returns (url, params, json, headers) for an ElevenLabs synthesis request."""
     voice_info = language_voice_map.get(language)
     voice_id = voice_info["voice_id"] if voice_info else None
-    url = "https://api.elevenlabs.io/v1/text-to-speech/" + voice_id
+    url = f"{elevenlabs_base_url()}/text-to-speech/{voice_id}"
     print(f"Using voice ID: {voice_id}")
 
     headers = {
-        "Accept": "audio/mpeg",
+        "Accept": "audio/*",
         "Content-Type": "application/json",
         "xi-api-key": os.getenv("ELEVEN_API_KEY"),
     }
-    print(f"API Key: {os.getenv('ELEVEN_API_KEY')[:5]}...")  # Print first 5 chars of API key
 
     data = {
         "text": text,
         "model_id": "eleven_monolingual_v1",
         "voice_settings": {"stability": 0.7, "similarity_boost": 0.8},
     }
+    # requests drops None headers (no API key set); aiohttp would reject them
+    headers = {name: value for name, value in headers.items() if value is not None}
+    return url, {"output_format": format_info["output_format"]}, data, headers
 
-    print("Sending request to Eleven Labs API")
-    response = requests.post(url, json=data, headers=headers)
-    print(f"Response status code: {response.status_code}")
-    print(f"Response headers: {response.headers}")
 
-    if response.status_code != 200 or response.headers.get("Content-Type") != "audio/mpeg":
-        print("Failed to retrieve valid audio data.")
-        print(f"Response text: {response.text}")
+def finish_audio(binary_audio_data, format_info):
+    if format_info["wrap_ulaw"]:
+        binary_audio_data = ulaw_to_wav(binary_audio_data)
+    print(f"Total audio data size: {len(binary_audio_data)} bytes")
+    return binary_audio_data
+
+
+def s3_object_name(object_stem, binary_audio_data, format_info):
+    """
+    Keys each clip by its content, so concurrent turns never overwrite each
+    other's prompts (which are rephrased from personal history) before Twilio
+    fetches them. Expire old objects with a bucket lifecycle rule; the
+    presigned URLs only last an hour.
+    """
+    digest = hashlib.sha256(binary_audio_data).hexdigest()[:32]
+    return f"{object_stem}-{digest}.{format_info['extension']}"
+
+
+def text_to_speech(
+    text, language="en", object_stem=S3_OBJECT_STEM, audio_format=TELEPHONY_AUDIO_FORMAT
+):
+    print(f"Starting text_to_speech function with text: {text[:50]}... and language: {language}")
+    if local_store_enabled():
+        return text_to_local_url(text, language, audio_format)
+
+    # Audio that cannot be uploaded is not worth synthesizing
+    if not s3_breaker.allow():
+        print("S3 circuit is open; skipping speech synthesis")
         return None
 
-    print("Successfully received audio data")
-    binary_audio_data = b""
-    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-        if chunk:
-            binary_audio_data += chunk
-    print(f"Total audio data size: {len(binary_audio_data)} bytes")
+    synthesis_started = time.perf_counter()
+    binary_audio_data = synthesize_speech(text, language, audio_format)
+    if binary_audio_data is None:
+        return None
+    stats = audio_stats(binary_audio_data, audio_format)
+    stats["synthesis_seconds"] = time.perf_counter() - synthesis_started
+
+    format_info = AUDIO_FORMATS[audio_format]
+    object_name = s3_object_name(object_stem, binary_audio_data, format_info)
+
+    from botocore.exceptions import NoCredentialsError
 
     try:
         print(f"Uploading to S3 bucket: {S3_BUCKET_NAME}")
-        s3_client.put_object(
+        s3_client = get_s3_client()
+        upload_started = time.perf_counter()
+        s3_breaker.track(
+            s3_client.put_object,
             Bucket=S3_BUCKET_NAME,
-            Key=S3_OBJECT_NAME,
+            Key=object_name,
             Body=binary_audio_data,
-            ContentType="audio/mpeg",
+            ContentType=format_info["content_type"],
         )
-        print(f"File uploaded successfully to https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{S3_OBJECT_NAME}")
+        stats["upload_seconds"] = time.perf_counter() - upload_started
+        print(f"Audio stats: {stats}")
+        print(f"File uploaded successfully to https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{object_name}")
 
         print("Generating pre-signed URL")
         presigned_url = s3_client.generate_presigned_url(
             "get_object",
-            Params={"Bucket": S3_BUCKET_NAME, "Key": S3_OBJECT_NAME},
+            Params={"Bucket": S3_BUCKET_NAME, "Key": object_name},
             ExpiresIn=3600,
         )
         print(f"Pre-signed URL generated: {presigned_url[:50]}...")
@@ -111,3 +286,93 @@ def text_to_speech(text, language="en"):
         print(f"Failed to upload file: {e}")
 
     print("Exiting text_to_speech function")
+
+
+def text_to_local_url(text, language, audio_format):
+    """text_to_speech() for AUDIO_STORE=local: the clip is served by /audio/<name>."""
+    synthesis_started = time.perf_counter()
+    binary_audio_data = synthesize_speech(text, language, audio_format)
+    if binary_audio_data is None:
+        return None
+    stats = audio_stats(binary_audio_data, audio_format)
+    stats["synthesis_seconds"] = time.perf_counter() - synthesis_started
+
+    store_started = time.perf_counter()
+    try:
+        name = store_audio(binary_audio_data, AUDIO_FORMATS[audio_format]["extension"])
+    except OSError as e:
+        print(f"Failed to store audio locally: {e}")
+        return None
+    stats["store_seconds"] = time.perf_counter() - store_started
+    print(f"Audio stats: {stats}")
+    return audio_url(name)
+
+
+async def text_to_speech_async(
+    text, language="en", object_stem=S3_OBJECT_STEM, audio_format=TELEPHONY_AUDIO_FORMAT
+):
+    """
+    Async counterpart of text_to_speech(). boto3 has no async client, so the
+    upload is a PUT to a presigned URL; presigning is a local computation.
+    """
+    import asyncio
+
+    import aiohttp
+
+    if local_store_enabled():
+        binary_audio_data = await synthesize_speech_async(text, language, audio_format)
+        if binary_audio_data is None:
+            return None
+        try:
+            name = await asyncio.to_thread(
+                store_audio, binary_audio_data, AUDIO_FORMATS[audio_format]["extension"]
+            )
+        except OSError as e:
+            print(f"Failed to store audio locally: {e}")
+            return None
+        return audio_url(name)
+
+    if not s3_breaker.allow():
+        print("S3 circuit is open; skipping speech synthesis")
+        return None
+    binary_audio_data = await synthesize_speech_async(text, language, audio_format)
+    if binary_audio_data is None:
+        return None
+
+    format_info = AUDIO_FORMATS[audio_format]
+    object_name = s3_object_name(object_stem, binary_audio_data, format_info)
+    params = {"Bucket": S3_BUCKET_NAME, "Key": object_name}
+
+    from botocore.exceptions import NoCredentialsError
+
+    try:
+        s3_client = get_s3_client()
+        put_url = s3_client.generate_presigned_url(
+            "put_object",
+            Params=dict(params, ContentType=format_info["content_type"]),
+            ExpiresIn=300,
+        )
+
+        async def upload():
+            async with get_aiohttp_session().put(
+                put_url,
+                data=binary_audio_data,
+                headers={"Content-Type": format_info["content_type"]},
+                timeout=aiohttp.ClientTimeout(total=S3_SLOW_SECONDS * 2),
+            ) as response:
+                return response.status
+
+        status = await s3_breaker.track_async(
+            upload, is_failure=lambda status: status >= 500
+        )
+        if status != 200:
+            print(f"Failed to upload file: HTTP {status}")
+            return None
+        return s3_client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=3600
+        )
+    except NoCredentialsError:
+        print("Credentials not available. Please check your AWS credentials.")
+    except Exception as e:
+        print(f"Failed to upload file: {e}")
+    return None
@@ -0,0 +1,92 @@
+import logging
+import threading
+import uuid
+from types import SimpleNamespace
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class LocalTwilioClient:
+    """
+    Stand-in for twilio.rest.Client covering what the app uses: calls.create,
+    calls(sid).update and messages.create, plus the async variants of the
+    latter two. Requests are recorded instead of
+    sent, and placed calls report `call_outcome` to their status_callback
+    after `call_duration` seconds, the way Twilio would.
+
+    Enable it with TWILIO_STANDIN=1 to exercise campaigns and call flows offline.
+    """
+
+    def __init__(self, call_outcome="completed", call_duration=1.0):
+        self.call_outcome = call_outcome
+        self.call_duration = call_duration
+        self.created_calls = []
+        self.updated_calls = []
+        self.created_messages = []
+        self.lock = threading.Lock()
+        self.messages = SimpleNamespace(
+            create=self.create_message, create_async=self.create_message_async
+        )
+
+    @property
+    def calls(self):
+        return CallList(self)
+
+    def create_call(self, **kwargs):
+        sid = "CA" + uuid.uuid4().hex
+        with self.lock:
+            self.created_calls.append(dict(kwargs, sid=sid))
+
+        status_callback = kwargs.get("status_callback")
+        if status_callback:
+            timer = threading.Timer(
+                self.call_duration,
+                self.send_status_callback,
+                args=(status_callback, sid, kwargs.get("to")),
+            )
+            timer.daemon = True
+            timer.start()
+        return SimpleNamespace(sid=sid, to=kwargs.get("to"), status="queued")
+
+    def create_message(self, **kwargs):
+        sid = "SM" + uuid.uuid4().hex
+        with self.lock:
+            self.created_messages.append(dict(kwargs, sid=sid))
+        return SimpleNamespace(sid=sid, to=kwargs.get("to"), status="queued")
+
+    async def create_message_async(self, **kwargs):
+        return self.create_message(**kwargs)
+
+    def send_status_callback(self, url, sid, to_number):
+        try:
+            requests.post(
+                url,
+                data={"CallSid": sid, "CallStatus": self.call_outcome, "To": to_number},
+                timeout=5,
+            )
+        except requests.RequestException as e:
+            logger.warning(f"Stand-in could not deliver status callback to {url}: {e}")
+
+
+class CallList:
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, sid):
+        return SimpleNamespace(
+            update=lambda **kwargs: self.update(sid, **kwargs),
+            update_async=lambda **kwargs: self.update_async(sid, **kwargs),
+        )
+
+    def create(self, **kwargs):
+        return self.client.create_call(**kwargs)
+
+    def update(self, sid, **kwargs):
+        with self.client.lock:
+            self.client.updated_calls.append(dict(kwargs, sid=sid))
+        return SimpleNamespace(sid=sid)
+
+    async def update_async(self, sid, **kwargs):
+        return self.update(sid, **kwargs)
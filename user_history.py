@@ -1,11 +1,103 @@
+import copy
+import fcntl
 import json
+from contextlib import contextmanager
 from datetime import datetime
 import os
+import time
 
 from flask import redirect, url_for
 
 FOLDER_PATH = "static/user_data"
 
+# Number of visits returned per page of the medical record
+RECORD_PAGE_SIZE = 10
+
+# A visit still being processed in the background (see processing_entries)
+# is shown as processed after this long, even if the processing never finished
+PROCESSING_TIMEOUT = 120
+
+
+@contextmanager
+def history_lock(filename):
+    """
+    Exclusive lock on one history file, shared by every thread and worker
+    process: an flock on the sidecar <filename>.lock. Not reentrant.
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(f"{filename}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def mark_processing(user_history, position):
+    """Flags the visit at `position` as being processed, until PROCESSING_TIMEOUT."""
+    processing = user_history.get("processing_entries")
+    if not isinstance(processing, dict):
+        # Files written before the deadline was added hold a list of positions
+        processing = user_history["processing_entries"] = {}
+    processing[str(position)] = time.time() + PROCESSING_TIMEOUT
+
+
+def processing_positions(header):
+    """The positions of visits still being processed, whose deadline has not passed."""
+    processing = header.get("processing_entries")
+    if not isinstance(processing, dict):
+        return set()
+    now = time.time()
+    return {int(position) for position, deadline in processing.items() if deadline > now}
+
+
+# Parts of the history other writers change while a turn holds its copy:
+# webform visits are appended, and the background processing rewrites them
+# and their flags (see merge_history)
+MERGED_FIELDS = ("entries", "visit_outcomes", "processing_entries")
+
+
+class LoadedHistory(dict):
+    """
+    A user history with the copy it was loaded as, so save_user_history can
+    apply only the changes made since.
+    """
+
+    def __init__(self, user_history):
+        super().__init__(user_history)
+        self.loaded = copy.deepcopy(user_history)
+
+
+def merge_history(stored, loaded, current):
+    """
+    Applies the changes a turn made to its copy (`loaded` -> `current`) to
+    `stored`, the history on disk now. Header fields the turn changed are
+    taken from it; visits it added are appended after any added since it
+    loaded, with their visit_outcomes positions shifted to match.
+    """
+    merged = dict(stored)
+    for key in set(loaded) | set(current):
+        if key in MERGED_FIELDS:
+            continue
+        if key not in current:
+            merged.pop(key, None)
+        elif current[key] != loaded.get(key):
+            merged[key] = current[key]
+
+    loaded_count = len(loaded.get("entries", []))
+    entries = list(stored.get("entries", []))
+    shift = len(entries) - loaded_count
+    merged["entries"] = entries + current.get("entries", [])[loaded_count:]
+
+    loaded_outcomes = loaded.get("visit_outcomes", {})
+    outcomes = dict(stored.get("visit_outcomes", {}))
+    for position, outcome in current.get("visit_outcomes", {}).items():
+        if loaded_outcomes.get(position) != outcome:
+            outcomes[str(int(position) + shift)] = outcome
+    if outcomes:
+        merged["visit_outcomes"] = outcomes
+    return merged
+
 
 def load_user_history(phone_number):
     print("phone_number: ", phone_number)
@@ -13,7 +105,7 @@ def load_user_history(phone_number):
     if os.path.exists(filename):
         print("filename: ", filename)
         with open(filename, "r") as f:
-            return json.load(f)
+            return LoadedHistory(json.load(f))
 
     # return {
     #     "entries": [],
@@ -26,7 +118,7 @@ def load_user_history(phone_number):
     #     "current_call": []
     # }
     print("phone_number: ", phone_number)
-    return {
+    return LoadedHistory({
         "entries": [],
         "fname": "Nathan",
         "lname": "Zhao",
@@ -38,17 +130,158 @@ def load_user_history(phone_number):
         "username": phone_number,
         "password": "password",
         "phone_number": phone_number,
-    }
+    })
 
 
 def save_user_history(phone_number, user_history):
+    """
+    Saves a history from load_user_history. Turns hold their copy for
+    seconds, so the file is re-read under the lock and only the turn's own
+    changes are written over it (see merge_history).
+    """
     print("Saving user history...")
     filename = f"{FOLDER_PATH}/user_history_{phone_number}.json"
-    with open(filename, "w") as f:
-        json.dump(user_history, f, indent=2)
+    with history_lock(filename):
+        merged = user_history
+        loaded = getattr(user_history, "loaded", None)
+        if loaded is not None and os.path.exists(filename):
+            with open(filename, "r") as f:
+                stored = json.load(f)
+            if stored != loaded:
+                merged = merge_history(stored, loaded, user_history)
+        write_history_file(merged, filename)
+    if loaded is not None:
+        # A later save of the same copy only applies what changed after this one
+        user_history.loaded = copy.deepcopy(dict(user_history))
     print("User history saved successfully")
 
 
+def index_path(filename):
+    # The visit index lives next to the history file: user_history_<phone>.idx
+    return os.path.splitext(filename)[0] + ".idx"
+
+
+def write_history_file(user_history, filename):
+    """
+    Writes a user history file with one visit per line and records the byte
+    offset of every visit in a sidecar index, so a page of visits can be read
+    without parsing the whole history. The file is still plain JSON.
+    """
+    header = {k: v for k, v in user_history.items() if k != "entries"}
+    header_text = json.dumps(header, indent=2)
+    if header:
+        prefix = header_text[: -len("\n}")] + ",\n"
+    else:
+        prefix = "{\n"
+
+    body = bytearray((prefix + '  "entries": [\n').encode("utf-8"))
+    offsets = []
+    entries = user_history.get("entries", [])
+    for i, entry in enumerate(entries):
+        body += b"    "
+        line = json.dumps(entry).encode("utf-8")
+        offsets.append([len(body), len(line)])
+        body += line
+        if i < len(entries) - 1:
+            body += b","
+        body += b"\n"
+    body += b"  ]\n}\n"
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(body)
+    os.replace(tmp_filename, filename)
+
+    stat = os.stat(filename)
+    index = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "header": header,
+        "offsets": offsets,
+    }
+    tmp_index = f"{index_path(filename)}.tmp"
+    with open(tmp_index, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_index, index_path(filename))
+    return index
+
+
+def read_history_index(filename):
+    """
+    Returns the visit index for a history file, rebuilding it (and rewriting
+    the file in the indexed layout) when it is missing or out of date.
+    """
+    if not os.path.exists(filename):
+        return None
+
+    stat = os.stat(filename)
+    try:
+        with open(index_path(filename), "r") as f:
+            index = json.load(f)
+        if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with history_lock(filename):
+        with open(filename, "r") as f:
+            user_history = json.load(f)
+        return write_history_file(user_history, filename)
+
+
+def iter_history_entries(filename, index, cursor=None, limit=RECORD_PAGE_SIZE):
+    """
+    Yields (position, date, summary) for visits newest first, starting just
+    before `cursor` (a visit position), reading only the visits on the page.
+    """
+    offsets = index["offsets"]
+    end = len(offsets) if cursor is None else max(0, min(cursor, len(offsets)))
+    start = max(0, end - limit)
+    with open(filename, "rb") as f:
+        for position in range(end - 1, start - 1, -1):
+            offset, length = offsets[position]
+            f.seek(offset)
+            entry = json.loads(f.read(length))
+            for date, summary in entry.items():
+                yield position, date, summary
+
+
+def load_history_page(filename, cursor=None, limit=RECORD_PAGE_SIZE):
+    index = read_history_index(filename)
+    if index is None:
+        return {"entries": [], "next_cursor": None}
+
+    entries = [
+        {"position": position, "date": date, "summary": summary}
+        for position, date, summary in iter_history_entries(
+            filename, index, cursor, limit
+        )
+    ]
+    processing = processing_positions(index["header"])
+    for entry in entries:
+        entry["processing"] = entry["position"] in processing
+
+    positions = [entry["position"] for entry in entries]
+    next_cursor = min(positions) if positions and min(positions) > 0 else None
+    return {"entries": entries, "next_cursor": next_cursor}
+
+
+def patch_history_entry(filename, position, new_entry):
+    """
+    Replaces the visit at `position` with `new_entry` and clears its
+    processing flag, leaving every other field of the history untouched.
+    """
+    with history_lock(filename):
+        with open(filename, "r") as f:
+            user_history = json.load(f)
+        user_history["entries"][position] = new_entry
+        processing = user_history.get("processing_entries")
+        if isinstance(processing, dict):
+            processing.pop(str(position), None)
+        write_history_file(user_history, filename)
+
+
 def add_entry_to_history(user_history, new_info):
     user_history["current_call"].extend(new_info)
 
@@ -57,12 +290,24 @@ def update_user_info(user_history, key, value):
     user_history[key] = value
 
 
-def finalize_call(user_history):
+def close_current_call(user_history, outcome=None):
+    """
+    Moves the current call's notes into a dated visit. `outcome` (channel,
+    leaf reached, turns) is kept in "visit_outcomes" under the visit's
+    position, for analytics (see export_history.py).
+    """
     if user_history["current_call"]:
         current_time = datetime.now().strftime("%m/%d/%Y %I:%M%p")
         user_history["entries"].append({current_time: user_history["current_call"]})
         user_history["current_call"] = []  # Clear the current call information
+        if outcome:
+            position = str(len(user_history["entries"]) - 1)
+            user_history.setdefault("visit_outcomes", {})[position] = outcome
+
+
+def finalize_call(user_history):
+    close_current_call(user_history)
 
     return redirect(
-        url_for("medical_record", phone_number=user_history["phone_number"][1:])
+        url_for("main.medical_record", phone_number=user_history["phone_number"][1:])
     )